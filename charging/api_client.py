@@ -1,3 +1,7 @@
+import csv
+import itertools
+from typing import Iterable, Iterator, TextIO
+
 import requests
 import click
 
@@ -5,6 +9,9 @@ import click
 g_host = '[::1]'
 g_port = 8000
 
+# Kept-alive connections are reused by all requests
+g_session = requests.Session()
+
 
 @click.group()
 @click.option('--host', help='The host of the API server', default='[::1]', type=str)
@@ -24,14 +31,83 @@ def _send_reservation_request(serial: str, token_type: str, token_id: str):
     send_reservation_request(serial, token_type, token_id, g_host, g_port)
 
 
-def send_reservation_request(serial: str, token_type: str, token_id: str, host: str = '[::1]', port: int = 8000):
+@cli.command('bulk')
+@click.argument('file', type=click.File('r'))
+@click.option('--chunk-size', help='Number of reservations sent per request', default=5000, type=int)
+def _send_bulk_reservation_requests(file: TextIO, chunk_size: int):
+    sent = send_bulk_reservation_requests(read_reservation_csv(file), chunk_size, g_host, g_port)
+    click.echo(f"Sent {sent} reservations")
+
+
+# Returns the status code of the response: 200 once the reservation is saved (and, with the API of the server, once the
+# charger answered), 202 when the API of the server queued it for a charger that isn't connected to it
+def send_reservation_request(
+    serial: str,
+    token_type: str,
+    token_id: str,
+    host: str = '[::1]',
+    port: int = 8000
+) -> int:
     # Send request
-    response = requests.get(f'http://{host}:{port}/api/reserve_now/{serial}?type={token_type}&id_token={token_id}')
+    response = g_session.get(
+        f'http://{host}:{port}/api/reserve_now/{serial}',
+        params={'type': token_type, 'id_token': token_id}
+    )
 
-    # Check if the request was not successful (status code 200)
-    if response.status_code != 200:
+    # Check if the request was not successful
+    if response.status_code not in (200, 202):
         click.echo(f"Error sending request: {response.status_code}")
 
+    return response.status_code
+
+
+# Reads (serial, token type, token id) rows of a CSV file lazily, skipping the header if there is one. Rows with
+# fewer values are reported and skipped
+def read_reservation_csv(file: TextIO) -> Iterator[tuple[str, str, str]]:
+    reader = csv.reader(file)
+
+    for row in reader:
+        row = [value.strip() for value in row]
+
+        if not any(row) or row[0] == 'serial':
+            continue
+
+        if len(row) < 3:
+            click.echo(f"Skipping line {reader.line_num}: expected serial, token type and token id", err=True)
+            continue
+
+        serial, token_type, token_id = row[:3]
+        yield serial, token_type, token_id
+
+
+# Sends reservations in chunks of chunk_size, each inserted by the server in a single transaction. Returns the number
+# of reservations accepted
+def send_bulk_reservation_requests(
+    reservations: Iterable[tuple[str, str, str]],
+    chunk_size: int = 5000,
+    host: str = '[::1]',
+    port: int = 8000
+) -> int:
+    reservations = iter(reservations)
+    sent = 0
+
+    while chunk := list(itertools.islice(reservations, chunk_size)):
+        response = g_session.post(
+            f'http://{host}:{port}/api/reserve_now',
+            json=[
+                {'serial_number': serial, 'type': token_type, 'id_token': token_id}
+                for serial, token_type, token_id in chunk
+            ]
+        )
+
+        if response.status_code not in (200, 202):
+            click.echo(f"Error sending request: {response.status_code}")
+            break
+
+        sent += len(chunk)
+
+    return sent
+
 
 if __name__ == '__main__':
     cli()
@@ -2,14 +2,15 @@ import json
 from typing import Any
 
 from flask import Flask, jsonify, request
-from db import add_event
+from db import add_event, add_events
+from reservation_api import parse_reservations
 
 
 app = Flask(__name__)
 
 
-def _get_message(message: Any, code: int = 200):
-    return jsonify({'message': message, 'code': code}), code
+def _get_message(message: Any, code: int = 200, **extra):
+    return jsonify({'message': message, 'code': code, **extra}), code
 
 
 @app.route('/api/reserve_now/<serial_number>', methods=['GET', 'PUT', 'POST'])
@@ -30,6 +31,20 @@ def reserve_now(serial_number: str):
     return _get_message('OK')
 
 
+@app.route('/api/reserve_now', methods=['POST'])
+def reserve_now_bulk():
+    # Get all reservations from the body
+    reservations = parse_reservations(request.get_data())
+
+    if reservations is None:
+        return _get_message('Bad request', 400)
+
+    # Add all events to DB in a single transaction
+    ids = add_events('reserve_now', reservations)
+
+    return _get_message('OK', count=len(ids))
+
+
 '''
 @app.get('/api/get/<serial_number>')
 def test_get(serial_number: str):
@@ -0,0 +1,255 @@
+import csv
+import mmap
+import re
+import struct
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, List
+
+import click
+
+
+# Token types known by the server, with the accepted lengths of the token (as hex string). None means any length,
+# an empty tuple means that the type is never accepted in this implementation
+TOKEN_TYPE_LENGTHS = {
+    'Central': None,
+    'eMAID': (),
+    'ISO14443': (8, 14),  # 4 or 7 bytes
+    'ISO15693': (16,),  # 8 bytes
+}
+
+_HEX_REGEX = re.compile(r'[0-9a-fA-F]+')
+
+# Binary token file: header followed by an open addressing hash table of fixed size records
+TOKEN_FILE_MAGIC = b'OCPPTOK1'
+TOKEN_FILE_HEADER = struct.Struct('<8sQQ')  # magic, number of slots, number of tokens
+TOKEN_RECORD = struct.Struct('<BB36s')  # type code (0 for empty slots), token length, token
+TOKEN_TYPE_CODES = {token_type: code for code, token_type in enumerate(TOKEN_TYPE_LENGTHS, start=1)}
+
+
+# Returns the status of a token based only on its format: None if valid, otherwise 'Unknown' or 'Invalid'
+def get_token_format_error(token_type: str, id_token: str) -> Optional[str]:
+    # Check if type is correct
+    if token_type not in TOKEN_TYPE_LENGTHS:
+        return 'Unknown'
+
+    # Check if token is hexadecimal
+    if not _HEX_REGEX.fullmatch(id_token):
+        return 'Unknown'
+
+    # Check if it respects the specs of the type
+    lengths = TOKEN_TYPE_LENGTHS[token_type]
+    if lengths is not None and len(id_token) not in lengths:
+        return 'Invalid'
+
+    return None
+
+
+def _hash_token(type_code: int, id_token: bytes) -> int:
+    return zlib.crc32(id_token, type_code)
+
+
+# Memory-mapped, read only hash table of tokens, built with write_token_file
+class TokenFile:
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self._slots, self._count = TOKEN_FILE_HEADER.unpack_from(self._map)
+
+        if magic != TOKEN_FILE_MAGIC:
+            raise ValueError(f'{path} is not a token file')
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        token_type, id_token = key
+
+        type_code = TOKEN_TYPE_CODES.get(token_type)
+        if type_code is None:
+            return False
+
+        token = id_token.encode()
+        slot = _hash_token(type_code, token) % self._slots
+
+        # Linear probing until the token or an empty slot is found
+        for _ in range(self._slots):
+            record_type, length, record_token = TOKEN_RECORD.unpack_from(
+                self._map, TOKEN_FILE_HEADER.size + slot * TOKEN_RECORD.size
+            )
+
+            if record_type == 0:
+                return False
+
+            if record_type == type_code and record_token[:length] == token:
+                return True
+
+            slot = (slot + 1) % self._slots
+
+        return False
+
+    def close(self):
+        self._map.close()
+
+
+def write_token_file(path: str, tokens: Iterable[tuple[str, str]]):
+    records = []
+
+    for token_type, id_token in tokens:
+        if get_token_format_error(token_type, id_token) is not None:
+            raise ValueError(f'Token {id_token} of type {token_type} is not valid')
+
+        # Tokens are at most 36 characters long in OCPP 2.0.1
+        if len(id_token) > 36:
+            raise ValueError(f'Token {id_token} is too long')
+
+        records.append((TOKEN_TYPE_CODES[token_type], id_token.encode()))
+
+    # Keep the table at most half full, so that lookups need very few probes
+    slots = max(2 * len(records), 1)
+    table = bytearray(TOKEN_FILE_HEADER.size + slots * TOKEN_RECORD.size)
+    count = 0
+
+    for type_code, token in records:
+        slot = _hash_token(type_code, token) % slots
+
+        while True:
+            offset = TOKEN_FILE_HEADER.size + slot * TOKEN_RECORD.size
+            record_type, length, record_token = TOKEN_RECORD.unpack_from(table, offset)
+
+            # Skip duplicates
+            if record_type == type_code and record_token[:length] == token:
+                break
+
+            if record_type == 0:
+                TOKEN_RECORD.pack_into(table, offset, type_code, len(token), token)
+                count += 1
+                break
+
+            slot = (slot + 1) % slots
+
+    TOKEN_FILE_HEADER.pack_into(table, 0, TOKEN_FILE_MAGIC, slots, count)
+
+    with open(path, 'wb') as file:
+        file.write(table)
+
+
+def read_token_csv(path: str) -> Iterable[tuple[str, str]]:
+    with open(path, 'r', newline='') as file:
+        for row in csv.reader(file):
+            row = [value.strip() for value in row]
+
+            # Skip empty or short lines and header
+            if len(row) < 2 or row[0] not in TOKEN_TYPE_LENGTHS:
+                continue
+
+            yield row[0], row[1]
+
+
+# Hashed index of accepted tokens by (type, id_token)
+class TokenIndex:
+
+    def __init__(self):
+        self._tokens: set[tuple[str, str]] = set()
+        self._files: list[TokenFile] = []
+
+    def __len__(self) -> int:
+        return len(self._tokens) + sum(len(i) for i in self._files)
+
+    def add(self, token_type: str, id_token: str):
+        # Tokens that can never be accepted are not stored, so that a match in the index is enough to accept one
+        if get_token_format_error(token_type, id_token) is None:
+            self._tokens.add((token_type, id_token))
+
+    def add_all(self, tokens: Iterable[Dict[str, str]]):
+        for i in tokens:
+            self.add(i['type'], i['id_token'])
+
+    def load_file(self, path: str):
+        # Binary files are mapped in memory, CSV files are loaded into the index
+        if path.endswith('.csv'):
+            for token_type, id_token in read_token_csv(path):
+                self.add(token_type, id_token)
+        else:
+            self._files.append(TokenFile(path))
+
+    def check(self, id_token: Dict) -> str:
+        key = (id_token['type'], id_token['id_token'])
+
+        # Accepted tokens only cost a lookup
+        if key in self._tokens or any(key in i for i in self._files):
+            return 'Accepted'
+
+        # Otherwise, find out why the token is not accepted
+        return get_token_format_error(*key) or 'Invalid'
+
+
+# Accepted chargers grouped by (vendor_name, model), with serial number regexes compiled when loaded
+class ChargerMatcher:
+
+    def __init__(self, cache_size: int = 0):
+        self._rules: Dict[tuple[str, str], List[re.Pattern]] = {}
+
+        # Results by serial number, oldest entries are evicted when full (disabled if 0)
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple[str, str, str], bool] = OrderedDict()
+
+    def __len__(self) -> int:
+        return sum(len(i) for i in self._rules.values())
+
+    def add(self, vendor_name: str, model: str, serial_number_regex: str):
+        self._rules.setdefault((vendor_name, model), []).append(re.compile(serial_number_regex))
+        self._cache.clear()
+
+    def add_all(self, chargers: Iterable[Dict[str, str]]):
+        for i in chargers:
+            self.add(i['vendor_name'], i['model'], i['serial_number_regex'])
+
+    def _match(self, vendor_name: str, model: str, serial_number: str) -> bool:
+        for i in self._rules.get((vendor_name, model), ()):
+            if i.match(serial_number):
+                return True
+
+        return False
+
+    def check(self, vendor_name: str, model: str, serial_number: str) -> bool:
+        if self.cache_size <= 0:
+            return self._match(vendor_name, model, serial_number)
+
+        key = (vendor_name, model, serial_number)
+
+        # Check cache first
+        result = self._cache.get(key)
+        if result is not None:
+            self._cache.move_to_end(key)
+            return result
+
+        result = self._match(vendor_name, model, serial_number)
+
+        # Add to cache, evicting the least recently used result if needed
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return result
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command('convert')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.argument('output_path', type=click.Path(dir_okay=False))
+def _convert(csv_path: str, output_path: str):
+    # Convert a CSV allow-list (type,id_token) to a binary token file
+    write_token_file(output_path, read_token_csv(csv_path))
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,150 @@
+import atexit
+import itertools
+import struct
+from typing import Iterator, Optional
+
+from clock import default_clock
+
+
+# Captures are append-only files of OCPP frames exchanged with chargers, recorded by the server or by clients. A file
+# starts with MAGIC and the side that recorded it, followed by records made of a fixed header (kind, session,
+# timestamp on the process clock, length of the data) and the data:
+#   OPEN      a session starts, the data is the id of the charger
+#   CLOSE     the session ends, no data
+#   INBOUND   frame sent by the charger to the server
+#   OUTBOUND  frame sent by the server to the charger
+# Directions are from the point of view of the server whatever the side, so captures of both sides replay the same way
+MAGIC = b'OCPPCAP1'
+
+SIDE_SERVER = b'S'
+SIDE_CLIENT = b'C'
+
+OPEN = 0
+CLOSE = 1
+INBOUND = 2
+OUTBOUND = 3
+
+_RECORD = struct.Struct('<BIdI')
+
+
+class CaptureWriter:
+
+    # Records are buffered and written once buffer_size bytes are waiting, when a session is closed, on flush (called
+    # periodically by the server) and when the writer is closed or the process exits
+    def __init__(self, path: str, side: bytes, buffer_size: int = 1 << 16):
+        self.path = path
+        self.buffer_size = buffer_size
+
+        self._file = open(path, 'ab')
+        self._buffer = bytearray()
+        self._sessions = itertools.count()
+
+        # Every writer appends its own header, so that captures can be concatenated
+        self._buffer += MAGIC + side
+
+        atexit.register(self.close)
+
+    def _append(self, kind: int, session: int, data: bytes = b''):
+        self._buffer += _RECORD.pack(kind, session, default_clock.time(), len(data))
+        self._buffer += data
+
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    # Returns the number of the new session
+    def open_session(self, charger_id: str) -> int:
+        session = next(self._sessions)
+        self._append(OPEN, session, charger_id.encode())
+
+        return session
+
+    def close_session(self, session: int):
+        self._append(CLOSE, session)
+        self.flush()
+
+    def record(self, session: int, kind: int, frame: str):
+        self._append(kind, session, frame.encode())
+
+    # Records of sessions still open after the writer is closed are dropped
+    def flush(self):
+        if self._buffer and not self._file.closed:
+            self._file.write(self._buffer)
+            self._file.flush()
+            self._buffer.clear()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+# Yields (kind, session, timestamp, data) for all records of a capture. Sessions of every header found in the file are
+# numbered after those of the previous ones, so that sessions of concatenated captures stay apart
+def read_capture(path: str) -> Iterator[tuple[int, int, float, bytes]]:
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    header_size = len(MAGIC) + 1
+    offset = 0
+    base = 0
+    last = -1
+
+    while offset < len(data):
+        if data.startswith(MAGIC, offset):
+            base = last + 1
+            offset += header_size
+            continue
+
+        # A record cut short by a crash ends the capture
+        if offset + _RECORD.size > len(data):
+            break
+
+        kind, session, timestamp, length = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+
+        if offset + length > len(data):
+            break
+
+        last = max(last, base + session)
+        yield kind, base + session, timestamp, data[offset:offset + length]
+
+        offset += length
+
+
+# Session of a charger as found in a capture: when it was opened and closed, and the frames sent by the charger
+class CapturedSession:
+    __slots__ = ('charger_id', 'opened', 'closed', 'frames')
+
+    def __init__(self, charger_id: str, opened: float):
+        self.charger_id = charger_id
+        self.opened = opened
+        self.closed: Optional[float] = None
+        self.frames: list[tuple[float, str]] = []
+
+
+# Returns the sessions of a capture in order of opening, keeping only every count-th one from index (to split them
+# between workers), and the time of the first record
+def load_sessions(path: str, index: int = 0, count: int = 1) -> tuple[list[CapturedSession], float]:
+    sessions: dict[int, CapturedSession] = {}
+    start: Optional[float] = None
+
+    for kind, session, timestamp, data in read_capture(path):
+        if start is None:
+            start = timestamp
+
+        if kind == OPEN:
+            if session % count == index:
+                sessions[session] = CapturedSession(data.decode(), timestamp)
+            continue
+
+        captured = sessions.get(session)
+
+        if captured is None:
+            continue
+
+        if kind == INBOUND:
+            captured.frames.append((timestamp, data.decode()))
+        elif kind == CLOSE:
+            captured.closed = timestamp
+
+    return sorted(sessions.values(), key=lambda i: i.opened), start or 0.0
@@ -1,24 +1,45 @@
 import asyncio
 import logging
+import os
 import sys
-from datetime import datetime
+import time
 from typing import Optional, Callable, Awaitable, Dict, Any
 
-import aioconsole
 import websockets
 from ocpp.routing import on, after
 from ocpp.v201 import ChargePoint as Cp, call, call_result
 from websockets import Subprotocol
 
+from capture import CaptureWriter, SIDE_CLIENT, INBOUND, OUTBOUND
+from clock import default_clock
+from histogram import LatencyRecorder
+from scheduler import default_wheel
+
 logging.basicConfig(level=logging.ERROR)
 
+# Frames of all clients in this process are recorded when OCPP_CAPTURE is set to the path of the capture. The path may
+# contain {pid}, so that every process (e.g. of the load generator) writes its own file
+CAPTURE_VARIABLE = 'OCPP_CAPTURE'
+
+capture = (
+    CaptureWriter(os.environ[CAPTURE_VARIABLE].format(pid=os.getpid()), SIDE_CLIENT)
+    if CAPTURE_VARIABLE in os.environ else None
+)
+
 
 def _get_current_time() -> str:
-    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S") + "Z"
+    return default_clock.timestamp()
 
 
 class ChargePointClient(Cp):
 
+    # Status of the last boot notification and time taken to open the websocket (set by launch_client)
+    boot_status: Optional[str] = None
+    connect_latency: Optional[float] = None
+
+    # Round-trip time of the calls of all clients in this process, by action
+    latencies = LatencyRecorder()
+
     def __init__(self, id, connection, printed_name: Optional[str] = None):
         super().__init__(id, connection)
         if printed_name is not None:
@@ -26,20 +47,64 @@ class ChargePointClient(Cp):
         else:
             self.printed_name = str(self.id)
 
+        # Session in the capture file, when frames are recorded
+        self.capture_session: Optional[int] = None
+        if capture is not None:
+            self.capture_session = capture.open_session(str(self.id))
+
+    # Frames are recorded with directions from the point of view of the server, as in captures made by the server
+    async def route_message(self, raw_msg):
+        if capture is not None:
+            capture.record(self.capture_session, OUTBOUND, raw_msg)
+
+        return await super().route_message(raw_msg)
+
+    async def _send(self, message):
+        if capture is not None:
+            capture.record(self.capture_session, INBOUND, message)
+
+        return await super()._send(message)
+
     def print_message(self, message: str):
         print(f'[{self.printed_name}] {message}')
 
+    async def call(self, payload, *args, **kwargs):
+        action = type(payload).__name__.removesuffix('Payload')
+        start = time.perf_counter()
+
+        try:
+            response = await super().call(payload, *args, **kwargs)
+        except Exception:
+            self.latencies.record_error(action)
+            raise
+
+        self.latencies.record(action, time.perf_counter() - start)
+
+        return response
+
     async def send_heartbeat(
         self,
         interval: int = 10
     ):
         request = call.HeartbeatPayload()
 
-        while True:
-            # Send heartbeat
-            await self.call(request)
-            # Wait for interval
-            await asyncio.sleep(interval)
+        # Completed only if a heartbeat fails
+        failed = asyncio.get_running_loop().create_future()
+
+        async def heartbeat():
+            try:
+                await self.call(request)
+            except Exception as e:
+                if not failed.done():
+                    failed.set_exception(e)
+
+        # Heartbeats of all clients are sent by the shared timer wheel
+        handle = default_wheel.schedule_periodic(interval, heartbeat)
+
+        try:
+            await failed
+        finally:
+            handle.cancel()
 
     async def send_authorize(
         self,
@@ -108,6 +173,31 @@ class ChargePointClient(Cp):
             trigger_reason='ChargingStateChanged',
         ))
 
+    # Sends the energy register (in Wh), as chargers do periodically while charging
+    async def send_transaction_event_meter_values(
+        self,
+        event_type: str,
+        transaction_id: str,
+        seq_no: int,
+        energy: float
+    ):
+        timestamp = _get_current_time()
+
+        return await self.call(call.TransactionEventPayload(
+            timestamp=timestamp,
+            event_type=event_type,
+            seq_no=seq_no,
+            transaction_info={'transactionId': transaction_id},
+            meter_value=[{
+                'timestamp': timestamp,
+                'sampledValue': [
+                    {'value': energy, 'measurand': 'Energy.Active.Import.Register', 'unitOfMeasure': {'unit': 'Wh'}}
+                ]
+            }],
+
+            trigger_reason='MeterValuePeriodic',
+        ))
+
     async def send_boot_notification(
         self,
         serial_number: str,
@@ -121,6 +211,7 @@ class ChargePointClient(Cp):
             reason="PowerUp",
         )
         response = await self.call(request)
+        self.boot_status = response.status
 
         # Check if boot notification is accepted
         if response.status != "Accepted":
@@ -130,14 +221,18 @@ class ChargePointClient(Cp):
         # Schedule heartbeat to be run in background
         heartbeat_task = asyncio.create_task(self.send_heartbeat(response.interval))
 
-        # Run "runnable" function (if available) to implement a specific scenario
-        if async_runnable is not None:
-            await async_runnable(self)
-        else:
-            self.print_message("Connected to server")
-
-        # Await for heartbeat task to end (never)
-        await heartbeat_task
+        try:
+            # Run "runnable" function (if available) to implement a specific scenario
+            if async_runnable is not None:
+                await async_runnable(self)
+            else:
+                self.print_message("Connected to server")
+
+            # Await for heartbeat task to end (never)
+            await heartbeat_task
+        finally:
+            # Cancels the heartbeat timer too, also when the runnable raised
+            heartbeat_task.cancel()
 
     @on('ReserveNow')
     def on_reserve_now(
@@ -165,29 +260,42 @@ async def launch_client(
     server: str = "[::1]",
     port: int = 9000,
     async_runnable: Optional[Callable[[ChargePointClient], Awaitable[None]]] = None,
-    printed_name: Optional[str] = None
-):
+    printed_name: Optional[str] = None,
+    **connect_kwargs
+) -> ChargePointClient:
+    start = time.perf_counter()
+
     # Open websocket
     async with websockets.connect(
-            f"ws://{server}:{port}/{serial_number}", subprotocols=[Subprotocol("ocpp2.0.1")]
+            f"ws://{server}:{port}/{serial_number}", subprotocols=[Subprotocol("ocpp2.0.1")], **connect_kwargs
     ) as ws:
 
         # Initialize CP
         cp = ChargePointClient(serial_number, ws, printed_name)
+        cp.connect_latency = time.perf_counter() - start
 
         # Start it
+        tasks = [
+            asyncio.ensure_future(cp.start()),
+            asyncio.ensure_future(cp.send_boot_notification(serial_number, model, vendor_name, async_runnable))
+        ]
+
         try:
-            await asyncio.gather(
-                cp.start(),
-                cp.send_boot_notification(
-                    serial_number,
-                    model,
-                    vendor_name,
-                    async_runnable
-                )
-            )
+            await asyncio.gather(*tasks)
         except websockets.exceptions.ConnectionClosed:
             print(f"[{serial_number}] Connection was forcefully closed by the server")
+        finally:
+            # Either may end the session by raising (the runnable too), the other one is stopped before the connection
+            # is closed
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            if capture is not None:
+                capture.close_session(cp.capture_session)
+
+    return cp
 
 
 def get_host_and_port() -> dict[str, str]:
@@ -198,6 +306,9 @@ def get_host_and_port() -> dict[str, str]:
 
 # Prints the given message and awaits for a button press, in an asynchronous way
 async def wait_for_button_press(message: str):
+    # Only interactive scenarios need it, headless runs don't have to load it
+    import aioconsole
+
     await aioconsole.ainput(f'\n{message} | Press any key to continue...\n')
 
 
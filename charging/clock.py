@@ -0,0 +1,155 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+
+# Clocks give the current time and sleep in virtual seconds, so that simulations can run faster than real time. The
+# clock of a process is chosen through the OCPP_CLOCK environment variable:
+#   wall                              real time (default)
+#   scaled:<speed>                    real time sped up by speed (e.g. scaled:100)
+#   step:<seconds>[:<real seconds>]   time only moves by steps of seconds, one every real seconds (0 by default), from
+#                                     a fixed date, so that runs are reproducible
+CLOCK_VARIABLE = 'OCPP_CLOCK'
+
+# Start of step clocks: 2024-01-01T00:00:00Z
+STEP_CLOCK_START = 1704067200.0
+
+
+class WallClock:
+
+    # Virtual seconds per real second
+    speed = 1.0
+
+    # Seconds since the epoch
+    def time(self) -> float:
+        return time.time()
+
+    # Seconds from an arbitrary point, never going back
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.time(), timezone.utc)
+
+    # Current time as used in OCPP messages
+    def timestamp(self) -> str:
+        return self.now().strftime("%Y-%m-%dT%H:%M:%S") + "Z"
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+
+class ScaledClock(WallClock):
+
+    def __init__(self, speed: float, start: Optional[float] = None):
+        self.speed = speed
+
+        self._real_start = time.monotonic()
+        self._start = time.time() if start is None else start
+
+    def _elapsed(self) -> float:
+        return (time.monotonic() - self._real_start) * self.speed
+
+    def time(self) -> float:
+        return self._start + self._elapsed()
+
+    def monotonic(self) -> float:
+        return self._real_start + self._elapsed()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds / self.speed)
+
+
+# Time only moves when advanced, sleepers are woken in order of deadline. Unless driven by hand with advance, a
+# background task advances it by step every interval real seconds
+class StepClock(WallClock):
+
+    def __init__(self, step: float = 1, interval: float = 0, start: float = STEP_CLOCK_START, auto: bool = True):
+        self.step = step
+        self.interval = interval
+        self.auto = auto
+
+        self._start = start
+        self._elapsed = 0.0
+
+        # Sleepers by deadline, the counter keeps the order of sleepers with the same deadline
+        self._sleepers: list[tuple[float, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+        self._driver: Optional[asyncio.Task] = None
+
+    def time(self) -> float:
+        return self._start + self._elapsed
+
+    def monotonic(self) -> float:
+        return self._elapsed
+
+    async def sleep(self, seconds: float):
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self._elapsed + seconds, next(self._counter), future))
+
+        # Start advancing on first use
+        if self.auto and (self._driver is None or self._driver.done()):
+            self._driver = asyncio.create_task(self.run())
+
+        await future
+
+    # Moves time to the earliest deadline and wakes its sleepers
+    def _wake_next(self):
+        deadline = self._sleepers[0][0]
+        self._elapsed = max(self._elapsed, deadline)
+
+        while self._sleepers and self._sleepers[0][0] == deadline:
+            future = heapq.heappop(self._sleepers)[2]
+
+            if not future.done():
+                future.set_result(None)
+
+    # Moves time forward by seconds, waking all sleepers due in the meantime
+    def advance(self, seconds: float):
+        target = self._elapsed + seconds
+
+        while self._sleepers and self._sleepers[0][0] <= target:
+            self._wake_next()
+
+        self._elapsed = target
+
+    async def run(self):
+        while self._sleepers:
+            await asyncio.sleep(self.interval)
+            target = self._elapsed + self.step
+
+            # Sleepers run before time moves to the next deadline, so that they see their own deadline as current time
+            while self._sleepers and self._sleepers[0][0] <= target:
+                self._wake_next()
+                await asyncio.sleep(0)
+
+            self._elapsed = max(self._elapsed, target)
+
+
+def get_clock(spec: str) -> WallClock:
+    kind, _, args = spec.partition(':')
+    values = [float(i) for i in args.split(':') if i]
+
+    if kind == 'wall':
+        return WallClock()
+
+    if kind == 'scaled':
+        return ScaledClock(*values)
+
+    if kind == 'step':
+        return StepClock(*values)
+
+    raise ValueError(f"Unknown clock {spec}, must be wall, scaled:<speed> or step:<seconds>[:<real seconds>]")
+
+
+# Clock shared by everything running in this process
+default_clock = get_clock(os.environ.get(CLOCK_VARIABLE, 'wall'))
@@ -0,0 +1,202 @@
+import json
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+from clock import default_clock
+
+# orjson is used when available, it's several times faster than json for small messages
+try:
+    import orjson
+
+    def loads(data: str | bytes) -> Any:
+        return orjson.loads(data)
+
+    def dumps(value: Any) -> str:
+        return orjson.dumps(value).decode()
+
+except ImportError:
+    loads = json.loads
+
+    def dumps(value: Any) -> str:
+        return json.dumps(value, separators=(',', ':'))
+
+
+# Schemas are given as {key: (required, kind)}, where kind is a type (str, int, float for any number, bool, dict for
+# any object), a tuple of allowed strings, a nested schema, or a list holding the kind of its items. Like the OCPP
+# schemas, unknown keys are not allowed
+Schema = dict[str, tuple[bool, Any]]
+
+
+def _compile_kind(kind: Any) -> Callable[[Any], bool]:
+    if isinstance(kind, tuple):
+        values = frozenset(kind)
+        return lambda value: type(value) is str and value in values
+
+    if isinstance(kind, dict):
+        return compile_schema(kind)
+
+    if isinstance(kind, list):
+        check_item = _compile_kind(kind[0])
+        return lambda value: type(value) is list and len(value) > 0 and all(check_item(item) for item in value)
+
+    if kind is float:
+        return lambda value: type(value) in (int, float)
+
+    return lambda value: type(value) is kind
+
+
+# Turns a schema into a function checking whether a value matches it, done once so that checks only run closures
+def compile_schema(schema: Schema) -> Callable[[Any], bool]:
+    required = frozenset(key for key, (is_required, _) in schema.items() if is_required)
+    allowed = frozenset(schema)
+    checks = tuple((key, _compile_kind(kind)) for key, (_, kind) in schema.items())
+
+    def check(value: Any) -> bool:
+        if type(value) is not dict:
+            return False
+
+        keys = value.keys()
+        if not required <= keys or not keys <= allowed:
+            return False
+
+        for key, check_value in checks:
+            if key in value and not check_value(value[key]):
+                return False
+
+        return True
+
+    return check
+
+
+# Payloads of the calls handled by the fast path (OCPP 2.0.1). Enumerations too long to be worth listing are only
+# checked to be strings
+CUSTOM_DATA = (False, dict)
+
+HEARTBEAT: Schema = {
+    'customData': CUSTOM_DATA,
+}
+
+STATUS_NOTIFICATION: Schema = {
+    'timestamp': (True, str),
+    'connectorStatus': (True, ('Available', 'Occupied', 'Reserved', 'Unavailable', 'Faulted')),
+    'evseId': (True, int),
+    'connectorId': (True, int),
+    'customData': CUSTOM_DATA,
+}
+
+SAMPLED_VALUE: Schema = {
+    'value': (True, float),
+    'context': (False, str),
+    'measurand': (False, str),
+    'phase': (False, str),
+    'location': (False, str),
+    'signedMeterValue': (False, dict),
+    'unitOfMeasure': (False, dict),
+    'customData': CUSTOM_DATA,
+}
+
+TRANSACTION_EVENT: Schema = {
+    'eventType': (True, ('Ended', 'Started', 'Updated')),
+    'timestamp': (True, str),
+    'triggerReason': (True, (
+        'Authorized', 'CablePluggedIn', 'ChargingRateChanged', 'ChargingStateChanged', 'Deauthorized',
+        'EnergyLimitReached', 'EVCommunicationLost', 'EVConnectTimeout', 'MeterValueClock', 'MeterValuePeriodic',
+        'TimeLimitReached', 'Trigger', 'UnlockCommand', 'StopAuthorized', 'EVDeparted', 'EVDetected', 'RemoteStop',
+        'RemoteStart', 'AbnormalCondition', 'SignedDataReceived', 'ResetCommand'
+    )),
+    'seqNo': (True, int),
+    'transactionInfo': (True, {
+        'transactionId': (True, str),
+        'chargingState': (False, ('Charging', 'EVConnected', 'SuspendedEV', 'SuspendedEVSE', 'Idle')),
+        'timeSpentCharging': (False, int),
+        'stoppedReason': (False, str),
+        'remoteStartId': (False, int),
+        'customData': CUSTOM_DATA,
+    }),
+    'meterValue': (False, [{
+        'timestamp': (True, str),
+        'sampledValue': (True, [SAMPLED_VALUE]),
+        'customData': CUSTOM_DATA,
+    }]),
+    'offline': (False, bool),
+    'numberOfPhasesUsed': (False, int),
+    'cableMaxCurrent': (False, int),
+    'reservationId': (False, int),
+    'evse': (False, {
+        'id': (True, int),
+        'connectorId': (False, int),
+        'customData': CUSTOM_DATA,
+    }),
+    'idToken': (False, dict),
+    'customData': CUSTOM_DATA,
+}
+
+
+# Body of the Heartbeat response, formatted again only when the second changes
+_current_time_second = 0
+_current_time_body = ''
+
+
+def current_time_body() -> str:
+    global _current_time_second
+    global _current_time_body
+
+    second = int(default_clock.time())
+
+    if second != _current_time_second:
+        now = datetime.fromtimestamp(second, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        _current_time_second = second
+        _current_time_body = f'{{"currentTime":"{now}"}}'
+
+    return _current_time_body
+
+
+# Handler of the fast path: takes the session and the payload (in camelCase, as received) and returns the body of the
+# response already serialized, or None to leave the call to the library
+FastHandler = Callable[[Any, dict], Optional[str]]
+
+
+# Handles frequent calls without the ocpp library: the message is parsed once, the payload is checked against a
+# precompiled schema and the response is built from preformatted bodies. Anything unexpected (unknown action, payload
+# not matching, handler declining) falls back to the library, which also takes care of reporting errors
+class FastCodec:
+
+    def __init__(self):
+        self._handlers: dict[str, tuple[Callable[[Any], bool], FastHandler]] = {}
+
+    def register(self, action: str, schema: Schema):
+        check = compile_schema(schema)
+
+        def decorator(handler: FastHandler) -> FastHandler:
+            self._handlers[action] = (check, handler)
+            return handler
+
+        return decorator
+
+    # Returns the action and the serialized CallResult, or None if the message must go through the library
+    def handle(self, session: Any, raw_msg: str) -> Optional[tuple[str, str]]:
+        try:
+            message = loads(raw_msg)
+        except ValueError:
+            return None
+
+        if type(message) is not list or len(message) != 4 or message[0] != 2:
+            return None
+
+        _, unique_id, action, payload = message
+        entry = self._handlers.get(action)
+
+        if entry is None or type(unique_id) is not str:
+            return None
+
+        check, handler = entry
+
+        if not check(payload):
+            return None
+
+        body = handler(session, payload)
+
+        if body is None:
+            return None
+
+        return action, f'[3,{dumps(unique_id)},{body}]'
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+import click
+
+import server
+from histogram import LatencyHistogram
+from transactions import TransactionStore
+
+
+# Messages sent by chargers, as they arrive on the websocket
+MESSAGES = {
+    'Heartbeat': {},
+    'StatusNotification': {
+        'timestamp': '2024-01-01T00:00:00Z',
+        'connectorStatus': 'Occupied',
+        'evseId': 1,
+        'connectorId': 1,
+    },
+    'TransactionEvent': {
+        'eventType': 'Updated',
+        'timestamp': '2024-01-01T00:00:00Z',
+        'triggerReason': 'MeterValuePeriodic',
+        'seqNo': 1,
+        'transactionInfo': {'transactionId': 'd5ac5d4e-0a9e-4a36-8a58-4c4f2b0e2b4a', 'chargingState': 'Charging'},
+        'meterValue': [{
+            'timestamp': '2024-01-01T00:00:00Z',
+            'sampledValue': [
+                {'value': 1234.5, 'measurand': 'Energy.Active.Import.Register'},
+                {'value': 7.2, 'measurand': 'Power.Active.Import'},
+            ],
+        }],
+    },
+}
+
+
+# Connection discarding what is sent, so that only handling is measured
+class NullConnection:
+
+    async def send(self, message: str):
+        pass
+
+    async def recv(self) -> str:
+        await asyncio.Future()
+
+    async def close(self):
+        pass
+
+
+async def _measure(action: str, messages: int, fast: bool) -> dict:
+    server.FAST_CODEC_ENABLED = fast
+
+    cp = server.ChargePointServer('E2507-BENCH-0001', NullConnection())
+    histogram = LatencyHistogram()
+
+    raw_messages = [json.dumps([2, str(i), action, MESSAGES[action]]) for i in range(messages)]
+
+    start = time.perf_counter()
+
+    for raw_msg in raw_messages:
+        message_start = time.perf_counter()
+        await cp.route_message(raw_msg)
+        histogram.record(time.perf_counter() - message_start)
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        'messages_per_second': round(messages / elapsed),
+        'latency': histogram.summary(),
+    }
+
+
+@click.command()
+@click.option('--action', help='Action of the messages (repeatable)', multiple=True, default=tuple(MESSAGES), type=click.Choice(list(MESSAGES)))
+@click.option('--messages', help='Number of messages handled by every path', default=100_000, type=int)
+def cli(action: tuple[str, ...], messages: int):
+    # Handlers log at info level, only the handling itself is measured
+    logging.disable(logging.INFO)
+
+    # Transactions handled by the benchmark go to a throwaway store, never to the one of the server
+    workdir = tempfile.TemporaryDirectory(prefix='codec-bench-')
+    server.transaction_store = TransactionStore(os.path.join(workdir.name, 'transactions.sqlite3'))
+
+    for name in action:
+        library = asyncio.run(_measure(name, messages, fast=False))
+        fast = asyncio.run(_measure(name, messages, fast=True))
+
+        print(json.dumps({
+            'action': name,
+            'library': library,
+            'fast_codec': fast,
+            'speedup': round(fast['messages_per_second'] / library['messages_per_second'], 1),
+        }, indent=2))
+
+
+if __name__ == '__main__':
+    cli()
@@ -1,15 +1,132 @@
 import json
+import logging
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable, Any, Iterable, Optional
 
 
 DATABASE_PATH = 'charging/db.sqlite3'
 
+# Max number of writes grouped in a single transaction
+WRITE_BATCH_SIZE = 500
 
-_db = sqlite3.connect(DATABASE_PATH, check_same_thread=False)
-_db.execute('PRAGMA foreign_keys=ON;')
+# If set, called with the name and duration (in seconds) of every query
+query_observer: Optional[Callable[[str, float], None]] = None
+
+
+def set_query_observer(observer: Optional[Callable[[str, float], None]]):
+    global query_observer
+    query_observer = observer
+
+
+def _observe(query: str, start: float):
+    if query_observer is not None:
+        query_observer(query, time.perf_counter() - start)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # Autocommit mode, transactions are handled explicitly by the writer
+    connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    connection.execute('PRAGMA foreign_keys=ON;')
+    connection.execute('PRAGMA busy_timeout=5000;')
+
+    return connection
+
+
+# Single writer thread: writes from every thread are queued and committed in batched transactions
+class BatchWriter:
+
+    def __init__(self, path: str, batch_size: int = WRITE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+
+        self._queue: queue.Queue[tuple[Callable[[sqlite3.Connection], Any], Future]] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f'BatchWriter({path})', daemon=True)
+        self._thread.start()
+
+    # Queue a job for the writer, the returned future holds its result once committed
+    def submit(self, job: Callable[[sqlite3.Connection], Any]) -> Future:
+        future = Future()
+        self._queue.put((job, future))
+
+        return future
+
+    # Queue a job and wait for it to be committed
+    def execute(self, job: Callable[[sqlite3.Connection], Any]) -> Any:
+        return self.submit(job).result()
+
+    def _run(self):
+        connection = _connect(self.path)
+
+        while True:
+            # Wait for the first job, then take everything else already queued (up to batch size)
+            batch = [self._queue.get()]
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # The thread must outlive any failure, otherwise every later write would wait forever
+            try:
+                self._commit_batch(connection, batch)
+            except Exception as e:
+                logging.exception("Batch writer failed to commit a batch")
+
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    @staticmethod
+    def _commit_batch(connection: sqlite3.Connection, batch: list[tuple[Callable, Future]]):
+        results = []
+
+        try:
+            connection.execute('BEGIN IMMEDIATE;')
+
+            for job, future in batch:
+                # Run every job in its own savepoint, so that a failing one doesn't abort the others
+                connection.execute('SAVEPOINT job;')
+
+                try:
+                    results.append((future, job(connection), None))
+                    connection.execute('RELEASE job;')
+                except Exception as e:
+                    connection.execute('ROLLBACK TO job;')
+                    connection.execute('RELEASE job;')
+                    results.append((future, None, e))
+
+            connection.execute('COMMIT;')
+
+        except Exception as e:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK;')
+
+            # The whole transaction failed
+            for job, future in batch:
+                future.set_exception(e)
+
+            return
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_setup = _connect(DATABASE_PATH)
+
+# WAL journaling lets readers work while the writer is committing
+_setup.execute('PRAGMA journal_mode=WAL;')
 
 # Create DB and schema if it doesn't exist already
-_db.execute("""
+_setup.execute("""
 CREATE TABLE IF NOT EXISTS Events (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     type VARCHAR(255) NOT NULL,
@@ -19,38 +136,238 @@ CREATE TABLE IF NOT EXISTS Events (
 );
 """)
 
+# Add delivery tracking to DBs created before it existed
+_columns = [row[1] for row in _setup.execute('PRAGMA table_info(Events);')]
+
+if 'status' not in _columns:
+    _setup.execute("ALTER TABLE Events ADD COLUMN status VARCHAR(16) NOT NULL DEFAULT 'pending';")
+
+if 'delivered_at' not in _columns:
+    _setup.execute('ALTER TABLE Events ADD COLUMN delivered_at DATETIME;')
+
+# Delivered events moved out of the hot table by compaction
+_setup.execute("""
+CREATE TABLE IF NOT EXISTS EventsArchive (
+    id INTEGER PRIMARY KEY,
+    type VARCHAR(255) NOT NULL,
+    timestamp DATETIME NOT NULL,
+    target VARCHAR(255) NOT NULL,
+    data text NOT NULL,
+    delivered_at DATETIME
+);
+""")
+
+# Outcome of every event for each session it was sent to (sessions are numbered by the process that served them)
+_setup.execute("""
+CREATE TABLE IF NOT EXISTS Deliveries (
+    event_id INTEGER NOT NULL,
+    session INTEGER,
+    status VARCHAR(32) NOT NULL,
+    timestamp DATETIME NOT NULL DEFAULT current_timestamp
+);
+""")
+
+_setup.execute('CREATE INDEX IF NOT EXISTS DeliveriesByEvent ON Deliveries (event_id);')
+
+# Older versions started event ids again at 1 on every start, new events get ids after those already archived
+_archived_max = _setup.execute('SELECT MAX(id) FROM EventsArchive;').fetchone()[0]
+
+if _archived_max is not None:
+    _sequence = _setup.execute("SELECT seq FROM sqlite_sequence WHERE name='Events';").fetchone()
+
+    if _sequence is None:
+        _setup.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('Events', ?);", (_archived_max,))
+    elif _sequence[0] < _archived_max:
+        _setup.execute("UPDATE sqlite_sequence SET seq=? WHERE name='Events';", (_archived_max,))
+
+# Index used by all lookups of pending events by event type and target, delivered and failed events are left out so
+# that it only holds what is still to be sent (it replaces the full EventsByTypeTarget index of older DBs)
+_setup.execute('DROP INDEX IF EXISTS EventsByTypeTarget;')
+_setup.execute(
+    "CREATE INDEX IF NOT EXISTS PendingEventsByTypeTarget ON Events (type, target, id) WHERE status='pending';"
+)
+
+# Index used by compaction to find delivered events
+_setup.execute("CREATE INDEX IF NOT EXISTS EventsDelivered ON Events (delivered_at) WHERE status='delivered';")
+
+_setup.close()
+
+_writer = BatchWriter(DATABASE_PATH)
+
+# Every thread reads from its own connection, so that reads don't serialize behind each other or behind writes
+_readers = threading.local()
+
+
+def _get_reader() -> sqlite3.Connection:
+    connection = getattr(_readers, 'connection', None)
+
+    if connection is None:
+        connection = _connect(DATABASE_PATH)
+        connection.execute('PRAGMA query_only=ON;')
+        _readers.connection = connection
+
+    return connection
+
 
 def purge_events():
-    # Delete all data
-    _db.execute('DELETE FROM Events;')
-    _db.execute("DELETE FROM sqlite_sequence WHERE name='Events';")
-    _db.commit()
+    def job(connection: sqlite3.Connection):
+        # Delete all events that are not archived, along with their outcomes. Ids are not reset, so that archived
+        # events and their outcomes keep ids of their own
+        connection.execute('DELETE FROM Deliveries WHERE event_id IN (SELECT id FROM Events);')
+        connection.execute('DELETE FROM Events;')
+
+    _writer.execute(job)
+
+
+# Marks an event as delivered to its target, along with the (session number, status) outcome of every session it was
+# sent to, without waiting for the write to be committed. Events that could not be delivered are marked as failed
+# instead: they are kept as dead letters, as retention only removes delivered events
+def mark_event_delivered(
+    event_id: int,
+    target: str,
+    outcomes: Iterable[tuple[int, str]] = (),
+    status: str = 'delivered'
+) -> Future:
+    rows = [(event_id, session, session_status) for session, session_status in outcomes]
+
+    def job(connection: sqlite3.Connection):
+        connection.execute(
+            'UPDATE Events SET status=?, delivered_at=current_timestamp WHERE id=? and target=?;',
+            (status, event_id, target)
+        )
+        connection.executemany('INSERT INTO Deliveries (event_id, session, status) VALUES (?, ?, ?);', rows)
+
+    return _writer.submit(job)
+
+
+# Deletes (or archives) up to chunk_size events delivered more than min_age seconds ago (negative ages count as 0),
+# returns how many were removed
+def compact_events(chunk_size: int = 1000, min_age: float = 0, archive: bool = False) -> int:
+    def job(connection: sqlite3.Connection) -> int:
+        ids = [row[0] for row in connection.execute(
+            "SELECT id FROM Events WHERE status='delivered' and delivered_at<=datetime('now', ?) "
+            "ORDER BY delivered_at LIMIT ?;",
+            (f'-{max(min_age, 0)} seconds', chunk_size)
+        )]
+
+        if not ids:
+            return 0
 
+        placeholders = ','.join('?' * len(ids))
+
+        if archive:
+            connection.execute(
+                'INSERT INTO EventsArchive (id, type, timestamp, target, data, delivered_at) '
+                f'SELECT id, type, timestamp, target, data, delivered_at FROM Events WHERE id IN ({placeholders});',
+                ids
+            )
+        else:
+            # Outcomes are kept along with archived events only
+            connection.execute(f'DELETE FROM Deliveries WHERE event_id IN ({placeholders});', ids)
+
+        connection.execute(f'DELETE FROM Events WHERE id IN ({placeholders});', ids)
+
+        return len(ids)
+
+    start = time.perf_counter()
+
+    try:
+        return _writer.execute(job)
+    except sqlite3.Error as e:
+        raise AttributeError(e)
+    finally:
+        _observe('compact_events', start)
+
+
+def get_event_stats() -> dict[str, int]:
+    cursor = _get_reader().cursor()
+    start = time.perf_counter()
+
+    try:
+        # Count events by delivery status
+        stats = {'pending': 0, 'delivered': 0, 'failed': 0}
+        stats.update(cursor.execute('SELECT status, COUNT(*) FROM Events GROUP BY status;').fetchall())
+        stats['total'] = sum(stats.values())
 
-def add_event(event_type: str, target: str = '*', event_data=None):
+        # Size of the DB file, as seen by SQLite
+        page_count = cursor.execute('PRAGMA page_count;').fetchone()[0]
+        page_size = cursor.execute('PRAGMA page_size;').fetchone()[0]
+        stats['size_bytes'] = page_count * page_size
+
+        return stats
+
+    except sqlite3.Error as e:
+        raise AttributeError(e)
+    finally:
+        _observe('get_event_stats', start)
+
+
+def add_event(event_type: str, target: str = '*', event_data=None) -> int:
     if event_data is None:
         event_data = {}
 
-    cursor = _db.cursor()
+    data = json.dumps(event_data)
+
+    def job(connection: sqlite3.Connection) -> int:
+        # Timestamp is saved with milliseconds, to measure how long events wait before being dispatched
+        return connection.execute(
+            "INSERT INTO Events (type, target, data, timestamp) VALUES (?, ?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'));",
+            (event_type, target, data)
+        ).lastrowid
+
+    start = time.perf_counter()
 
     try:
-        cursor.execute(
-            'INSERT INTO Events (type, target, data) VALUES (?, ?, ?);',
-        (event_type, target, json.dumps(event_data))
+        return _writer.execute(job)
+    except sqlite3.Error as e:
+        raise AttributeError(e)
+    finally:
+        _observe('add_event', start)
+
+
+# Adds all (target, event_data) events in a single transaction, returns their ids
+def add_events(event_type: str, events: Iterable[tuple[str, Any]]) -> range:
+    rows = [
+        (event_type, target, json.dumps(event_data if event_data is not None else {}))
+        for target, event_data in events
+    ]
+
+    def job(connection: sqlite3.Connection) -> range:
+        if not rows:
+            return range(0)
+
+        connection.executemany(
+            "INSERT INTO Events (type, target, data, timestamp) VALUES (?, ?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'));",
+            rows
         )
 
-        _db.commit()
+        # Rows written by the single writer in one statement get consecutive ids
+        last_id = connection.execute('SELECT last_insert_rowid();').fetchone()[0]
+        return range(last_id - len(rows) + 1, last_id + 1)
+
+    start = time.perf_counter()
+
+    try:
+        return _writer.execute(job)
     except sqlite3.Error as e:
         raise AttributeError(e)
+    finally:
+        _observe('add_events', start)
 
 
-def get_event(event_type: str, target: str = '*', first_acceptable_id: int = 1) -> tuple[int, dict[str, str]] | None:
-    cursor = _db.cursor()
+def get_event(
+    event_type: str,
+    target: str = '*',
+    first_acceptable_id: int = 1
+) -> tuple[int, dict[str, str], datetime] | None:
+    cursor = _get_reader().cursor()
+    start = time.perf_counter()
 
     try:
-        # Get first un-executed event by event_type and target
+        # Get first pending event by event_type and target, delivered and failed ones are never sent again
         raw_data = cursor.execute(
-            'SELECT id, data FROM Events WHERE type=? and target=? and id>=? ORDER BY id LIMIT 1;',
+            "SELECT id, data, timestamp FROM Events WHERE type=? and target=? and id>=? and status='pending' "
+            "ORDER BY id LIMIT 1;",
             (event_type, target, first_acceptable_id)
         ).fetchone()
 
@@ -58,8 +375,27 @@ def get_event(event_type: str, target: str = '*', first_acceptable_id: int = 1)
         if raw_data is None:
             return None
 
-        # Parse json and return it
-        return int(raw_data[0]), json.loads(raw_data[1])
+        # Parse json and return it, together with the time the event was added (UTC)
+        return int(raw_data[0]), json.loads(raw_data[1]), datetime.fromisoformat(raw_data[2])
+
+    except sqlite3.Error as e:
+        raise AttributeError(e)
+    finally:
+        _observe('get_event', start)
+
+
+def get_new_events(event_type: str, last_seen_id: int = 0, limit: int = 1000) -> list[tuple[int, str]]:
+    cursor = _get_reader().cursor()
+    start = time.perf_counter()
+
+    try:
+        # Get id and target of all events of event_type newer than last_seen_id
+        return cursor.execute(
+            'SELECT id, target FROM Events WHERE type=? and id>? ORDER BY id LIMIT ?;',
+            (event_type, last_seen_id, limit)
+        ).fetchall()
 
     except sqlite3.Error as e:
         raise AttributeError(e)
+    finally:
+        _observe('get_new_events', start)
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from db import get_event, get_new_events, mark_event_delivered
+from registry import ConnectionRegistry
+
+
+# Which of the sessions sharing an id receive its reservations
+DELIVERY_POLICIES = ('newest', 'oldest', 'all')
+
+# Number of delivered events whose outcomes are kept, for callers waiting on them
+RESULTS_SIZE = 1024
+
+
+# Single shared poller for reservation events: instead of having every connected charger query the DB on its own,
+# one task reads the rows added since the last poll (by id) and wakes only the chargers they are addressed to.
+# Every target id then has a single delivery task, which reads its events once and sends them to the sessions chosen
+# by the policy, however many share the id
+class ReservationDispatcher:
+
+    def __init__(
+        self,
+        registry: Optional[ConnectionRegistry],
+        event_type: str = 'reserve_now',
+        interval: float = 1,
+        batch_size: int = 1000,
+        policy: str = 'all'
+    ):
+        self.registry = registry
+        self.event_type = event_type
+        self.interval = interval
+        self.batch_size = batch_size
+        self.policy = policy
+
+        self._last_event_id = 0
+
+        # Delivery task and id of the last delivered event, by target id
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._last_delivered: Dict[str, int] = {}
+
+        # Marks of delivered events not committed yet, by target id. Until they are, the last delivered id of the
+        # target is kept even if it disconnects, as the DB would still hand its events out as pending
+        self._unconfirmed: Dict[str, int] = {}
+
+        # Outcomes of the last delivered events, and futures waiting for them, by event id
+        self._results: OrderedDict[int, List[tuple[int, str]]] = OrderedDict()
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+
+    # Returns the sessions with the given id that events are sent to, according to the policy
+    def select(self, target_id: str) -> List[Any]:
+        sessions = self.registry.get(target_id)
+
+        if not sessions or self.policy == 'all':
+            return sessions
+
+        return [sessions[-1]] if self.policy == 'newest' else [sessions[0]]
+
+    # Starts delivering events to the given id, if not doing it already
+    def wake(self, target_id: str):
+        task = self._tasks.get(target_id)
+
+        # If the target is already being delivered to, new events will be found by the running task
+        if task is None or task.done():
+            self._tasks[target_id] = asyncio.create_task(self._deliver(target_id))
+
+    # Stops delivering to the given id, once its last session is gone
+    def forget(self, target_id: str):
+        task = self._tasks.pop(target_id, None)
+
+        if task is not None:
+            task.cancel()
+
+        if target_id not in self._unconfirmed:
+            self._last_delivered.pop(target_id, None)
+
+    # Called on the event loop once a mark of the target is committed (or failed to be)
+    def _confirm(self, target_id: str):
+        self._unconfirmed[target_id] -= 1
+
+        if self._unconfirmed[target_id] > 0:
+            return
+
+        del self._unconfirmed[target_id]
+
+        # Forgotten meanwhile, what is left to deliver is read from the DB on the next connection
+        if target_id not in self._tasks:
+            self._last_delivered.pop(target_id, None)
+
+    # Returns a future resolved with the (session number, status) outcomes of the given event
+    def wait_reservation(self, event_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+
+        # The event may have been delivered already
+        if event_id in self._results:
+            future.set_result(self._results[event_id])
+        else:
+            self._waiters.setdefault(event_id, []).append(future)
+            future.add_done_callback(lambda _: self._discard_waiter(event_id, future))
+
+        return future
+
+    # Drops waiters given up by their caller (e.g. on timeout), their event may never be delivered
+    def _discard_waiter(self, event_id: int, future: asyncio.Future):
+        waiters = self._waiters.get(event_id)
+
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+
+            if not waiters:
+                del self._waiters[event_id]
+
+    def _set_result(self, event_id: int, outcomes: List[tuple[int, str]]):
+        self._results[event_id] = outcomes
+        if len(self._results) > RESULTS_SIZE:
+            self._results.popitem(last=False)
+
+        for future in self._waiters.pop(event_id, ()):
+            if not future.done():
+                future.set_result(outcomes)
+
+    async def _deliver(self, target_id: str):
+        try:
+            while True:
+                sessions = self.select(target_id)
+
+                # Target disconnected, its events will be delivered when it connects again
+                if not sessions:
+                    return
+
+                data = get_event(self.event_type, target_id, self._last_delivered.get(target_id, 0) + 1)
+
+                # If there are no more events, wait to be woken up again
+                if data is None:
+                    return
+
+                event_id, event_data, created_at = data
+
+                # Send to all chosen sessions at once
+                numbers = [self.registry.get_session_number(target_id, session) for session in sessions]
+                statuses = await asyncio.gather(
+                    *(session.deliver_reservation(event_id, event_data, created_at) for session in sessions),
+                    return_exceptions=True
+                )
+
+                outcomes = [
+                    (number, status if isinstance(status, str) else type(status).__name__)
+                    for number, status in zip(numbers, statuses)
+                ]
+
+                # Sessions failing after all retries don't hold back the next events, if none of them got the event
+                # it's kept as a dead letter
+                delivered = any(isinstance(status, str) for status in statuses)
+
+                # Unless the target disconnected meanwhile, then the event is left pending for its next connection
+                if not delivered and not self.select(target_id):
+                    return
+
+                if not delivered:
+                    logging.error(
+                        "Failed to deliver %s event %s to %s: %s", self.event_type, event_id, target_id, outcomes,
+                        extra={'charger': target_id, 'kind': 'dead_letter'}
+                    )
+
+                self._last_delivered[target_id] = event_id
+
+                # Mark it with the outcome of every session, in a single write
+                mark = mark_event_delivered(event_id, target_id, outcomes, 'delivered' if delivered else 'failed')
+                self._set_result(event_id, outcomes)
+
+                self._unconfirmed[target_id] = self._unconfirmed.get(target_id, 0) + 1
+                loop = asyncio.get_running_loop()
+                mark.add_done_callback(lambda _: loop.call_soon_threadsafe(self._confirm, target_id))
+
+        except AttributeError as e:
+            logging.error("Failed to get %s events for %s: %s", self.event_type, target_id, e)
+
+    def poll(self):
+        while True:
+            rows = get_new_events(self.event_type, self._last_event_id, self.batch_size)
+
+            if not rows:
+                return
+
+            # Wake every target only once, even if it received several events
+            woken = set()
+
+            for event_id, target_id in rows:
+                if target_id not in woken:
+                    woken.add(target_id)
+                    self.wake(target_id)
+
+            self._last_event_id = rows[-1][0]
+
+            # If the batch was not full, there is nothing left to read
+            if len(rows) < self.batch_size:
+                return
+
+    async def run(self):
+        while True:
+            try:
+                self.poll()
+            except AttributeError as e:
+                logging.error("Failed to poll %s events: %s", self.event_type, e)
+
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,180 @@
+import time
+from typing import Dict, Optional
+
+
+PERCENTILES = {'p50': 50, 'p90': 90, 'p99': 99, 'p999': 99.9}
+
+
+# HDR-style histogram of latencies: values are recorded in microseconds in log-linear buckets, so that every value is
+# stored with a relative error of at most 2^-significant_bits, whatever its magnitude, in a fixed amount of memory
+class LatencyHistogram:
+
+    def __init__(self, significant_bits: int = 7):
+        self.significant_bits = significant_bits
+        self._sub_buckets = 1 << significant_bits
+        self._half = self._sub_buckets // 2
+
+        # Sparse bucket counts by index
+        self.counts: Dict[int, int] = {}
+
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+
+    def _get_index(self, value: int) -> int:
+        # Small values have a bucket each
+        if value < self._sub_buckets:
+            return value
+
+        # Larger values are grouped in half sub buckets per power of two
+        shift = value.bit_length() - self.significant_bits
+        return self._sub_buckets + (shift - 1) * self._half + (value >> shift) - self._half
+
+    def _get_value(self, index: int) -> int:
+        if index < self._sub_buckets:
+            return index
+
+        shift, mantissa = divmod(index - self._sub_buckets, self._half)
+        shift += 1
+        mantissa += self._half
+
+        # Middle of the bucket
+        return (mantissa << shift) + (1 << (shift - 1))
+
+    # Records a latency in seconds
+    def record(self, seconds: float):
+        value = max(0, int(seconds * 1_000_000))
+        index = self._get_index(value)
+
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    # Returns the latency (in seconds) below which the given percentage of values fall
+    def percentile(self, percentile: float) -> float:
+        if self.count == 0:
+            return 0.0
+
+        threshold = self.count * percentile / 100
+        seen = 0
+
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+
+            if seen >= threshold:
+                return min(self._get_value(index), self.max) / 1_000_000
+
+        return self.max / 1_000_000
+
+    def merge(self, other: 'LatencyHistogram'):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+
+        self.count += other.count
+        self.total += other.total
+
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def summary(self) -> dict:
+        summary = {
+            'count': self.count,
+            'min': (self.min or 0) / 1_000_000,
+            'max': (self.max or 0) / 1_000_000,
+            'mean': self.total / self.count / 1_000_000 if self.count else 0.0,
+        }
+        summary.update({name: self.percentile(p) for name, p in PERCENTILES.items()})
+
+        return summary
+
+    def to_dict(self) -> dict:
+        return {
+            'significant_bits': self.significant_bits,
+            'counts': self.counts,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LatencyHistogram':
+        histogram = cls(data['significant_bits'])
+        histogram.counts = {int(index): count for index, count in data['counts'].items()}
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+
+        return histogram
+
+
+# Latency histograms and error counts by OCPP action
+class LatencyRecorder:
+
+    def __init__(self):
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.errors: Dict[str, int] = {}
+        self.start = time.time()
+
+    def record(self, action: str, seconds: float):
+        histogram = self.histograms.get(action)
+
+        if histogram is None:
+            histogram = self.histograms[action] = LatencyHistogram()
+
+        histogram.record(seconds)
+
+    def record_error(self, action: str):
+        self.errors[action] = self.errors.get(action, 0) + 1
+
+    def merge(self, other: 'LatencyRecorder'):
+        for action, histogram in other.histograms.items():
+            self.histograms.setdefault(action, LatencyHistogram(histogram.significant_bits)).merge(histogram)
+
+        for action, count in other.errors.items():
+            self.errors[action] = self.errors.get(action, 0) + count
+
+        self.start = min(self.start, other.start)
+
+    # Percentiles and requests per second by action
+    def summary(self, elapsed: Optional[float] = None) -> dict:
+        if elapsed is None:
+            elapsed = time.time() - self.start
+
+        summary = {}
+
+        for action in sorted(set(self.histograms) | set(self.errors)):
+            histogram = self.histograms.get(action, LatencyHistogram())
+
+            summary[action] = histogram.summary()
+            summary[action]['errors'] = self.errors.get(action, 0)
+            summary[action]['requests_per_second'] = histogram.count / elapsed if elapsed > 0 else 0.0
+
+        return summary
+
+    def to_dict(self) -> dict:
+        return {
+            'start': self.start,
+            'histograms': {action: histogram.to_dict() for action, histogram in self.histograms.items()},
+            'errors': self.errors,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LatencyRecorder':
+        recorder = cls()
+        recorder.start = data['start']
+        recorder.histograms = {
+            action: LatencyHistogram.from_dict(histogram) for action, histogram in data['histograms'].items()
+        }
+        recorder.errors = dict(data['errors'])
+
+        return recorder
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import re
+from http import HTTPStatus
+from typing import Callable, Awaitable, Optional
+from urllib.parse import urlsplit, parse_qs, unquote
+
+
+# Max size of the request line and of every header (or chunk size) line, and max number of headers
+MAX_LINE_SIZE = 8 * 1024
+MAX_HEADERS = 100
+
+# Max size of the request body
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+class Request:
+
+    def __init__(self, method: str, target: str, headers: dict[str, str], body: bytes, version: str = 'HTTP/1.1'):
+        self.method = method
+        self.headers = headers
+        self.body = body
+        self.version = version
+
+        url = urlsplit(target)
+        self.path = unquote(url.path)
+
+        # Only the first value of every query parameter is kept
+        self.query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        # Set by the router, from the groups of the matched route
+        self.params: dict[str, str] = {}
+
+
+class Response:
+
+    def __init__(self, body: bytes | str = b'', status: int = HTTPStatus.OK, content_type: str = 'text/plain'):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.status = status
+        self.content_type = content_type
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+# Raised for requests that can't be handled, answered with the given status before closing the connection, as what is
+# left of the request would be taken for the next one
+class _RequestError(Exception):
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+async def _read_line(reader: asyncio.StreamReader, status: HTTPStatus = HTTPStatus.BAD_REQUEST) -> bytes:
+    # Lines longer than the limit of the reader are rejected with status
+    try:
+        return await reader.readline()
+    except ValueError:
+        raise _RequestError(status, 'Line too long')
+
+
+# Minimal HTTP/1.1 server running on the event loop, with keep-alive connections and regex routes. Requests with a line
+# longer than max_line_size, more than max_headers headers or a body larger than max_body_size are rejected
+class HttpServer:
+
+    def __init__(
+        self,
+        max_line_size: int = MAX_LINE_SIZE,
+        max_headers: int = MAX_HEADERS,
+        max_body_size: int = MAX_BODY_SIZE
+    ):
+        self.max_line_size = max_line_size
+        self.max_headers = max_headers
+        self.max_body_size = max_body_size
+
+        self._routes: list[tuple[set[str], re.Pattern, Handler]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    # Adds a route, named groups of the pattern are available in request.params
+    def route(self, pattern: str, methods: tuple[str, ...] = ('GET',)):
+        def decorator(handler: Handler) -> Handler:
+            self._routes.append((set(methods), re.compile(pattern), handler))
+            return handler
+
+        return decorator
+
+    async def start(self, host: str, port: int):
+        # Lines are read up to the limit of the reader, the line and its separator must fit in it
+        self._server = await asyncio.start_server(self._handle_connection, host, port, limit=self.max_line_size + 2)
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    async def _dispatch(self, request: Request) -> Response:
+        allowed = False
+
+        for methods, pattern, handler in self._routes:
+            match = pattern.fullmatch(request.path)
+
+            if match is None:
+                continue
+
+            if request.method not in methods:
+                allowed = True
+                continue
+
+            request.params = match.groupdict()
+            return await handler(request)
+
+        if allowed:
+            return Response('Method not allowed', HTTPStatus.METHOD_NOT_ALLOWED)
+
+        return Response('Not found', HTTPStatus.NOT_FOUND)
+
+    # Reads a body sent with Transfer-Encoding: chunked
+    async def _read_chunked(self, reader: asyncio.StreamReader) -> bytes:
+        body = bytearray()
+
+        while True:
+            # Chunk extensions after the size are ignored
+            try:
+                size = int((await _read_line(reader)).partition(b';')[0], 16)
+            except ValueError:
+                raise _RequestError(HTTPStatus.BAD_REQUEST, 'Invalid chunk size')
+
+            if size < 0:
+                raise _RequestError(HTTPStatus.BAD_REQUEST, 'Invalid chunk size')
+
+            if size == 0:
+                break
+
+            if len(body) + size > self.max_body_size:
+                raise _RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request too large')
+
+            body += await reader.readexactly(size)
+
+            if await _read_line(reader) not in (b'\r\n', b'\n'):
+                raise _RequestError(HTTPStatus.BAD_REQUEST, 'Chunk not followed by CRLF')
+
+        # Trailer fields are ignored, but count as headers
+        for _ in range(self.max_headers + 1):
+            if await _read_line(reader, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE) in (b'\r\n', b'\n', b''):
+                return bytes(body)
+
+        raise _RequestError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'Too many trailer fields')
+
+    # Reads the next request of the connection, returns None once the client closed it
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        request_line = await _read_line(reader, HTTPStatus.REQUEST_URI_TOO_LONG)
+
+        if not request_line:
+            return None
+
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise _RequestError(HTTPStatus.BAD_REQUEST, 'Invalid request line')
+
+        headers = {}
+        count = 0
+
+        while (line := await _read_line(reader, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)) not in (b'\r\n', b'\n'):
+            if not line:
+                raise asyncio.IncompleteReadError(line, None)
+
+            count += 1
+            if count > self.max_headers:
+                raise _RequestError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'Too many headers')
+
+            name, separator, value = line.decode('latin-1').partition(':')
+
+            if not separator or not name.strip():
+                raise _RequestError(HTTPStatus.BAD_REQUEST, 'Invalid header')
+
+            headers[name.strip().lower()] = value.strip()
+
+        # Read body, either chunked or of the given length
+        transfer_encoding = headers.get('transfer-encoding', '').lower()
+
+        if transfer_encoding == 'chunked':
+            body = await self._read_chunked(reader)
+
+        elif transfer_encoding:
+            raise _RequestError(HTTPStatus.NOT_IMPLEMENTED, 'Transfer encoding not supported')
+
+        else:
+            try:
+                length = int(headers.get('content-length', 0))
+            except ValueError:
+                raise _RequestError(HTTPStatus.BAD_REQUEST, 'Invalid content length')
+
+            if length < 0:
+                raise _RequestError(HTTPStatus.BAD_REQUEST, 'Invalid content length')
+
+            if length > self.max_body_size:
+                raise _RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request too large')
+
+            body = await reader.readexactly(length) if length else b''
+
+        try:
+            return Request(method, target, headers, body, version)
+        except ValueError:
+            raise _RequestError(HTTPStatus.BAD_REQUEST, 'Invalid request target')
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except _RequestError as e:
+                    response = Response(str(e), e.status)
+                    keep_alive = False
+                else:
+                    if request is None:
+                        return
+
+                    try:
+                        response = await self._dispatch(request)
+                    except Exception as e:
+                        logging.error("Failed to handle %s %s: %s", request.method, request.path, e)
+                        response = Response('Internal server error', HTTPStatus.INTERNAL_SERVER_ERROR)
+
+                    connection = request.headers.get('connection', '').lower()
+                    keep_alive = connection != 'close' and (request.version == 'HTTP/1.1' or connection == 'keep-alive')
+
+                # Write response
+                status = HTTPStatus(response.status)
+                writer.write(
+                    f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                    f'Content-Type: {response.content_type}\r\n'
+                    f'Content-Length: {len(response.body)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+                    '\r\n'.encode('latin-1') + response.body
+                )
+                await writer.drain()
+
+                if not keep_alive:
+                    return
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # Connection closed while reading or writing
+            return
+
+        finally:
+            writer.close()
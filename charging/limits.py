@@ -0,0 +1,156 @@
+import time
+from typing import Optional
+
+from registry import ConnectionRegistry
+
+
+# Classic token bucket: up to burst operations at once, refilled at rate operations per second
+class TokenBucket:
+    __slots__ = ('rate', 'burst', '_tokens', '_last_refill')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        now = time.monotonic()
+
+        # Refill based on the time passed since last call
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+        if self._tokens < amount:
+            return False
+
+        self._tokens -= amount
+        return True
+
+    # Gives back tokens taken for an operation that didn't happen
+    def refund(self, amount: float = 1):
+        self._tokens = min(self.burst, self._tokens + amount)
+
+
+# Decides whether new connections can be accepted, based on the number of connected clients and on the accept rate
+class AdmissionController:
+
+    def __init__(
+        self,
+        registry: ConnectionRegistry,
+        max_connections: int,
+        accept_rate: float = 0,
+        accept_burst: Optional[float] = None,
+        high_watermark: float = 1,
+        low_watermark: float = 1
+    ):
+        self.registry = registry
+        self.max_connections = max_connections
+
+        # Accepts per second (0 means unlimited)
+        self._accept_bucket = None
+        if accept_rate > 0:
+            self._accept_bucket = TokenBucket(accept_rate, accept_burst or accept_rate)
+
+        # Load shedding starts when connections reach high_watermark * max_connections and stops when they
+        # go back below low_watermark * max_connections
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.shedding = False
+
+        # Rejected connections by reason
+        self.rejected = {'full': 0, 'shedding': 0, 'rate': 0}
+
+    def _update_shedding(self, connections: int):
+        if connections >= self.high_watermark * self.max_connections:
+            self.shedding = True
+        elif connections < self.low_watermark * self.max_connections:
+            self.shedding = False
+
+    def is_full(self) -> bool:
+        return len(self.registry) >= self.max_connections
+
+    # Returns None if a new connection can be accepted, or the reason why it must be rejected
+    def admit(self) -> Optional[str]:
+        connections = len(self.registry)
+
+        self._update_shedding(connections)
+
+        if connections >= self.max_connections:
+            reason = 'full'
+        elif self.shedding:
+            reason = 'shedding'
+        elif self._accept_bucket is not None and not self._accept_bucket.try_acquire():
+            reason = 'rate'
+        else:
+            return None
+
+        self.rejected[reason] += 1
+        return reason
+
+
+# Limits the rate and the number of in-flight calls, optionally together with a parent limiter shared by many
+class CallLimiter:
+    __slots__ = ('_bucket', 'max_in_flight', 'in_flight', 'parent', 'accepted', 'rejected')
+
+    def __init__(
+        self,
+        rate: float = 0,
+        burst: Optional[float] = None,
+        max_in_flight: int = 0,
+        parent: Optional['CallLimiter'] = None
+    ):
+        # Calls per second (0 means unlimited)
+        self._bucket = None
+        if rate > 0:
+            self._bucket = TokenBucket(rate, burst or rate)
+
+        # Calls being processed at the same time (0 means unlimited)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+
+        self.parent = parent
+
+        self.accepted = 0
+        self.rejected = 0
+
+    # Returns True if the call can be processed, release must be called once it's done
+    def try_acquire(self) -> bool:
+        if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            return False
+
+        # The local token is only taken once the parent accepted the call, which is given back to the parent if there
+        # is no local token left, so that calls rejected on one side don't use up the limit of the other
+        if self.parent is not None and not self.parent.try_acquire():
+            self.rejected += 1
+            return False
+
+        if self._bucket is not None and not self._bucket.try_acquire():
+            if self.parent is not None:
+                self.parent._cancel()
+
+            self.rejected += 1
+            return False
+
+        self.in_flight += 1
+        self.accepted += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+        if self.parent is not None:
+            self.parent.release()
+
+    # Undoes an accepted call that won't be processed
+    def _cancel(self):
+        self.in_flight -= 1
+        self.accepted -= 1
+
+        if self._bucket is not None:
+            self._bucket.refund()
+
+        if self.parent is not None:
+            self.parent._cancel()
@@ -0,0 +1,325 @@
+import asyncio
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from typing import Optional, Callable, Awaitable
+
+import click
+
+import sim
+from client import launch_client, ChargePointClient
+from histogram import LatencyRecorder, LatencyHistogram
+from workers import raise_file_limit, count_error, merge_errors
+
+
+# Loads an async function taking the client, from a module found next to this one (e.g.
+# 'scenarios.wrong_token:wrong_token'), so that it uses the same client module
+def _load_behaviour(path: Optional[str]) -> Optional[Callable[[ChargePointClient], Awaitable[None]]]:
+    if path is None:
+        return None
+
+    module_name, function_name = path.split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+# Counters of a worker, sent to the main process and reset every report interval
+class WorkerStats:
+
+    def __init__(self, calls: LatencyRecorder):
+        self.calls = calls
+        self.active = 0
+        self.reset()
+
+    def reset(self):
+        self.started = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.errors: dict[str, int] = {}
+        self.connect_latencies = LatencyHistogram()
+        self.boot_latencies = LatencyHistogram()
+
+    def add_error(self, error: BaseException):
+        count_error(self.errors, error)
+
+    def snapshot(self, worker: int, done: bool = False) -> dict:
+        snapshot = {
+            'worker': worker,
+            'done': done,
+            'active': self.active,
+            'started': self.started,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'connect_latencies': self.connect_latencies.to_dict(),
+            'boot_latencies': self.boot_latencies.to_dict(),
+        }
+
+        # Latencies of all calls are sent only once, when the worker is done
+        if done:
+            snapshot['calls'] = self.calls.to_dict()
+
+        self.reset()
+        return snapshot
+
+
+async def _run_charger(config: dict, index: int, stats: WorkerStats, behaviour):
+    serial_number = f"{config['serial_prefix']}-{index // 10_000:04}-{index % 10_000:04}"
+
+    connect_kwargs = {}
+    if config['source_addresses']:
+        # Spread connections over source addresses, to use more ephemeral ports
+        connect_kwargs['local_addr'] = (config['source_addresses'][index % len(config['source_addresses'])], 0)
+
+    start = time.perf_counter()
+
+    async def runnable(cp: ChargePointClient):
+        # Only called once the boot notification is accepted
+        stats.accepted += 1
+        stats.connect_latencies.record(cp.connect_latency)
+        stats.boot_latencies.record(time.perf_counter() - start)
+
+        if behaviour is not None:
+            await behaviour(cp)
+
+    stats.started += 1
+    stats.active += 1
+
+    # Simulated chargers are much lighter than full clients, for large fleets
+    launch = sim.launch_simulated_charger if config['sim'] else launch_client
+
+    try:
+        cp = await launch(
+            serial_number,
+            config['model'],
+            config['vendor_name'],
+            config['server'],
+            config['port'],
+            async_runnable=runnable,
+            **connect_kwargs
+        )
+
+        if cp.boot_status != 'Accepted':
+            stats.rejected += 1
+            stats.connect_latencies.record(cp.connect_latency)
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        stats.add_error(e)
+    finally:
+        stats.active -= 1
+
+
+async def _worker_main(worker: int, indexes: range, rate: float, config: dict, results: multiprocessing.Queue):
+    stats = WorkerStats(sim.latencies if config['sim'] else ChargePointClient.latencies)
+    behaviour = _load_behaviour(config['behaviour'])
+    tasks = set()
+
+    async def report():
+        while True:
+            await asyncio.sleep(config['report_interval'])
+            results.put(stats.snapshot(worker))
+
+    report_task = asyncio.create_task(report())
+
+    # Launch chargers at the given rate
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    for n, index in enumerate(indexes):
+        delay = start + n / rate - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        task = asyncio.create_task(_run_charger(config, index, stats, behaviour))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    # Keep chargers connected for the set time
+    await asyncio.sleep(config['duration'])
+
+    for task in list(tasks):
+        task.cancel()
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    report_task.cancel()
+    results.put(stats.snapshot(worker, done=True))
+
+
+def _run_worker(worker: int, indexes: range, rate: float, config: dict, results: multiprocessing.Queue):
+    raise_file_limit()
+    logging.basicConfig(level=logging.CRITICAL, force=True)
+
+    asyncio.run(_worker_main(worker, indexes, rate, config, results))
+
+
+# Collects snapshots of all workers, prints a line per interval and returns the final report
+def _collect(workers: list[multiprocessing.Process], results: multiprocessing.Queue, report_interval: float) -> dict:
+    start = time.time()
+
+    total = {'started': 0, 'accepted': 0, 'rejected': 0, 'errors': {}}
+    connect_latencies = LatencyHistogram()
+    boot_latencies = LatencyHistogram()
+    calls = LatencyRecorder()
+    active = {}
+    timeline = []
+
+    interval = {'started': 0, 'accepted': 0, 'rejected': 0, 'errors': 0}
+    interval_start = time.time()
+    done = set()
+
+    while len(done) < len(workers):
+        try:
+            snapshot = results.get(timeout=report_interval)
+        except queue.Empty:
+            snapshot = None
+
+        if snapshot is not None:
+            active[snapshot['worker']] = snapshot['active']
+
+            for key in ('started', 'accepted', 'rejected'):
+                total[key] += snapshot[key]
+                interval[key] += snapshot[key]
+
+            interval['errors'] += merge_errors(total['errors'], snapshot['errors'])
+
+            connect_latencies.merge(LatencyHistogram.from_dict(snapshot['connect_latencies']))
+            boot_latencies.merge(LatencyHistogram.from_dict(snapshot['boot_latencies']))
+
+            if snapshot['done']:
+                done.add(snapshot['worker'])
+                calls.merge(LatencyRecorder.from_dict(snapshot['calls']))
+
+        # Workers that died without reporting
+        for i, worker in enumerate(workers):
+            if not worker.is_alive() and worker.exitcode != 0:
+                done.add(i)
+
+        now = time.time()
+        if now - interval_start >= report_interval:
+            elapsed = now - interval_start
+
+            line = {
+                'time': round(now - start, 1),
+                'active': sum(active.values()),
+                'connects_per_second': round(interval['started'] / elapsed, 1),
+                'accepted_per_second': round(interval['accepted'] / elapsed, 1),
+                'rejected_per_second': round(interval['rejected'] / elapsed, 1),
+                'errors_per_second': round(interval['errors'] / elapsed, 1),
+            }
+            timeline.append(line)
+            print(json.dumps(line))
+
+            interval = {'started': 0, 'accepted': 0, 'rejected': 0, 'errors': 0}
+            interval_start = now
+
+    duration = time.time() - start
+    booted = total['accepted'] + total['rejected']
+
+    return {
+        'duration': round(duration, 1),
+        'started': total['started'],
+        'accepted': total['accepted'],
+        'rejected': total['rejected'],
+        'boot_acceptance_rate': total['accepted'] / booted if booted else 0.0,
+        'errors': total['errors'],
+        'connect_latency': connect_latencies.summary(),
+        'boot_latency': boot_latencies.summary(),
+        'calls': calls.summary(duration),
+        'timeline': timeline,
+    }
+
+
+def run_load(
+    connections: int,
+    ramp: float,
+    workers: int,
+    config: dict
+) -> dict:
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+
+    # Every worker launches an equal share of chargers, at an equal share of the ramp rate
+    processes = [
+        context.Process(
+            target=_run_worker,
+            args=(i, range(i, connections, workers), ramp / workers, config, results),
+            name=f'loadgen-{i}'
+        )
+        for i in range(workers)
+    ]
+
+    for process in processes:
+        process.start()
+
+    report = _collect(processes, results, config['report_interval'])
+
+    for process in processes:
+        process.join()
+
+    return report
+
+
+@click.command()
+@click.option('--server', help='The host of the server', default='[::1]', type=str)
+@click.option('--port', help='The port of the server', default=9000, type=int)
+@click.option('--connections', help='Number of simulated chargers', default=10_000, type=click.IntRange(min=1))
+@click.option('--ramp', help='New connections per second', default=1000, type=click.FloatRange(min=0, min_open=True))
+@click.option('--workers', help='Number of worker processes', default=os.cpu_count(), type=click.IntRange(min=1))
+@click.option('--duration', help='Seconds to keep chargers connected after the ramp', default=60, type=float)
+@click.option(
+    '--behaviour', help='Async function run by every charger once booted (e.g. scenarios.wrong_token:wrong_token)',
+    default=None
+)
+@click.option('--vendor-name', help='Vendor name of the chargers', default='EurecomCharge', type=str)
+@click.option('--model', help='Model of the chargers', default='E2507', type=str)
+@click.option('--serial-prefix', help='Prefix of the serial numbers', default='E2507', type=str)
+@click.option('--source-address', help='Local address to connect from (repeatable)', multiple=True)
+@click.option('--report-interval', help='Seconds between reports', default=1, type=float)
+@click.option('--output', help='File where the final report is saved as JSON', default=None, type=click.Path())
+@click.option('--sim', 'simulated', help='Use lightweight simulated chargers instead of full clients', is_flag=True)
+def cli(
+    server: str,
+    port: int,
+    connections: int,
+    ramp: float,
+    workers: int,
+    duration: float,
+    behaviour: Optional[str],
+    vendor_name: str,
+    model: str,
+    serial_prefix: str,
+    source_address: tuple[str],
+    report_interval: float,
+    output: Optional[str],
+    simulated: bool
+):
+    config = {
+        'server': server,
+        'port': port,
+        'duration': duration,
+        'behaviour': behaviour,
+        'vendor_name': vendor_name,
+        'model': model,
+        'serial_prefix': serial_prefix,
+        'source_addresses': list(source_address),
+        'report_interval': report_interval,
+        'sim': simulated,
+    }
+
+    report = run_load(connections, ramp, min(workers, connections), config)
+
+    print(json.dumps({key: value for key, value in report.items() if key != 'timeline'}, indent=2))
+
+    if output is not None:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    cli()
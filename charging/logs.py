@@ -0,0 +1,115 @@
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Optional, TextIO
+
+
+# Formats records as JSON lines, including the charger and kind of message if given through extra
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+
+        for key in ('charger', 'kind', 'suppressed'):
+            value = getattr(record, key, None)
+            if value is not None:
+                line[key] = value
+
+        if record.exc_info:
+            line['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(line, default=str)
+
+
+# Kinds of the records of loggers that don't give one, such as the ocpp library logging every message at INFO
+DEFAULT_KINDS = {'ocpp': 'ocpp'}
+
+
+# Lets through at most limit records per window seconds for every (charger, kind), counting the others. Only records
+# with a kind (given through extra, or DEFAULT_KINDS) are sampled. The number of suppressed records is added to the next
+# one let through
+class SamplingFilter(logging.Filter):
+
+    def __init__(self, limit: int = 10, window: float = 1):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+
+        self._window_start = time.monotonic()
+        self._counts: dict[tuple, int] = {}
+        self._suppressed: dict[tuple, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        kind = getattr(record, 'kind', None)
+
+        if kind is None:
+            kind = DEFAULT_KINDS.get(record.name)
+            record.kind = kind
+
+        if self.limit <= 0 or kind is None:
+            return True
+
+        now = time.monotonic()
+
+        # Counters are reset every window, so that they only hold recently active keys. Suppressed counts of keys
+        # that had no records for a whole window are dropped, as nothing may be logged for them anymore
+        if now - self._window_start >= self.window:
+            self._window_start = now
+            self._suppressed = {key: count for key, count in self._suppressed.items() if key in self._counts}
+            self._counts.clear()
+
+        key = (getattr(record, 'charger', None), kind)
+        count = self._counts.get(key, 0) + 1
+        self._counts[key] = count
+
+        if count > self.limit:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+
+        suppressed = self._suppressed.pop(key, None)
+        if suppressed:
+            record.suppressed = suppressed
+
+        return True
+
+
+# Hands records to the background thread as they are: message formatting is left to the listener
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+# Routes all logging through a queue to a background thread writing to stream, so that the event loop never waits
+# for it. Returns the listener, to be stopped before exiting
+def setup_logging(
+    level: int | str = logging.INFO,
+    json_lines: bool = True,
+    sample_limit: int = 10,
+    sample_window: float = 1,
+    stream: Optional[TextIO] = None
+) -> logging.handlers.QueueListener:
+    records = queue.SimpleQueue()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if json_lines else logging.Formatter(logging.BASIC_FORMAT))
+
+    handler = _LazyQueueHandler(records)
+    handler.addFilter(SamplingFilter(sample_limit, sample_window))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+
+    return listener
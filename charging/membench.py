@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+import click
+
+from loadgen import run_load
+
+
+# Resident memory of a process, in bytes
+def _read_rss(pid: int) -> int:
+    with open(f'/proc/{pid}/status') as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+
+    return 0
+
+
+# Samples the total resident memory of the given processes in background, keeping the highest value
+class RssSampler:
+
+    def __init__(self, pids: tuple[int, ...], interval: float = 0.5):
+        self.pids = pids
+        self.interval = interval
+        self.peak = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def read(self) -> int:
+        return sum(_read_rss(pid) for pid in self.pids)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.read())
+
+    def __enter__(self) -> 'RssSampler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+
+@click.command()
+@click.option('--pid', help='PID of a server process (repeatable, e.g. for every worker)', multiple=True, required=True, type=int)
+@click.option('--server', help='The host of the server', default='[::1]', type=str)
+@click.option('--port', help='The port of the server', default=9000, type=int)
+@click.option('--connections', help='Number of idle chargers of every step (repeatable)', multiple=True, default=(10_000, 50_000, 100_000), type=int)
+@click.option('--ramp', help='New connections per second', default=2000, type=float)
+@click.option('--workers', help='Number of load generator processes', default=os.cpu_count(), type=int)
+@click.option('--hold', help='Seconds to keep chargers connected after the ramp', default=10, type=float)
+@click.option('--source-address', help='Local address to connect from (repeatable)', multiple=True)
+@click.option('--output', help='File where the report is saved as JSON', default=None, type=click.Path())
+@click.option('--sim', 'simulated', help='Use lightweight simulated chargers instead of full clients', is_flag=True)
+def cli(
+    pid: tuple[int, ...],
+    server: str,
+    port: int,
+    connections: tuple[int, ...],
+    ramp: float,
+    workers: int,
+    hold: float,
+    source_address: tuple[str],
+    output: Optional[str],
+    simulated: bool
+):
+    config = {
+        'server': server,
+        'port': port,
+        'duration': hold,
+        'behaviour': None,
+        'vendor_name': 'EurecomCharge',
+        'model': 'E2507',
+        'serial_prefix': 'E2507',
+        'source_addresses': list(source_address),
+        'report_interval': 5,
+        'sim': simulated,
+    }
+
+    steps = []
+
+    for count in connections:
+        sampler = RssSampler(pid)
+        baseline = sampler.read()
+
+        # Chargers stay idle (only heartbeats) once booted, the peak is reached while all of them are connected
+        with sampler:
+            report = run_load(count, ramp, min(workers, count), config)
+
+        accepted = report['accepted']
+
+        step = {
+            'connections': count,
+            'accepted': accepted,
+            'baseline_rss_bytes': baseline,
+            'peak_rss_bytes': sampler.peak,
+            'bytes_per_charger': round((sampler.peak - baseline) / accepted) if accepted else None,
+        }
+        steps.append(step)
+        print(json.dumps(step))
+
+        # Let the server notice all disconnections before the next step
+        time.sleep(hold)
+
+    if output is not None:
+        with open(output, 'w') as file:
+            json.dump(steps, file, indent=2)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,185 @@
+import asyncio
+import bisect
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+
+from httpserver import HttpServer, Request, Response
+
+
+# Default buckets of latency histograms, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+# Label values are escaped as the text format requires, they may come from clients
+def _escape_label_value(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    labels = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(names, values)]
+
+    if extra:
+        labels.append(extra)
+
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class Metric(ABC):
+    kind = 'untyped'
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        pass
+
+    def render(self) -> str:
+        return '\n'.join([f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}'] + self.samples())
+
+
+# Counters are either incremented, or read from a function when rendered
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        function: Optional[Callable[[], float]] = None
+    ):
+        super().__init__(name, description, labels)
+        self.function = function
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> list[str]:
+        if self.function is not None:
+            return [f'{self.name} {self.function()}']
+
+        return [
+            f'{self.name}{_format_labels(self.labels, values)} {value}' for values, value in self._values.items()
+        ]
+
+
+# Gauges are either set, or read from a function when rendered
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        function: Optional[Callable[[], float]] = None
+    ):
+        super().__init__(name, description, labels)
+        self.function = function
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, *label_values: str):
+        self._values[label_values] = value
+
+    def samples(self) -> list[str]:
+        if self.function is not None:
+            return [f'{self.name} {self.function()}']
+
+        return [
+            f'{self.name}{_format_labels(self.labels, values)} {value}' for values, value in self._values.items()
+        ]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+
+        # Count of values for every bucket (plus +Inf) and sum of values, by label values
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *label_values: str):
+        counts = self._counts.get(label_values)
+
+        if counts is None:
+            counts = self._counts[label_values] = [0] * (len(self.buckets) + 1)
+            self._sums[label_values] = 0.0
+
+        # Only the bucket of the value is incremented, cumulative counts are computed when rendering
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[label_values] += value
+
+    def samples(self) -> list[str]:
+        samples = []
+
+        for values, counts in self._counts.items():
+            cumulative = 0
+
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, values, f'le="{bound}"')
+                samples.append(f'{self.name}_bucket{labels} {cumulative}')
+
+            samples.append(f'{self.name}_sum{_format_labels(self.labels, values)} {self._sums[values]}')
+            samples.append(f'{self.name}_count{_format_labels(self.labels, values)} {cumulative}')
+
+        return samples
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    # Prometheus text exposition format
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+# Serves the metrics of the registry on /metrics
+async def start_metrics_server(registry: MetricsRegistry, host: str, port: int) -> HttpServer:
+    server = HttpServer()
+
+    @server.route('/metrics')
+    async def metrics(request: Request) -> Response:
+        return Response(registry.render(), content_type='text/plain; version=0.0.4')
+
+    await server.start(host, port)
+
+    return server
+
+
+# Measures how late the event loop wakes up from a sleep of interval seconds
+async def monitor_event_loop_lag(gauge: Gauge, interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        gauge.set(max(0.0, loop.time() - start - interval))
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import random
+from contextlib import asynccontextmanager
+from typing import Any, Optional, Dict
+
+import websockets.exceptions
+from ocpp.exceptions import OCPPError
+
+
+# Calls from the server to chargers: every attempt is bounded by a timeout, timed out attempts are retried with
+# exponential backoff, and the number of calls outstanding on each charger and on all chargers together is capped, so
+# that a mass push waits for room instead of piling up pending calls. Calls to a charger queue up for its own slots
+# before taking a global one, so a slow charger can't hold the slots of the others
+class OutboundCalls:
+
+    def __init__(
+        self,
+        timeout: float = 10,
+        retries: int = 2,
+        backoff: float = 1,
+        max_backoff: float = 30,
+        max_outstanding: int = 1000,
+        max_per_charger: int = 1
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_outstanding = max_outstanding
+        self.max_per_charger = max_per_charger
+
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        # Slots of each charger and the number of calls holding or waiting for them, kept only while there are some
+        self._charger_slots: Dict[str, list] = {}
+
+        # Counters
+        self.in_flight = 0
+        self.retried = 0
+        self.failed = 0
+
+    # Created on first use, so that it belongs to the running loop
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_outstanding)
+
+        return self._slots
+
+    @asynccontextmanager
+    async def _charger_slot(self, charger_id: str):
+        entry = self._charger_slots.get(charger_id)
+        if entry is None:
+            entry = self._charger_slots[charger_id] = [asyncio.Semaphore(self.max_per_charger), 0]
+
+        entry[1] += 1
+
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+
+            if entry[1] == 0:
+                del self._charger_slots[charger_id]
+
+    def _get_delay(self, attempt: int) -> float:
+        # Jitter spreads the retries of chargers that failed together
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1)
+
+    # Sends the payload to the charger and returns its response. Raises the error of the last attempt if all of them
+    # failed. CallErrors are raised right away, as the charger would answer the same to the same call, and the charger
+    # disconnecting is never retried
+    async def call(self, charge_point, payload) -> Any:
+        attempt = 0
+
+        while True:
+            try:
+                async with self._charger_slot(charge_point.id), self._get_slots():
+                    self.in_flight += 1
+
+                    try:
+                        return await asyncio.wait_for(charge_point.call(payload, suppress=False), self.timeout)
+                    finally:
+                        self.in_flight -= 1
+
+            except (websockets.exceptions.ConnectionClosed, OCPPError):
+                self.failed += 1
+                raise
+
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                if attempt >= self.retries:
+                    self.failed += 1
+                    raise
+
+                delay = self._get_delay(attempt)
+                attempt += 1
+                self.retried += 1
+
+                logging.warning(
+                    "Call %s to %s failed (%s), retrying in %.1fs", type(payload).__name__, charge_point.id,
+                    type(e).__name__, delay, extra={'charger': charge_point.id, 'kind': 'outbound_retry'}
+                )
+
+                await asyncio.sleep(delay)
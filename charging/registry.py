@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+from typing import Dict, Any, List, Iterator
+
+
+# Holds all connected sessions by charge point id, more sessions can share the same id
+class ConnectionRegistry:
+
+    def __init__(self):
+        # Sessions of every id, in order of connection
+        self._sessions: Dict[str, Dict[Any, int]] = {}
+        self._last_session_number = 0
+
+        # Connection counters
+        self.current = 0
+        self.peak = 0
+        self.total = 0
+
+    def __len__(self) -> int:
+        return self.current
+
+    def __contains__(self, charge_point_id: str) -> bool:
+        return charge_point_id in self._sessions
+
+    # Returns all sessions with the given id, from the oldest to the newest
+    def get(self, charge_point_id: str) -> List[Any]:
+        return list(self._sessions.get(charge_point_id, ()))
+
+    # Returns the number of the given session, assigned when it was added
+    def get_session_number(self, charge_point_id: str, session: Any) -> int | None:
+        return self._sessions.get(charge_point_id, {}).get(session)
+
+    def ids(self) -> Iterator[str]:
+        return iter(self._sessions)
+
+    def add(self, charge_point_id: str, session: Any) -> int:
+        self._last_session_number += 1
+        self._sessions.setdefault(charge_point_id, {})[session] = self._last_session_number
+
+        self.current += 1
+        self.total += 1
+        self.peak = max(self.peak, self.current)
+
+        return self._last_session_number
+
+    def remove(self, charge_point_id: str, session: Any):
+        sessions = self._sessions.get(charge_point_id)
+
+        if sessions is None or session not in sessions:
+            return
+
+        del sessions[session]
+        self.current -= 1
+
+        if not sessions:
+            del self._sessions[charge_point_id]
+
+    # Keeps the session registered while in the context, it's removed however the context is left
+    @contextmanager
+    def session(self, charge_point_id: str, session: Any):
+        self.add(charge_point_id, session)
+
+        try:
+            yield
+        finally:
+            self.remove(charge_point_id, session)
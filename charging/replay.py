@@ -0,0 +1,290 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from typing import Callable, Optional
+
+import click
+import websockets
+from websockets import Subprotocol
+
+from capture import CapturedSession, load_sessions
+from codec import loads, dumps
+from histogram import LatencyRecorder, LatencyHistogram
+from sim import CONNECT_SETTINGS, RESERVE_NOW_RESPONSE_FRAME, NOT_IMPLEMENTED_FRAME
+from workers import raise_file_limit, count_error, merge_errors
+
+
+# Replays the sessions of a capture (see capture.py) against the server: every session opens its own connection with
+# the id of its charger and sends the calls the charger sent, at the recorded pace sped up by speed, or back to back
+# with speed 0. Every connection waits for the response to a call before sending the next one, so a slow server slows
+# the replay down rather than piling up calls, and the lag behind the recorded pace is reported. Calls from the server
+# are answered like simulated chargers do
+
+
+class ReplayStats:
+
+    def __init__(self):
+        self.sessions = 0
+        self.frames = 0
+        self.errors: dict[str, int] = {}
+
+        # Round-trip time of the calls replayed, by action, and how late they were sent compared to the recorded pace
+        self.calls = LatencyRecorder()
+        self.lag = LatencyHistogram()
+
+    def add_error(self, error: BaseException):
+        count_error(self.errors, error)
+
+    def to_dict(self) -> dict:
+        return {
+            'sessions': self.sessions,
+            'frames': self.frames,
+            'errors': self.errors,
+            'calls': self.calls.to_dict(),
+            'lag': self.lag.to_dict(),
+        }
+
+
+# Reads the websocket until it's closed, resolving calls waiting for a response with whether they succeeded
+async def _read(websocket, pending: dict[str, asyncio.Future]):
+    try:
+        async for raw_msg in websocket:
+            try:
+                message = loads(raw_msg)
+                message_type, unique_id = message[0], message[1]
+            except (ValueError, IndexError, TypeError):
+                continue
+
+            if message_type in (3, 4):
+                future = pending.pop(unique_id, None)
+
+                if future is not None and not future.done():
+                    future.set_result(message_type == 3)
+
+            elif message_type == 2:
+                frame = RESERVE_NOW_RESPONSE_FRAME if message[2] == 'ReserveNow' else NOT_IMPLEMENTED_FRAME
+                await websocket.send(frame.format(dumps(unique_id)))
+
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+    finally:
+        for future in pending.values():
+            if not future.done():
+                future.set_result(False)
+
+        pending.clear()
+
+
+# Sleeps until the given loop time, returns how late it is past it
+async def _wait_until(deadline: float) -> float:
+    delay = deadline - asyncio.get_running_loop().time()
+
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+    return max(0.0, asyncio.get_running_loop().time() - deadline)
+
+
+async def _replay_session(
+    session: CapturedSession,
+    at: Optional[Callable[[float], float]],
+    stats: ReplayStats,
+    config: dict
+):
+    loop = asyncio.get_running_loop()
+    stats.sessions += 1
+
+    try:
+        async with websockets.connect(
+            f"ws://{config['server']}:{config['port']}/{session.charger_id}",
+            subprotocols=[Subprotocol("ocpp2.0.1")],
+            **CONNECT_SETTINGS
+        ) as ws:
+
+            pending: dict[str, asyncio.Future] = {}
+            reader = asyncio.create_task(_read(ws, pending))
+
+            try:
+                for timestamp, frame in session.frames:
+                    try:
+                        message = loads(frame)
+                        message_type, unique_id, action = message[0], message[1], message[2]
+                    except (ValueError, IndexError, TypeError):
+                        continue
+
+                    # Responses to calls from the server are made again when the server calls
+                    if message_type != 2:
+                        continue
+
+                    if at is not None:
+                        stats.lag.record(await _wait_until(at(timestamp)))
+
+                    future = loop.create_future()
+                    pending[unique_id] = future
+
+                    start = time.perf_counter()
+                    await ws.send(frame)
+
+                    try:
+                        succeeded = await asyncio.wait_for(future, config['timeout'])
+                    except asyncio.TimeoutError:
+                        pending.pop(unique_id, None)
+                        succeeded = False
+
+                    if succeeded:
+                        stats.calls.record(action, time.perf_counter() - start)
+                    else:
+                        stats.calls.record_error(action)
+
+                    stats.frames += 1
+
+                if at is not None and session.closed is not None:
+                    await _wait_until(at(session.closed))
+
+            finally:
+                reader.cancel()
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        stats.add_error(e)
+
+
+async def _worker_main(worker: int, workers: int, config: dict) -> dict:
+    sessions, start = load_sessions(config['capture'], worker, workers)
+    stats = ReplayStats()
+
+    # Recorded times are mapped to the time of the loop, all workers starting from the first record of the capture
+    loop_start = asyncio.get_running_loop().time()
+    speed = config['speed']
+    at = (lambda timestamp: loop_start + (timestamp - start) / speed) if speed > 0 else None
+
+    # Caps the connections open at once
+    semaphore = asyncio.Semaphore(config['concurrency'])
+
+    async def replay(session: CapturedSession):
+        # Sessions are opened and closed at their recorded time, unless replaying at full speed
+        if at is not None:
+            await _wait_until(at(session.opened))
+
+        async with semaphore:
+            await _replay_session(session, at, stats, config)
+
+    await asyncio.gather(*(replay(session) for session in sessions))
+
+    return stats.to_dict()
+
+
+def _run_worker(worker: int, workers: int, config: dict, results: multiprocessing.Queue):
+    raise_file_limit()
+    logging.basicConfig(level=logging.CRITICAL, force=True)
+
+    results.put(asyncio.run(_worker_main(worker, workers, config)))
+
+
+def run_replay(workers: int, config: dict) -> dict:
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+
+    # Every worker replays an equal share of the sessions
+    processes = [
+        context.Process(target=_run_worker, args=(i, workers, config, results), name=f'replay-{i}')
+        for i in range(workers)
+    ]
+
+    start = time.time()
+
+    for process in processes:
+        process.start()
+
+    sessions = 0
+    frames = 0
+    errors: dict[str, int] = {}
+    calls = LatencyRecorder()
+    lag = LatencyHistogram()
+
+    received = 0
+
+    while received < len(processes):
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            # Stop waiting for workers that died without reporting
+            died = sum(not process.is_alive() and process.exitcode != 0 for process in processes)
+
+            if received + died >= len(processes):
+                break
+
+            continue
+
+        received += 1
+
+        sessions += result['sessions']
+        frames += result['frames']
+
+        merge_errors(errors, result['errors'])
+
+        calls.merge(LatencyRecorder.from_dict(result['calls']))
+        lag.merge(LatencyHistogram.from_dict(result['lag']))
+
+    for process in processes:
+        process.join()
+
+    duration = time.time() - start
+
+    return {
+        'duration': round(duration, 1),
+        'speed': config['speed'],
+        'sessions': sessions,
+        'frames': frames,
+        'frames_per_second': round(frames / duration, 1) if duration else 0.0,
+        'errors': errors,
+        'lag': lag.summary(),
+        'calls': calls.summary(duration),
+    }
+
+
+@click.command()
+@click.argument('capture', type=click.Path(exists=True))
+@click.option('--server', help='The host of the server', default='[::1]', type=str)
+@click.option('--port', help='The port of the server', default=9000, type=int)
+@click.option('--speed', help='Speed relative to the recorded pace (0 for full speed)', default=1.0, type=float)
+@click.option('--workers', help='Number of replay processes', default=os.cpu_count(), type=int)
+@click.option('--concurrency', help='Max connections open at once by every worker', default=10_000, type=int)
+@click.option('--timeout', help='Seconds to wait for the response to a call', default=30, type=float)
+@click.option('--output', help='File where the report is saved as JSON', default=None, type=click.Path())
+def cli(
+    capture: str,
+    server: str,
+    port: int,
+    speed: float,
+    workers: int,
+    concurrency: int,
+    timeout: float,
+    output: Optional[str]
+):
+    config = {
+        'capture': capture,
+        'server': server,
+        'port': port,
+        'speed': speed,
+        'concurrency': concurrency,
+        'timeout': timeout,
+    }
+
+    report = run_replay(workers, config)
+
+    print(json.dumps(report, indent=2))
+
+    if output is not None:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    cli()
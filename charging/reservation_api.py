@@ -0,0 +1,119 @@
+import asyncio
+import json
+from http import HTTPStatus
+from typing import Any, Callable, Optional
+
+from db import add_event, add_events
+from httpserver import HttpServer, Request, Response
+from dispatcher import ReservationDispatcher
+
+
+def _get_message(message: Any, code: int = HTTPStatus.OK, **extra) -> Response:
+    return Response(json.dumps({'message': message, 'code': code, **extra}), code, 'application/json')
+
+
+# Reads the body of a bulk reservation: a JSON list of {"serial_number", "type", "id_token"} objects. Returns the
+# (serial number, token) pairs, or None if any of them is malformed
+def parse_reservations(body: bytes | str) -> Optional[list[tuple[str, dict[str, str]]]]:
+    try:
+        items = json.loads(body)
+    except ValueError:
+        return None
+
+    if not isinstance(items, list):
+        return None
+
+    reservations = []
+
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+
+        serial_number, token_type, id_token = item.get('serial_number'), item.get('type'), item.get('id_token')
+
+        if not all(isinstance(value, str) for value in (serial_number, token_type, id_token)):
+            return None
+
+        reservations.append((serial_number, {'type': token_type, 'id_token': id_token}))
+
+    return reservations
+
+
+# Reservation API served by the CSMS itself: reservations are still saved in the DB, but target CPs are woken right
+# away and, when they are connected to this process (given its dispatcher), their ReserveNow responses are returned
+class ReservationApi:
+
+    def __init__(
+        self,
+        wake: Callable[[str], None],
+        dispatcher: Optional[ReservationDispatcher] = None,
+        response_timeout: float = 10
+    ):
+        self.wake = wake
+        self.dispatcher = dispatcher
+        self.response_timeout = response_timeout
+
+        self.server = HttpServer()
+        self.server.route(r'/api/reserve_now/(?P<serial_number>[^/]+)', ('GET', 'PUT', 'POST'))(self.reserve_now)
+        self.server.route(r'/api/reserve_now', ('POST',))(self.reserve_now_bulk)
+
+    async def start(self, host: str, port: int):
+        await self.server.start(host, port)
+
+    def close(self):
+        self.server.close()
+
+    async def reserve_now(self, request: Request) -> Response:
+        serial_number = request.params['serial_number']
+
+        # Get request parameters
+        token = {
+            'type': request.query.get('type'),
+            'id_token': request.query.get('id_token'),
+        }
+
+        # Check token is set correctly
+        if token['type'] is None or token['id_token'] is None:
+            return _get_message('Bad request', HTTPStatus.BAD_REQUEST)
+
+        # Add event to DB, as a durable log (in a separate thread, as it waits for the commit)
+        try:
+            event_id = await asyncio.get_running_loop().run_in_executor(
+                None, add_event, 'reserve_now', serial_number, token
+            )
+        except AttributeError:
+            return _get_message('Failed to save reservation', HTTPStatus.INTERNAL_SERVER_ERROR)
+
+        # If the CP is not connected here, it will get the reservation as soon as possible
+        if self.dispatcher is None or serial_number not in self.dispatcher.registry:
+            self.wake(serial_number)
+            return _get_message('Queued', HTTPStatus.ACCEPTED, id=event_id)
+
+        # Deliver without waiting for the reservation poller, and wait for the responses of the chosen sessions
+        outcome = self.dispatcher.wait_reservation(event_id)
+        self.wake(serial_number)
+
+        try:
+            outcomes = await asyncio.wait_for(outcome, self.response_timeout)
+        except asyncio.TimeoutError:
+            return _get_message('Charger did not respond in time', HTTPStatus.GATEWAY_TIMEOUT, id=event_id)
+
+        return _get_message('OK', HTTPStatus.OK, id=event_id, responses=[status for _, status in outcomes])
+
+    async def reserve_now_bulk(self, request: Request) -> Response:
+        reservations = parse_reservations(request.body)
+
+        if reservations is None:
+            return _get_message('Bad request', HTTPStatus.BAD_REQUEST)
+
+        # Add all events to DB in a single transaction
+        try:
+            ids = await asyncio.get_running_loop().run_in_executor(None, add_events, 'reserve_now', reservations)
+        except AttributeError:
+            return _get_message('Failed to save reservations', HTTPStatus.INTERNAL_SERVER_ERROR)
+
+        # Deliver without waiting for the reservation poller, responses of CPs are not waited for
+        for serial_number in dict.fromkeys(serial_number for serial_number, _ in reservations):
+            self.wake(serial_number)
+
+        return _get_message('Queued', HTTPStatus.ACCEPTED, count=len(ids))
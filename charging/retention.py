@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import time
+
+from db import compact_events, get_event_stats
+
+
+# Periodically removes delivered events from the Events table in bounded chunks, so that it stays small while the
+# server is running, and reports table size and purge throughput
+class EventRetention:
+
+    def __init__(
+        self,
+        interval: float = 60,
+        chunk_size: int = 1000,
+        max_chunks: int = 100,
+        min_age: float = 60,
+        archive: bool = False
+    ):
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.min_age = min_age
+        self.archive = archive
+
+        self.purged_total = 0
+        self.last_purged = 0
+        self.last_throughput = 0.0
+        self.last_stats: dict[str, int] = {}
+
+    # Runs one compaction cycle, returns the number of removed events
+    def compact(self) -> int:
+        purged = 0
+        start = time.perf_counter()
+
+        # Remove at most max_chunks chunks per cycle, the rest will be removed in the next one
+        for _ in range(self.max_chunks):
+            removed = compact_events(self.chunk_size, self.min_age, self.archive)
+            purged += removed
+
+            if removed < self.chunk_size:
+                break
+
+        elapsed = time.perf_counter() - start
+
+        self.purged_total += purged
+        self.last_purged = purged
+        self.last_throughput = purged / elapsed if elapsed > 0 else 0.0
+
+        return purged
+
+    def report(self) -> dict[str, int]:
+        self.last_stats = get_event_stats()
+
+        logging.info(
+            "Events table: %s events (%s pending, %s delivered), %s bytes. "
+            "Purged %s events at %.0f events/s (%s in total)",
+            self.last_stats['total'], self.last_stats['pending'], self.last_stats['delivered'],
+            self.last_stats['size_bytes'], self.last_purged, self.last_throughput, self.purged_total
+        )
+
+        return self.last_stats
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await asyncio.sleep(self.interval)
+
+            # DB work is done in a separate thread, not to block the event loop
+            try:
+                await loop.run_in_executor(None, self.compact)
+                await loop.run_in_executor(None, self.report)
+            except AttributeError as e:
+                logging.error("Failed to compact events: %s", e)
@@ -1,8 +1,9 @@
 import asyncio
+import json
 import random
 import time
 
-from charging.client import launch_client, get_host_and_port, ChargePointClient
+from client import launch_client, get_host_and_port, ChargePointClient
 
 N_INSTANCES = 10_000
 
@@ -33,9 +34,12 @@ async def main():
 
     print(f"All clients launched in {time.time() - start} seconds")
 
-    # Await all clients
-    for i in range(N_INSTANCES):
-        await tasks[i]
+    # Await all clients, then print latency and throughput of every action (also when interrupted)
+    try:
+        for i in range(N_INSTANCES):
+            await tasks[i]
+    finally:
+        print(json.dumps(ChargePointClient.latencies.summary(), indent=2))
 
 
 if __name__ == "__main__":
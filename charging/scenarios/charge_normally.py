@@ -2,7 +2,8 @@ import asyncio
 import logging
 from uuid import uuid4
 
-from charging.client import ChargePointClient, launch_client, get_host_and_port, wait_for_button_press
+from client import ChargePointClient, launch_client, get_host_and_port, wait_for_button_press
+from clock import default_clock
 
 logging.basicConfig(level=logging.ERROR)
 
@@ -11,11 +12,15 @@ logging.basicConfig(level=logging.ERROR)
 RFID_TOKEN = '1122334455667788'
 TOKEN_TYPE = 'ISO15693'
 
+# Seconds spent charging, on the clock of the client (set OCPP_CLOCK=scaled:100 to run it 100 times faster)
+CHARGING_DURATION = 2 * 60 * 60
+
 
 # Emulates a normal charging process:
 #   1. Authentication
 #   2. Plug cable in
 #   3. Start charging
+#   4. Stop charging after CHARGING_DURATION
 async def charge_normally(cp: ChargePointClient):
     cp.print_message('Connected to server')
 
@@ -71,6 +76,13 @@ async def charge_normally(cp: ChargePointClient):
     response = await cp.send_transaction_event_charging_state_changed('Updated', transaction_id, 3, 'Charging')
     cp.print_message(f"Started charging! Server message: '{response.updated_personal_message['content']}'")
 
+    # === STOP CHARGING ===
+
+    await default_clock.sleep(CHARGING_DURATION)
+
+    response = await cp.send_transaction_event_charging_state_changed('Ended', transaction_id, 4, 'Idle')
+    cp.print_message(f"Stopped charging! Server message: '{response.updated_personal_message['content']}'")
+
 
 if __name__ == "__main__":
 
@@ -1,7 +1,8 @@
 import asyncio
 
-from charging.client import get_host_and_port, launch_client, ChargePointClient, wait_for_button_press
-from charging.api_client import send_reservation_request
+from client import get_host_and_port, launch_client, ChargePointClient, wait_for_button_press
+from api_client import send_reservation_request
+from clock import default_clock
 
 
 # ID of the RFID token used to authenticate
@@ -37,7 +38,7 @@ async def main():
     )
 
     # Wait
-    await asyncio.sleep(1)
+    await default_clock.sleep(1)
 
     # Launch malicious client and do the rest
     malicious_client = asyncio.create_task(
@@ -0,0 +1,370 @@
+import asyncio
+import json
+import logging
+import random
+import secrets
+import time
+from typing import Awaitable, Callable, Optional
+from uuid import uuid4
+
+import click
+import yaml
+
+from api_client import send_reservation_request
+from client import ChargePointClient, launch_client
+from clock import default_clock
+
+
+# Runs scenarios described in YAML or JSON files (see charging/scenarios/specs): populations of chargers arrive at a
+# given rate, each charger boots and then goes through the steps of its behaviour, and assertions are checked on the
+# outcomes of all steps and on call latencies once every charger is done. Times are on the clock of the process (see
+# OCPP_CLOCK in charging/clock.py), so long scenarios can be sped up
+
+
+# Statuses of steps that went as expected, unless the step says otherwise
+DEFAULT_EXPECTED = ('Accepted', 'OK')
+
+
+# Raised once a charger is done, to close its connection
+class _SessionDone(Exception):
+    pass
+
+
+# State of a charger going through its behaviour
+class Session:
+
+    def __init__(self, scenario: 'Scenario', population: dict, cp: ChargePointClient):
+        self.scenario = scenario
+        self.population = population
+        self.cp = cp
+
+        self.transaction_id = str(uuid4())
+        self.seq_no = 0
+
+        # Energy register of the charger, in Wh
+        self.energy = 0.0
+
+    def next_seq_no(self) -> int:
+        self.seq_no += 1
+        return self.seq_no
+
+
+def _get_token(token_type: str, id_token: str) -> dict[str, str]:
+    # A new random token for every use
+    if id_token == 'random':
+        id_token = secrets.token_hex(8)
+
+    return {'type': token_type, 'id_token': id_token}
+
+
+# Steps of behaviours: every one returns the status it ended with
+
+async def _authorize(session: Session, type: str = 'ISO15693', id_token: str = 'random') -> str:
+    token = _get_token(type, id_token)
+
+    response = await session.cp.send_authorize(token)
+    status = response.id_token_info['status']
+
+    if status != 'Accepted':
+        return status
+
+    # Start the transaction once authorized
+    response = await session.cp.send_transaction_event_authorized(
+        'Started', session.transaction_id, session.next_seq_no(), token
+    )
+
+    return response.id_token_info['status']
+
+
+async def _plug_in(session: Session) -> str:
+    await session.cp.send_status_notification('Occupied')
+    await session.cp.send_transaction_event_cable_plugged_in('Updated', session.transaction_id, session.next_seq_no())
+
+    return 'OK'
+
+
+# Meter values are sent every meter_interval seconds while charging (none with 0), the energy register going up by
+# power watts
+async def _charge(session: Session, duration: float = 0, meter_interval: float = 0, power: float = 11_000) -> str:
+    await session.cp.send_transaction_event_charging_state_changed(
+        'Updated', session.transaction_id, session.next_seq_no(), 'Charging'
+    )
+
+    if meter_interval <= 0:
+        await default_clock.sleep(duration)
+        return 'OK'
+
+    elapsed = 0.0
+
+    while elapsed < duration:
+        step = min(meter_interval, duration - elapsed)
+        await default_clock.sleep(step)
+        elapsed += step
+
+        session.energy += power * step / 3600
+        await session.cp.send_transaction_event_meter_values(
+            'Updated', session.transaction_id, session.next_seq_no(), round(session.energy, 1)
+        )
+
+    return 'OK'
+
+
+async def _stop(session: Session) -> str:
+    await session.cp.send_transaction_event_charging_state_changed(
+        'Ended', session.transaction_id, session.next_seq_no(), 'Idle'
+    )
+    await session.cp.send_status_notification('Available')
+
+    return 'OK'
+
+
+async def _wait(session: Session, seconds: float = 0) -> str:
+    await default_clock.sleep(seconds)
+
+    return 'OK'
+
+
+async def _flood_authorize(session: Session, count: int = 1000, type: str = 'ISO15693') -> str:
+    # All requests are sent at once, their latencies are recorded by the client
+    results = await asyncio.gather(
+        *(session.cp.send_authorize(_get_token(type, 'random')) for _ in range(count)),
+        return_exceptions=True
+    )
+
+    errors = sum(isinstance(result, Exception) for result in results)
+
+    return 'OK' if errors == 0 else 'Failed'
+
+
+async def _reserve(session: Session, type: str = 'ISO14443', id_token: str = 'random') -> str:
+    token = _get_token(type, id_token)
+    api = session.scenario.api
+
+    # The API client is blocking
+    status_code = await asyncio.get_running_loop().run_in_executor(
+        None, send_reservation_request, session.cp.id, token['type'], token['id_token'], api['host'], api['port']
+    )
+
+    return 'OK' if status_code in (200, 202) else str(status_code)
+
+
+STEPS: dict[str, Callable[..., Awaitable[str]]] = {
+    'authorize': _authorize,
+    'plug_in': _plug_in,
+    'charge': _charge,
+    'stop': _stop,
+    'wait': _wait,
+    'flood_authorize': _flood_authorize,
+    'reserve': _reserve,
+}
+
+
+# Reads a step of a behaviour, given as a name or as {name: parameters}. Returns its name, parameters, expected
+# statuses and whether the behaviour goes on after an unexpected status
+def _parse_step(step: str | dict) -> tuple[str, dict, tuple[str, ...], bool]:
+    if isinstance(step, str):
+        name, params = step, {}
+    else:
+        (name, params), = step.items()
+        params = dict(params or {})
+
+    if name not in STEPS:
+        raise ValueError(f"Unknown step {name}, must be one of {', '.join(STEPS)}")
+
+    expected = tuple(params.pop('expect', DEFAULT_EXPECTED))
+    on_failure = params.pop('on_failure', 'stop')
+
+    return name, params, expected, on_failure == 'continue'
+
+
+class Scenario:
+
+    def __init__(self, spec: dict, server: Optional[str] = None, port: Optional[int] = None):
+        self.name = spec.get('name', 'scenario')
+        self.server = server or spec.get('server', {}).get('host', '[::1]')
+        self.port = port or spec.get('server', {}).get('port', 9000)
+        self.api = {'host': '[::1]', 'port': 8000, **spec.get('api', {})}
+        self.duration: Optional[float] = spec.get('duration')
+
+        self.populations = spec['populations']
+        self.assertions = spec.get('assertions', [])
+
+        # Steps are checked before anything runs
+        for population in self.populations:
+            population['steps'] = [_parse_step(step) for step in population.get('behaviour', [])]
+
+        # Chargers launched so far by all populations, numbering their default serial numbers
+        self.launched = 0
+
+        # Number of times every status was reached, by population and step
+        self.outcomes: dict[str, dict[str, dict[str, int]]] = {
+            population['name']: {} for population in self.populations
+        }
+
+    def record(self, population: dict, step: str, status: str):
+        statuses = self.outcomes[population['name']].setdefault(step, {})
+        statuses[status] = statuses.get(status, 0) + 1
+
+    async def _run_behaviour(self, population: dict, cp: ChargePointClient):
+        session = Session(self, population, cp)
+
+        for _ in range(population.get('repeat', 1)):
+            for name, params, expected, keep_going in population['steps']:
+                try:
+                    status = await STEPS[name](session, **params)
+                except Exception as e:
+                    status = type(e).__name__
+
+                self.record(population, name, status)
+
+                if status not in expected and not keep_going:
+                    raise _SessionDone()
+
+            # Every repetition is a new transaction
+            session.transaction_id = str(uuid4())
+
+        # Stay connected (heartbeats only) before leaving
+        await default_clock.sleep(population.get('hold', 0))
+
+        raise _SessionDone()
+
+    # Serial numbers may use the index of the charger in its population and a random number. By default chargers are
+    # numbered across populations, split in two groups of 4 digits as in loadgen
+    async def _run_charger(self, population: dict, index: int):
+        number = self.launched
+        self.launched += 1
+
+        serial_number = population.get('serial_number', 'E2507-{high:04}-{low:04}').format(
+            index=index, random=random.randint(0, 9999), high=number // 10_000, low=number % 10_000
+        )
+
+        async def runnable(cp: ChargePointClient):
+            # Only called once the boot notification is accepted
+            self.record(population, 'boot', cp.boot_status)
+            await self._run_behaviour(population, cp)
+
+        try:
+            cp = await launch_client(
+                serial_number,
+                population.get('model', 'E2507'),
+                population.get('vendor_name', 'EurecomCharge'),
+                self.server,
+                self.port,
+                async_runnable=runnable
+            )
+
+            # The runnable is only called for accepted chargers
+            if cp.boot_status != 'Accepted':
+                self.record(population, 'boot', cp.boot_status or 'Closed')
+
+        except _SessionDone:
+            pass
+        except Exception as e:
+            self.record(population, 'boot', type(e).__name__)
+
+    async def _run_population(self, population: dict):
+        await default_clock.sleep(population.get('start_after', 0))
+
+        count = population.get('count', 1)
+        rate = population.get('arrival_rate', 0)
+        tasks = []
+
+        for index in range(count):
+            tasks.append(asyncio.create_task(self._run_charger(population, index)))
+
+            # Spread arrivals, all chargers arrive at once without a rate
+            if rate > 0 and index < count - 1:
+                await default_clock.sleep(1 / rate)
+
+        await asyncio.gather(*tasks)
+
+    async def run(self) -> dict:
+        start = time.perf_counter()
+
+        populations = asyncio.gather(*(self._run_population(population) for population in self.populations))
+
+        # Chargers still running at the end of the scenario are stopped
+        if self.duration is not None:
+            timeout = asyncio.ensure_future(default_clock.sleep(self.duration))
+            await asyncio.wait([populations, timeout], return_when=asyncio.FIRST_COMPLETED)
+            timeout.cancel()
+            populations.cancel()
+
+        try:
+            await populations
+        except asyncio.CancelledError:
+            pass
+
+        elapsed = time.perf_counter() - start
+        latencies = ChargePointClient.latencies.summary(elapsed)
+        results = [self._check(assertion, latencies) for assertion in self.assertions]
+
+        return {
+            'name': self.name,
+            'elapsed': round(elapsed, 3),
+            'passed': all(result['passed'] for result in results),
+            'outcomes': self.outcomes,
+            'latencies': latencies,
+            'assertions': results,
+        }
+
+    # Assertions on outcomes take a step, a status and the bounds of its count or of its ratio over all outcomes of
+    # the step (of one population, or all of them). Assertions on latencies take an action, a stat and its bounds
+    def _check(self, assertion: dict, latencies: dict) -> dict:
+        if 'action' in assertion:
+            value = latencies.get(assertion['action'], {}).get(assertion.get('stat', 'p99'), 0)
+            checks = [(value, assertion.get('min'), assertion.get('max'))]
+
+        else:
+            names = [assertion['population']] if 'population' in assertion else list(self.outcomes)
+            statuses = [self.outcomes[name].get(assertion['step'], {}) for name in names]
+
+            count = sum(i.get(assertion['status'], 0) for i in statuses)
+            total = sum(sum(i.values()) for i in statuses)
+            ratio = count / total if total else 0.0
+
+            value = {'count': count, 'ratio': ratio}
+            checks = [
+                (count, assertion.get('min_count'), assertion.get('max_count')),
+                (ratio, assertion.get('min_ratio'), assertion.get('max_ratio')),
+            ]
+
+        passed = all(
+            (low is None or current >= low) and (high is None or current <= high) for current, low, high in checks
+        )
+
+        return {**assertion, 'value': value, 'passed': passed}
+
+
+def load_spec(path: str) -> dict:
+    with open(path) as file:
+        if path.endswith('.json'):
+            return json.load(file)
+
+        return yaml.safe_load(file)
+
+
+@click.command()
+@click.argument('spec', type=click.Path(exists=True))
+@click.option('--server', help='The host of the server (overrides the spec)', default=None, type=str)
+@click.option('--port', help='The port of the server (overrides the spec)', default=None, type=int)
+@click.option('--output', help='File where the report is saved as JSON', default=None, type=click.Path())
+def cli(spec: str, server: Optional[str], port: Optional[int], output: Optional[str]):
+    logging.basicConfig(level=logging.CRITICAL, force=True)
+
+    scenario = Scenario(load_spec(spec), server, port)
+    report = asyncio.run(scenario.run())
+
+    print(json.dumps(report, indent=2))
+
+    if output is not None:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    # Failed assertions fail the run, so that scenarios can be used as checks
+    if not report['passed']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    cli()
@@ -1,9 +1,11 @@
 import asyncio
+import json
 import random
 import secrets
 import time
 
-from charging.client import launch_client, get_host_and_port, ChargePointClient
+from client import launch_client, get_host_and_port, ChargePointClient
+from clock import default_clock
 
 
 # ID of the RFID token used to authenticate
@@ -30,7 +32,7 @@ def _get_random_token() -> dict[str, str]:
 async def internal_dos(cp: ChargePointClient):
     tasks = []
 
-    await asyncio.sleep(1)
+    await default_clock.sleep(1)
 
     cp.print_message("Flooding with Authorize requests")
 
@@ -48,6 +50,9 @@ async def internal_dos(cp: ChargePointClient):
 
     cp.print_message(f"Server is done after {end - start} seconds")
 
+    # Latency and throughput of every action
+    print(json.dumps(ChargePointClient.latencies.summary(end - start), indent=2))
+
 
 async def main():
     malicious_client = asyncio.create_task(
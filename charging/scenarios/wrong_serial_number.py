@@ -1,6 +1,6 @@
 import asyncio
 
-from charging.client import launch_client, get_host_and_port, ChargePointClient
+from client import launch_client, get_host_and_port, ChargePointClient
 
 
 async def main():
@@ -1,7 +1,7 @@
 import asyncio
 import logging
 
-from charging.client import launch_client, get_host_and_port, ChargePointClient
+from client import launch_client, get_host_and_port, ChargePointClient
 
 
 async def wrong_token(cp: ChargePointClient):
@@ -0,0 +1,124 @@
+import asyncio
+import inspect
+import logging
+import random
+from typing import Callable, Optional, Any
+
+from clock import WallClock, default_clock
+
+
+class TimerHandle:
+    __slots__ = ('wheel', 'interval', 'callback', 'slot', 'rounds', 'cancelled')
+
+    def __init__(self, wheel: 'TimerWheel', interval: float, callback: Callable[[], Any]):
+        self.wheel = wheel
+        self.interval = interval
+        self.callback = callback
+        self.slot = 0
+        self.rounds = 0
+        self.cancelled = False
+
+    def cancel(self):
+        self.wheel.cancel(self)
+
+
+# Hashed timer wheel owning periodic work: timers are grouped in slots of tick seconds and all timers of a slot are
+# fired together by a single task, so that there is no live event loop timer per periodic job
+class TimerWheel:
+
+    def __init__(self, tick: float = 0.1, slots: int = 1024, jitter: float = 1, clock: Optional[WallClock] = None):
+        self.tick = tick
+        self.jitter = jitter
+
+        # Ticks follow the given clock (virtual seconds), or real time
+        self.clock = clock or WallClock()
+
+        # Slot of the last tick, a timer inserted ticks ticks ahead fires on the ticks-th tick after it
+        self._slots: list[set[TimerHandle]] = [set() for _ in range(slots)]
+        self._cursor = 0
+
+        self._task: Optional[asyncio.Task] = None
+
+        # Keeps tasks created by callbacks alive until they are done
+        self._running: set[asyncio.Future] = set()
+
+    def __len__(self) -> int:
+        return sum(len(i) for i in self._slots)
+
+    def _insert(self, handle: TimerHandle, delay: float):
+        ticks = max(1, round(delay / self.tick))
+
+        # The slot is first reached after ticks % slots ticks, or after a full turn when that's 0, then once every turn
+        handle.slot = (self._cursor + ticks) % len(self._slots)
+        handle.rounds = (ticks - 1) // len(self._slots)
+
+        self._slots[handle.slot].add(handle)
+
+    # Calls callback every interval seconds (if it's a coroutine function, a task is created for every call). The
+    # first call happens at a random point of the first interval (scaled by jitter), to spread timers across slots
+    def schedule_periodic(self, interval: float, callback: Callable[[], Any]) -> TimerHandle:
+        handle = TimerHandle(self, interval, callback)
+        self._insert(handle, interval * (1 - self.jitter * random.random()))
+
+        # Start ticking on first use
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+        return handle
+
+    def cancel(self, handle: TimerHandle):
+        handle.cancelled = True
+        self._slots[handle.slot].discard(handle)
+
+    def _fire(self, handle: TimerHandle):
+        try:
+            result = handle.callback()
+
+            if inspect.isawaitable(result):
+                future = asyncio.ensure_future(result)
+                self._running.add(future)
+                future.add_done_callback(self._on_done)
+
+        except Exception as e:
+            logging.error("Periodic job failed: %s", e)
+
+    # Failures of tasks created by callbacks are logged like those of the callbacks themselves
+    def _on_done(self, future: asyncio.Future):
+        self._running.discard(future)
+
+        if not future.cancelled() and future.exception() is not None:
+            logging.error("Periodic job failed: %s", future.exception())
+
+    def _advance(self):
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        slot = self._slots[self._cursor]
+        due = [i for i in slot if i.rounds == 0]
+
+        # Timers due in later rounds of the wheel
+        for i in slot:
+            if i.rounds > 0:
+                i.rounds -= 1
+
+        # A callback may cancel timers due later in the same tick, which are then neither fired nor inserted again
+        for i in due:
+            if i.cancelled:
+                continue
+
+            slot.discard(i)
+            self._insert(i, i.interval)
+            self._fire(i)
+
+    async def run(self):
+        next_tick = self.clock.monotonic() + self.tick
+
+        while True:
+            # Catch up with all ticks that were due, if the loop was late
+            while next_tick <= self.clock.monotonic():
+                self._advance()
+                next_tick += self.tick
+
+            await self.clock.sleep(next_tick - self.clock.monotonic())
+
+
+# Wheel shared by everything running in this process, following its clock (ticks stay 0.1 real seconds when sped up)
+default_wheel = TimerWheel(tick=0.1 * default_clock.speed, clock=default_clock)
@@ -1,16 +1,37 @@
 import asyncio
 import logging
-import re
+import multiprocessing
+import signal
+import time
 from datetime import datetime, timedelta
+from http import HTTPStatus
 from typing import Optional, Dict, Any, List
 
 import websockets
 import yaml
+from ocpp.charge_point import snake_to_camel_case
+from ocpp.exceptions import GenericError, OCPPError
+from ocpp.messages import unpack
 from ocpp.routing import on, after
 from ocpp.v201 import ChargePoint as Cp, call, call_result
 from websockets import Subprotocol
 
-from db import get_event, purge_events
+from authorization import TokenIndex, ChargerMatcher
+from capture import CaptureWriter, SIDE_SERVER, INBOUND, OUTBOUND
+from clock import default_clock
+from codec import FastCodec, current_time_body, dumps, HEARTBEAT, STATUS_NOTIFICATION, TRANSACTION_EVENT
+from db import purge_events, set_query_observer
+from dispatcher import ReservationDispatcher, DELIVERY_POLICIES
+from limits import AdmissionController, CallLimiter
+from logs import setup_logging
+from metrics import MetricsRegistry, start_metrics_server, monitor_event_loop_lag
+from outbound import OutboundCalls
+from registry import ConnectionRegistry
+from reservation_api import ReservationApi
+from retention import EventRetention
+from scheduler import default_wheel
+from sharding import Coordinator, CoordinatorDispatcher, ShardClient
+from transactions import TransactionStore
 
 logging.basicConfig(level=logging.INFO)
 
@@ -18,18 +39,138 @@ logging.basicConfig(level=logging.INFO)
 SERVER_CONFIG_FILE = 'charging/server_config.yaml'
 
 # Will be loaded from server_config.yaml on startup
-ACCEPTED_TOKENS = []
-ACCEPTED_CHARGES = []
+ACCEPTED_TOKENS = TokenIndex()
+ACCEPTED_CHARGES = ChargerMatcher()
 ALLOW_MULTIPLE_SERIAL_NUMBERS = True
 MAX_CONNECTED_CLIENTS = 100_000
+MAX_ACCEPTS_PER_SECOND = 0
+MAX_ACCEPTS_BURST = None
+HIGH_WATERMARK = 1.0
+LOW_WATERMARK = 1.0
 HEARTBEAT_INTERVAL = 10
+IDLE_TIMEOUT = 0
+RESERVATION_POLL_INTERVAL = 1
+RESERVATION_DELIVERY_POLICY = 'all'
+RESERVATION_EXPIRY = 3600
+CALLS_PER_SECOND = 0
+CALLS_BURST = None
+GLOBAL_CALLS_PER_SECOND = 0
+GLOBAL_CALLS_BURST = None
+GLOBAL_MAX_IN_FLIGHT_CALLS = 0
+SERVER_HOST = '::'
+SERVER_PORT = 9000
+WORKERS = 1
+FAST_CODEC_ENABLED = False
+CAPTURE_ENABLED = False
+CAPTURE_PATH = 'charging/capture.bin'
+CAPTURE_FLUSH_INTERVAL = 1
+METRICS_ENABLED = False
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9100
+# Settings of every websocket connection, passed to websockets.serve (defaults are the ones of websockets)
+WEBSOCKET_SETTINGS = {
+    'compression': 'deflate',
+    'max_size': 2 ** 20,
+    'max_queue': 32,
+    'read_limit': 2 ** 16,
+    'write_limit': 2 ** 16,
+    'ping_interval': 20,
+    'ping_timeout': 20,
+}
+# Profile of connections: default, or compact for many idle chargers. Compact connections have no compression (a zlib
+# context each), small buffers and queues (OCPP messages are small) and no ping task, liveness is checked through
+# IDLE_TIMEOUT by a single shared job instead. Settings given explicitly in the config apply over the profile
+CONNECTION_PROFILE = 'default'
+CONNECTION_PROFILES = ('default', 'compact')
+COMPACT_WEBSOCKET_SETTINGS = {
+    'compression': None,
+    'max_size': 65536,
+    'max_queue': 4,
+    'read_limit': 4096,
+    'write_limit': 4096,
+    'ping_interval': None,
+    'ping_timeout': None,
+}
+COMPACT_IDLE_TIMEOUT = 180
+API_ENABLED = False
+API_HOST = '::'
+API_PORT = 8001
+API_RESPONSE_TIMEOUT = 10
+LOG_LEVEL = 'INFO'
+LOG_JSON = False
+LOG_SAMPLE_LIMIT = 0
+LOG_SAMPLE_WINDOW = 1
 
 # Holds ID and instance of all connected clients
-connected_clients = []
+connected_clients = ConnectionRegistry()
+
+# Rejects new clients when the server is overloaded
+admission_controller = AdmissionController(connected_clients, MAX_CONNECTED_CLIENTS)
+
+# Limits the calls of all clients together
+global_call_limiter = CallLimiter()
+
+# Wakes connected clients when a reservation is addressed to them
+reservation_dispatcher = ReservationDispatcher(connected_clients)
+
+# Sends calls to chargers with timeouts and retries, capping the calls outstanding on all of them
+outbound_calls = OutboundCalls()
+
+# Removes delivered events while the server is running
+event_retention = EventRetention()
+
+# State of transactions and their meter values, written in batches by a background thread
+transaction_store = TransactionStore()
+
+# Connection to the coordinator, only when running as one of many workers
+shard_client: Optional[ShardClient] = None
+
+# Records frames exchanged with clients, only when capture is enabled
+capture: Optional[CaptureWriter] = None
+
+# Metrics exported in Prometheus format
+metrics = MetricsRegistry()
+metrics.gauge('ocpp_connected_chargers', 'Chargers currently connected', function=lambda: len(connected_clients))
+metrics.gauge('ocpp_connected_chargers_peak', 'Max chargers connected at once', function=lambda: connected_clients.peak)
+metrics.gauge(
+    'ocpp_in_flight_calls', 'Calls from chargers being handled', function=lambda: global_call_limiter.in_flight
+)
+metrics.gauge(
+    'ocpp_outbound_calls_in_flight',
+    'Calls to chargers waiting for a response',
+    function=lambda: outbound_calls.in_flight
+)
+metrics.counter('ocpp_outbound_retries_total', 'Calls to chargers retried', function=lambda: outbound_calls.retried)
+metrics.counter(
+    'ocpp_outbound_failures_total', 'Calls to chargers failed after all retries', function=lambda: outbound_calls.failed
+)
+connections_metric = metrics.counter('ocpp_connections_total', 'Connections accepted')
+boots_metric = metrics.counter('ocpp_boot_notifications_total', 'Boot notifications by status', ('status',))
+rejected_calls_metric = metrics.counter('ocpp_rejected_calls_total', 'Calls rejected by the rate limiter')
+metrics.gauge(
+    'ocpp_active_transactions', 'Transactions kept in memory', function=lambda: len(transaction_store.transactions)
+)
+metrics.counter('ocpp_meter_samples_total', 'Meter samples received', function=lambda: transaction_store.samples_total)
+metrics.counter(
+    'ocpp_transaction_flush_failures_total', 'Batches of transactions that failed to be written',
+    function=lambda: transaction_store.failed_flushes
+)
+metrics.counter(
+    'ocpp_meter_samples_dropped_total', 'Meter samples dropped while they could not be written',
+    function=lambda: transaction_store.dropped_samples
+)
+handler_latency_metric = metrics.histogram('ocpp_handler_seconds', 'Time spent handling calls', ('action',))
+reservation_lag_metric = metrics.histogram(
+    'ocpp_reservation_dispatch_lag_seconds',
+    'Time from reservation insertion in DB to ReserveNow sent to the charger',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300)
+)
+db_query_metric = metrics.histogram('ocpp_db_query_seconds', 'Time spent in DB queries', ('query',))
+loop_lag_metric = metrics.gauge('ocpp_event_loop_lag_seconds', 'Delay of the event loop in waking up from a sleep')
 
 
 def _get_current_time() -> str:
-    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S") + "Z"
+    return default_clock.timestamp()
 
 
 def _get_personal_message(message: str) -> dict:
@@ -42,94 +183,126 @@ def _get_personal_message(message: str) -> dict:
 
 # Check if user can be authorized
 def _check_authorized(id_token: Dict) -> str:
-    # Check if type is correct
-    if id_token['type'] not in ('Central', 'eMAID', 'ISO14443', 'ISO15693'):
-        return 'Unknown'
+    return ACCEPTED_TOKENS.check(id_token)
 
-    # Check if token is hexadecimal
-    try:
-        # Check if it can be converted to int from base 16
-        int(id_token['id_token'], 16)
-    except ValueError:
-        return 'Unknown'
-
-    # Check if it respects the specs of the type
-    if id_token['type'] == 'Central':
-        # Everything is accepted
-        pass
-
-    elif id_token['type'] == 'eMAID':
-        # Not allowed in this implementation
-        return 'Invalid'
-
-    elif id_token['type'] == 'ISO14443':
-        # Check if length is either 4 or 7 bytes
-        if len(id_token['id_token']) != 8 and len(id_token['id_token']) != 14:
-            return 'Invalid'
-
-    elif id_token['type'] == 'ISO15693':
-        # Check if length is 8 bytes
-        if len(id_token['id_token']) != 16:
-            return 'Invalid'
 
-    else:
-        return 'Unknown'
+# Check if new CP is authorized based on vendor, model and serial number
+def _check_charger(vendor_name: str, model: str, serial_number: str) -> bool:
+    return ACCEPTED_CHARGES.check(vendor_name, model, serial_number)
 
-    # Check if token is in allowed list
-    for i in ACCEPTED_TOKENS:
-        if i['type'] == id_token['type'] and i['id_token'] == id_token['id_token']:
-            return 'Accepted'
 
-    # If no matching token was found in list
-    return 'Invalid'
+def _get_charging_message(charging_state: str) -> str:
+    if charging_state == "Charging":
+        return "Charging started"
+    elif charging_state in ("SuspendedEV", "SuspendedEVSE"):
+        return "Charging suspended"
+    elif charging_state == "Idle":
+        return "Charging stopped"
+    else:
+        return "Unknown"
 
 
-# Check if new CP is authorized based on vendor, model and serial number
-def _check_charger(vendor_name: str, model: str, serial_number: str) -> bool:
-    for i in ACCEPTED_CHARGES:
-        # Check if vendor_name and model match
-        if i['vendor_name'] == vendor_name and i['model'] == model:
-            # Check if regex matches
-            if re.match(i['serial_number_regex'], serial_number):
-                return True
+class ChargePointServer(Cp):
 
-    # If no model match, return False
-    return False
+    def __init__(self, id, connection, *args, **kwargs):
+        super().__init__(id, connection, *args, **kwargs)
 
+        self.is_booted = False
+        self.is_authorized = False
+        self.status = 'Available'
+        self.charging_state = 'Idle'
 
-class ChargePointServer(Cp):
+        # Time of the last message received, idle clients are closed by a single shared task
+        self.last_seen = default_clock.monotonic()
 
-    is_booted: bool = False
-    is_authorized: bool = False
-    status: str = 'Available'
-    charging_state: str = 'Idle'
+        # Limits the calls of this client, and of all clients together through the global limiter. Calls of a client
+        # are handled one at a time, so only the global limiter caps the calls in flight
+        self.call_limiter = CallLimiter(CALLS_PER_SECOND, CALLS_BURST, parent=global_call_limiter)
 
-    last_reservation_id = 0
+        # Session in the capture file, when frames are recorded
+        self.capture_session: Optional[int] = None
 
-    # Periodically check for new reservation requests
-    async def _check_reservations(self, interval: int = 1):
-        while True:
-            # Get first reserve_now event
-            data = get_event('reserve_now', target=self.id, first_acceptable_id=self.last_reservation_id + 1)
+    async def route_message(self, raw_msg):
+        self.last_seen = default_clock.monotonic()
 
-            # If event is there
-            if data is not None:
-                logging.info(f"Processing event reserve_now with data {data}")
+        if capture is not None:
+            capture.record(self.capture_session, INBOUND, raw_msg)
 
-                event_id, token = data
+        # Responses to calls made by the server are not limited
+        if not raw_msg.lstrip('[ \t\r\n').startswith('2'):
+            return await super().route_message(raw_msg)
 
-                # Send ReserveNow payload
-                await self.send_reserve_now(
-                    id=event_id,
-                    expiry_date_time=(datetime.utcnow() + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S") + "Z",
-                    id_token=token
+        # Reject calls over the limit right away, without handling them
+        if not self.call_limiter.try_acquire():
+            try:
+                msg = unpack(raw_msg)
+            except OCPPError as e:
+                logging.error(
+                    "Client %s sent an invalid message: %s", self.id, e, extra={'charger': self.id, 'kind': 'invalid'}
                 )
+                return
+
+            logging.warning(
+                "Client %s is over the call limit, rejecting %s", self.id, msg.action,
+                extra={'charger': self.id, 'kind': 'rate_limited'}
+            )
+            rejected_calls_metric.inc()
+
+            return await self._send(
+                msg.create_call_error(GenericError(description='Too many requests, try again later')).to_json()
+            )
+
+        try:
+            # Frequent calls are handled without the library when possible
+            if FAST_CODEC_ENABLED:
+                start = time.perf_counter()
+                handled = fast_codec.handle(self, raw_msg)
+
+                if handled is not None:
+                    action, response = handled
+                    handler_latency_metric.observe(time.perf_counter() - start, action)
+
+                    return await self._send(response)
+
+            return await super().route_message(raw_msg)
+        finally:
+            self.call_limiter.release()
+
+    async def _send(self, message):
+        if capture is not None:
+            capture.record(self.capture_session, OUTBOUND, message)
+
+        return await super()._send(message)
+
+    async def _handle_call(self, msg):
+        start = time.perf_counter()
+
+        try:
+            return await super()._handle_call(msg)
+        finally:
+            # Actions are sent by clients, only those with a handler get their own label so that labels stay bounded
+            action = msg.action if msg.action in self.route_map else 'other'
+            handler_latency_metric.observe(time.perf_counter() - start, action)
+
+    # Sends a reservation event to the CP, called by the dispatcher. Returns the status of the response
+    async def deliver_reservation(self, event_id: int, token: Dict[str, str], created_at: datetime) -> str:
+        logging.info(
+            "Processing event reserve_now with data %s", token, extra={'charger': self.id, 'kind': 'reservation'}
+        )
+
+        expiry = default_clock.now() + timedelta(seconds=RESERVATION_EXPIRY)
+
+        # Lag is measured up to the send, whatever the charger answers and however long it takes to
+        reservation_lag_metric.observe((datetime.utcnow() - created_at).total_seconds())
 
-                # Set new last reservation id to current id
-                self.last_reservation_id = event_id
+        # Send ReserveNow payload
+        response = await self.send_reserve_now(
+            id=event_id,
+            expiry_date_time=expiry.strftime("%Y-%m-%dT%H:%M:%S") + "Z",
+            id_token=token
+        )
 
-            # Wait for set time
-            await asyncio.sleep(interval)
+        return response.status
 
     @on("BootNotification")
     def on_boot_notification(
@@ -138,10 +311,14 @@ class ChargePointServer(Cp):
         reason: str,
         custom_data: Optional[Dict[str, Any]] = None
     ):
-        logging.info(f"Got boot notification from {charging_station} for reason {reason}")
+        logging.info(
+            "Got boot notification from %s for reason %s", charging_station, reason,
+            extra={'charger': self.id, 'kind': 'boot'}
+        )
 
         # Check if new CP has valid vendor, model and serial number
         self.is_booted = _check_charger(**charging_station)
+        boots_metric.inc('Accepted' if self.is_booted else 'Rejected')
 
         return call_result.BootNotificationPayload(
             current_time=_get_current_time(),
@@ -173,7 +350,7 @@ class ChargePointServer(Cp):
         iso15118_certificate_hash_data: Optional[List] = None,
         custom_data: Optional[Dict[str, Any]] = None
     ):
-        logging.info(f"Got authorization request from {id_token}")
+        logging.info("Got authorization request from %s", id_token, extra={'charger': self.id, 'kind': 'authorize'})
 
         return call_result.AuthorizePayload(id_token_info={"status": _check_authorized(id_token)})
 
@@ -207,7 +384,25 @@ class ChargePointServer(Cp):
         id_token: Optional[Dict] = None,
         custom_data: Optional[Dict[str, Any]] = None
     ):
-        logging.info(f"Got transaction event {event_type} because of {trigger_reason} with id {transaction_info['transaction_id']}")
+        logging.info(
+            "Got transaction event %s because of %s with id %s", event_type, trigger_reason,
+            transaction_info['transaction_id'], extra={'charger': self.id, 'kind': 'transaction'}
+        )
+
+        # Keep the state of the transaction and its meter values, given as sent by the charger
+        payload = {
+            'event_type': event_type,
+            'timestamp': timestamp,
+            'trigger_reason': trigger_reason,
+            'seq_no': seq_no,
+            'transaction_info': transaction_info,
+            'meter_value': meter_value,
+            'evse': evse,
+            'id_token': id_token,
+        }
+        transaction_store.record(
+            self.id, snake_to_camel_case({key: value for key, value in payload.items() if value is not None})
+        )
 
         # When receiving an "Authorized" event
         if trigger_reason == "Authorized":
@@ -215,10 +410,13 @@ class ChargePointServer(Cp):
             # Check if authorized
             auth_result = _check_authorized(id_token)
             if auth_result != "Accepted":
-                logging.error(f"User is not authorized for reason {auth_result}")
+                logging.error(
+                    "User is not authorized for reason %s", auth_result,
+                    extra={'charger': self.id, 'kind': 'unauthorized'}
+                )
                 return call_result.AuthorizePayload(id_token_info={"status": auth_result})
 
-            logging.info(f"User is authorized")
+            logging.info("User is authorized", extra={'charger': self.id, 'kind': 'transaction'})
 
             # Set as authorized
             self.is_authorized = True
@@ -231,7 +429,7 @@ class ChargePointServer(Cp):
         # When receiving a "CablePluggedIn" event
         elif trigger_reason == "CablePluggedIn":
 
-            logging.info(f"Cable plugged in")
+            logging.info("Cable plugged in", extra={'charger': self.id, 'kind': 'transaction'})
 
             # Respond
             return call_result.TransactionEventPayload(
@@ -241,24 +439,17 @@ class ChargePointServer(Cp):
         # When receiving a "ChargingStateChanged" event
         elif trigger_reason == "ChargingStateChanged":
 
-            logging.info(f"Charging state changed to {transaction_info['charging_state']}")
+            logging.info(
+                "Charging state changed to %s", transaction_info['charging_state'],
+                extra={'charger': self.id, 'kind': 'transaction'}
+            )
 
             # Set correct charging state
             self.charging_state = transaction_info['charging_state']
 
-            # Get correct charging message
-            if self.charging_state == "Charging":
-                message = "Charging started"
-            elif self.charging_state in ("SuspendedEV", "SuspendedEVSE"):
-                message = "Charging suspended"
-            elif self.charging_state == "Idle":
-                message = "Charging stopped"
-            else:
-                message = "Unknown"
-
             # Respond
             return call_result.TransactionEventPayload(
-                updated_personal_message=_get_personal_message(message)
+                updated_personal_message=_get_personal_message(_get_charging_message(self.charging_state))
             )
 
         # When receiving any other event
@@ -276,7 +467,7 @@ class ChargePointServer(Cp):
         group_id_token: Optional[Dict] = None,
         custom_data: Optional[Dict[str, Any]] = None
     ):
-        await self.call(call.ReserveNowPayload(
+        return await outbound_calls.call(self, call.ReserveNowPayload(
             id=id,
             expiry_date_time=expiry_date_time,
             id_token=id_token,
@@ -287,19 +478,95 @@ class ChargePointServer(Cp):
         ))
 
 
+# Fast path of frequent calls, it must behave like the matching handlers of ChargePointServer
+fast_codec = FastCodec()
+
+
+# Bodies of TransactionEvent responses, serialized once
+def _get_personal_message_body(message: str) -> str:
+    return dumps({'updatedPersonalMessage': _get_personal_message(message)})
+
+
+_CABLE_PLUGGED_IN_BODY = _get_personal_message_body('Cable is plugged in')
+_NOT_IMPLEMENTED_BODY = _get_personal_message_body('Not implemented')
+_CHARGING_MESSAGE_BODIES = {
+    state: _get_personal_message_body(_get_charging_message(state))
+    for state in ('Charging', 'EVConnected', 'SuspendedEV', 'SuspendedEVSE', 'Idle')
+}
+
+
+@fast_codec.register('Heartbeat', HEARTBEAT)
+def _fast_heartbeat(cp: ChargePointServer, payload: dict) -> Optional[str]:
+    return current_time_body()
+
+
+@fast_codec.register('StatusNotification', STATUS_NOTIFICATION)
+def _fast_status_notification(cp: ChargePointServer, payload: dict) -> Optional[str]:
+    cp.status = payload['connectorStatus']
+
+    return '{}'
+
+
+@fast_codec.register('TransactionEvent', TRANSACTION_EVENT)
+def _fast_transaction_event(cp: ChargePointServer, payload: dict) -> Optional[str]:
+    trigger_reason = payload['triggerReason']
+    transaction_info = payload['transactionInfo']
+
+    # Authorization is rare, it's left to the library
+    if trigger_reason == "Authorized":
+        return None
+
+    # The handler of the library fails without the charging state, so that the error is reported by it
+    if trigger_reason == "ChargingStateChanged" and 'chargingState' not in transaction_info:
+        return None
+
+    logging.info(
+        "Got transaction event %s because of %s with id %s", payload['eventType'], trigger_reason,
+        transaction_info['transactionId'], extra={'charger': cp.id, 'kind': 'transaction'}
+    )
+
+    transaction_store.record(cp.id, payload)
+
+    if trigger_reason == "CablePluggedIn":
+        logging.info("Cable plugged in", extra={'charger': cp.id, 'kind': 'transaction'})
+
+        return _CABLE_PLUGGED_IN_BODY
+
+    if trigger_reason == "ChargingStateChanged":
+        logging.info(
+            "Charging state changed to %s", transaction_info['chargingState'],
+            extra={'charger': cp.id, 'kind': 'transaction'}
+        )
+
+        cp.charging_state = transaction_info['chargingState']
+
+        return _CHARGING_MESSAGE_BODIES[cp.charging_state]
+
+    return _NOT_IMPLEMENTED_BODY
+
+
+# Called before the websocket handshake, rejects new clients if they can't be admitted
+async def process_request(path, request_headers):
+    reason = admission_controller.admit()
+
+    if reason is not None:
+        logging.warning("Rejected new client because of %s", reason, extra={'kind': 'admission'})
+        return HTTPStatus.SERVICE_UNAVAILABLE, [('Retry-After', '1')], b'Server is overloaded\n'
+
+    return None
+
+
 async def on_connect(websocket, path):
     # Check if protocol is specified
-    try:
-        requested_protocols = websocket.request_headers["Sec-WebSocket-Protocol"]
-    except KeyError:
+    if "Sec-WebSocket-Protocol" not in websocket.request_headers:
         logging.error("Client hasn't requested any protocol. Closing Connection")
         return await websocket.close()
 
     # Check if protocol matches with the one on the server
     if websocket.subprotocol:
-        logging.info("Protocols Matched: %s", websocket.subprotocol)
+        logging.info("Protocols Matched: %s", websocket.subprotocol, extra={'kind': 'connect'})
     else:
-        logging.error(f"Protocols Mismatched: client is using {websocket.subprotocol}. Closing connection")
+        logging.error("Protocols Mismatched: client is using %s. Closing connection", websocket.subprotocol)
         return await websocket.close()
 
     # Get id from path
@@ -309,27 +576,47 @@ async def on_connect(websocket, path):
     cp = ChargePointServer(charge_point_id, websocket)
 
     # If only one CP per id is allowed, check it doesn't exist
-    if not ALLOW_MULTIPLE_SERIAL_NUMBERS:
-        for cp_id, cp in connected_clients:
-            if cp_id == charge_point_id:
-                logging.error(f"Client tried to connect with ID {cp_id}, but another client already exists")
-                return await websocket.close()
+    if not ALLOW_MULTIPLE_SERIAL_NUMBERS and charge_point_id in connected_clients:
+        logging.error("Client tried to connect with ID %s, but another client already exists", charge_point_id)
+        return await websocket.close()
+
+    # Other handshakes may have been completed in the meantime, check the limit again
+    if admission_controller.is_full():
+        logging.error("Server is full, closing connection", extra={'kind': 'admission'})
+        return await websocket.close(code=1013, reason='Try again later')
 
-    # Add to list of connected clients
-    connected_clients.append((charge_point_id, cp))
+    # When running with more workers, claim the id on the coordinator, so that it's checked across all of them
+    if shard_client is not None and not await shard_client.claim(charge_point_id, not ALLOW_MULTIPLE_SERIAL_NUMBERS):
+        logging.error("Client tried to connect with ID %s, but another worker already has it", charge_point_id)
+        return await websocket.close()
 
-    if len(connected_clients) >= MAX_CONNECTED_CLIENTS:
-        logging.error("Server is overloaded, quitting")
-        quit(2)
+    # Record frames of the session from now on
+    if capture is not None:
+        cp.capture_session = capture.open_session(charge_point_id)
 
-    # Start and await for disconnection
     try:
-        await asyncio.gather(cp.start(), cp._check_reservations())
-    except websockets.exceptions.ConnectionClosed:
-        logging.info(f"Client {charge_point_id} disconnected")
+        # Add to list of connected clients until disconnection, whatever the reason
+        with connected_clients.session(charge_point_id, cp):
+            connections_metric.inc()
+
+            # Let the new CP catch up with reservations written before it connected
+            reservation_dispatcher.wake(charge_point_id)
+
+            # Start and await for disconnection
+            try:
+                await cp.start()
+            except websockets.exceptions.ConnectionClosed:
+                logging.info("Client %s disconnected", charge_point_id, extra={'kind': 'disconnect'})
+    finally:
+        if capture is not None:
+            capture.close_session(cp.capture_session)
 
-        # Remove from list of connected clients
-        connected_clients.remove((charge_point_id, cp))
+        # Nothing is delivered to the id anymore once its last session is gone
+        if charge_point_id not in connected_clients:
+            reservation_dispatcher.forget(charge_point_id)
+
+        if shard_client is not None:
+            shard_client.release(charge_point_id)
 
 
 def load_config() -> bool:
@@ -338,6 +625,42 @@ def load_config() -> bool:
     global ALLOW_MULTIPLE_SERIAL_NUMBERS
     global MAX_CONNECTED_CLIENTS
     global HEARTBEAT_INTERVAL
+    global IDLE_TIMEOUT
+    global WEBSOCKET_SETTINGS
+    global CONNECTION_PROFILE
+    global RESERVATION_POLL_INTERVAL
+    global RESERVATION_DELIVERY_POLICY
+    global RESERVATION_EXPIRY
+    global MAX_ACCEPTS_PER_SECOND
+    global MAX_ACCEPTS_BURST
+    global HIGH_WATERMARK
+    global LOW_WATERMARK
+    global CALLS_PER_SECOND
+    global CALLS_BURST
+    global GLOBAL_CALLS_PER_SECOND
+    global GLOBAL_CALLS_BURST
+    global GLOBAL_MAX_IN_FLIGHT_CALLS
+    global SERVER_HOST
+    global SERVER_PORT
+    global WORKERS
+    global FAST_CODEC_ENABLED
+    global CAPTURE_ENABLED
+    global CAPTURE_PATH
+    global CAPTURE_FLUSH_INTERVAL
+    global METRICS_ENABLED
+    global METRICS_HOST
+    global METRICS_PORT
+    global API_ENABLED
+    global API_HOST
+    global API_PORT
+    global API_RESPONSE_TIMEOUT
+    global LOG_LEVEL
+    global LOG_JSON
+    global LOG_SAMPLE_LIMIT
+    global LOG_SAMPLE_WINDOW
+    global event_retention
+    global transaction_store
+    global outbound_calls
 
     # Open server config file
     with open(SERVER_CONFIG_FILE, "r") as file:
@@ -346,12 +669,20 @@ def load_config() -> bool:
             content = yaml.safe_load(file)
 
             # Set accepted tokens
+            ACCEPTED_TOKENS = TokenIndex()
+
             if "accepted_tokens" in content:
-                ACCEPTED_TOKENS = content["accepted_tokens"]
+                ACCEPTED_TOKENS.add_all(content["accepted_tokens"])
+
+            # Load accepted tokens from an external allow-list (CSV or binary token file)
+            if "accepted_tokens_file" in content:
+                ACCEPTED_TOKENS.load_file(content["accepted_tokens_file"])
 
             # Set accepted chargers
+            ACCEPTED_CHARGES = ChargerMatcher()
+
             if "accepted_chargers" in content:
-                ACCEPTED_CHARGES = content["accepted_chargers"]
+                ACCEPTED_CHARGES.add_all(content["accepted_chargers"])
 
             # Set security parameters
             if "security" in content:
@@ -361,9 +692,157 @@ def load_config() -> bool:
                 if "max_connected_clients" in content["security"]:
                     MAX_CONNECTED_CLIENTS = content["security"]["max_connected_clients"]
 
+                if "max_accepts_per_second" in content["security"]:
+                    MAX_ACCEPTS_PER_SECOND = content["security"]["max_accepts_per_second"]
+
+                if "max_accepts_burst" in content["security"]:
+                    MAX_ACCEPTS_BURST = content["security"]["max_accepts_burst"]
+
+                if "high_watermark" in content["security"]:
+                    HIGH_WATERMARK = content["security"]["high_watermark"]
+
+                if "low_watermark" in content["security"]:
+                    LOW_WATERMARK = content["security"]["low_watermark"]
+
                 if "heartbeat_interval" in content["security"]:
                     HEARTBEAT_INTERVAL = content["security"]["heartbeat_interval"]
 
+                if "idle_timeout" in content["security"]:
+                    IDLE_TIMEOUT = content["security"]["idle_timeout"]
+
+                if "charger_cache_size" in content["security"]:
+                    ACCEPTED_CHARGES.cache_size = content["security"]["charger_cache_size"]
+
+            # Set reservation parameters
+            if "reservations" in content:
+                if "poll_interval" in content["reservations"]:
+                    RESERVATION_POLL_INTERVAL = content["reservations"]["poll_interval"]
+
+                if "expiry" in content["reservations"]:
+                    RESERVATION_EXPIRY = content["reservations"]["expiry"]
+
+                if "delivery_policy" in content["reservations"]:
+                    RESERVATION_DELIVERY_POLICY = content["reservations"]["delivery_policy"]
+
+                    if RESERVATION_DELIVERY_POLICY not in DELIVERY_POLICIES:
+                        print(f'Invalid reservation delivery policy, must be one of {", ".join(DELIVERY_POLICIES)}')
+                        return False
+
+            # Set server parameters
+            if "server" in content:
+                if "host" in content["server"]:
+                    SERVER_HOST = content["server"]["host"]
+
+                if "port" in content["server"]:
+                    SERVER_PORT = content["server"]["port"]
+
+                if "workers" in content["server"]:
+                    WORKERS = content["server"]["workers"]
+
+                if "fast_codec" in content["server"]:
+                    FAST_CODEC_ENABLED = content["server"]["fast_codec"]
+
+                if "connection_profile" in content["server"]:
+                    CONNECTION_PROFILE = content["server"]["connection_profile"]
+
+                    if CONNECTION_PROFILE not in CONNECTION_PROFILES:
+                        print(f'Invalid connection profile, must be one of {", ".join(CONNECTION_PROFILES)}')
+                        return False
+
+            # Set capture parameters
+            if "capture" in content:
+                if "enabled" in content["capture"]:
+                    CAPTURE_ENABLED = content["capture"]["enabled"]
+
+                if "path" in content["capture"]:
+                    CAPTURE_PATH = content["capture"]["path"]
+
+                if "flush_interval" in content["capture"]:
+                    CAPTURE_FLUSH_INTERVAL = content["capture"]["flush_interval"]
+
+            # Set websocket parameters, over those of the connection profile
+            if CONNECTION_PROFILE == 'compact':
+                WEBSOCKET_SETTINGS = {**WEBSOCKET_SETTINGS, **COMPACT_WEBSOCKET_SETTINGS}
+
+                if "idle_timeout" not in content.get("security", {}):
+                    IDLE_TIMEOUT = COMPACT_IDLE_TIMEOUT
+
+            if "websocket" in content:
+                WEBSOCKET_SETTINGS = {**WEBSOCKET_SETTINGS, **content["websocket"]}
+
+            # Set reservation API parameters
+            if "api" in content:
+                if "enabled" in content["api"]:
+                    API_ENABLED = content["api"]["enabled"]
+
+                if "host" in content["api"]:
+                    API_HOST = content["api"]["host"]
+
+                if "port" in content["api"]:
+                    API_PORT = content["api"]["port"]
+
+                if "response_timeout" in content["api"]:
+                    API_RESPONSE_TIMEOUT = content["api"]["response_timeout"]
+
+            # Set logging parameters
+            if "logging" in content:
+                if "level" in content["logging"]:
+                    LOG_LEVEL = content["logging"]["level"]
+
+                if "json" in content["logging"]:
+                    LOG_JSON = content["logging"]["json"]
+
+                if "sample_limit" in content["logging"]:
+                    LOG_SAMPLE_LIMIT = content["logging"]["sample_limit"]
+
+                if "sample_window" in content["logging"]:
+                    LOG_SAMPLE_WINDOW = content["logging"]["sample_window"]
+
+            # Set metrics parameters
+            if "metrics" in content:
+                if "enabled" in content["metrics"]:
+                    METRICS_ENABLED = content["metrics"]["enabled"]
+
+                if "host" in content["metrics"]:
+                    METRICS_HOST = content["metrics"]["host"]
+
+                if "port" in content["metrics"]:
+                    METRICS_PORT = content["metrics"]["port"]
+
+            # Set rate limiting parameters
+            if "rate_limits" in content:
+                if "calls_per_second" in content["rate_limits"]:
+                    CALLS_PER_SECOND = content["rate_limits"]["calls_per_second"]
+
+                if "calls_burst" in content["rate_limits"]:
+                    CALLS_BURST = content["rate_limits"]["calls_burst"]
+
+                if "global_calls_per_second" in content["rate_limits"]:
+                    GLOBAL_CALLS_PER_SECOND = content["rate_limits"]["global_calls_per_second"]
+
+                if "global_calls_burst" in content["rate_limits"]:
+                    GLOBAL_CALLS_BURST = content["rate_limits"]["global_calls_burst"]
+
+                if "global_max_in_flight_calls" in content["rate_limits"]:
+                    GLOBAL_MAX_IN_FLIGHT_CALLS = content["rate_limits"]["global_max_in_flight_calls"]
+
+            # Set parameters of calls to chargers
+            if "outbound_calls" in content:
+                outbound_calls = OutboundCalls(**content["outbound_calls"])
+
+            # Set retention parameters
+            if "retention" in content:
+                event_retention = EventRetention(**content["retention"])
+
+            # Set transaction store parameters
+            if "transactions" in content:
+                transaction_store = TransactionStore(**content["transactions"])
+
+            # Workers only know their own sessions, so they can't tell which session of an id is the newest or oldest
+            if WORKERS > 1 and RESERVATION_DELIVERY_POLICY != 'all':
+                print('The reservation delivery policy must be all when running more than one worker')
+                return False
+
         except yaml.YAMLError as e:
             print('Failed to parse server_config.yaml')
             return False
@@ -371,22 +850,206 @@ def load_config() -> bool:
         return True
 
 
-async def main():
-    # Load config file
-    if not load_config():
-        quit(1)
+async def _close_idle_clients():
+    deadline = default_clock.monotonic() - IDLE_TIMEOUT
 
-    # Purge DB
-    purge_events()
+    idle = [
+        cp for charge_point_id in list(connected_clients.ids())
+        for cp in connected_clients.get(charge_point_id) if cp.last_seen < deadline
+    ]
+
+    for cp in idle:
+        logging.warning("Client %s is idle, closing connection", cp.id, extra={'charger': cp.id, 'kind': 'idle'})
+
+    await asyncio.gather(*(cp._connection.close() for cp in idle), return_exceptions=True)
+
+
+# Accepts clients until the server is closed, reuse_port lets more workers share the same port
+# Share of a limit on a count given to each worker. Every worker gets at least 1 out of a positive limit, so limits
+# lower than the number of workers are slightly exceeded rather than turned into 0 (which may mean unlimited)
+def _worker_share(limit: int) -> int:
+    return max(1, limit // WORKERS) if limit > 0 else limit
+
+
+async def serve(reuse_port: bool = False, worker_index: int = 0):
+    global admission_controller
+    global global_call_limiter
+    global capture
+
+    # Record frames exchanged with clients, every worker in its own file
+    if CAPTURE_ENABLED:
+        capture = CaptureWriter(CAPTURE_PATH if WORKERS == 1 else f'{CAPTURE_PATH}.{worker_index}', SIDE_SERVER)
+        default_wheel.schedule_periodic(CAPTURE_FLUSH_INTERVAL, capture.flush)
+
+    # Set up admission control from config, connections are split evenly between workers
+    admission_controller = AdmissionController(
+        connected_clients,
+        _worker_share(MAX_CONNECTED_CLIENTS),
+        MAX_ACCEPTS_PER_SECOND / WORKERS,
+        MAX_ACCEPTS_BURST,
+        HIGH_WATERMARK,
+        LOW_WATERMARK
+    )
+
+    # Set up the limiter shared by all clients
+    global_call_limiter = CallLimiter(
+        GLOBAL_CALLS_PER_SECOND / WORKERS, GLOBAL_CALLS_BURST, _worker_share(GLOBAL_MAX_IN_FLIGHT_CALLS)
+    )
+
+    # Reservations are sent to the sessions chosen by the policy
+    reservation_dispatcher.policy = RESERVATION_DELIVERY_POLICY
+
+    # Serve metrics, every worker on its own port
+    if METRICS_ENABLED:
+        set_query_observer(lambda query, seconds: db_query_metric.observe(seconds, query))
+        await start_metrics_server(metrics, METRICS_HOST, METRICS_PORT + worker_index)
+        loop_lag_task = asyncio.create_task(monitor_event_loop_lag(loop_lag_metric))
+
+    # Close clients that went silent, all of them are checked by a single periodic job
+    if IDLE_TIMEOUT > 0:
+        default_wheel.schedule_periodic(IDLE_TIMEOUT / 2, _close_idle_clients)
+
+    # Hand buffered transactions and meter values to the writer thread, and forget transactions that went silent
+    default_wheel.schedule_periodic(transaction_store.flush_interval, transaction_store.flush)
+    default_wheel.schedule_periodic(transaction_store.max_idle / 2, transaction_store.evict_idle)
 
     # Start websocket with callback function
     server = await websockets.serve(
-        on_connect, "::", 9000, subprotocols=[Subprotocol("ocpp2.0.1")]
+        on_connect,
+        SERVER_HOST,
+        SERVER_PORT,
+        subprotocols=[Subprotocol("ocpp2.0.1")],
+        process_request=process_request,
+        reuse_port=reuse_port,
+        **WEBSOCKET_SETTINGS
     )
 
+    # Stop gracefully when terminated (e.g. by the coordinator, systemd or docker stop), so that buffered transactions
+    # and captured frames are written
+    loop = asyncio.get_running_loop()
+
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, server.close)
+
     # Wait for server to be closed down
     await server.wait_closed()
 
+    transaction_store.close()
+
+    if capture is not None:
+        capture.close()
+
+    if METRICS_ENABLED:
+        loop_lag_task.cancel()
+
+
+async def worker_main(worker_index: int):
+    global shard_client
+
+    # Connect to the coordinator before accepting clients
+    shard_client = ShardClient(reservation_dispatcher.wake)
+    await shard_client.connect()
+
+    await serve(reuse_port=True, worker_index=worker_index)
+
+
+def _start_logging():
+    # Logs are written by a background thread
+    return setup_logging(LOG_LEVEL, LOG_JSON, LOG_SAMPLE_LIMIT, LOG_SAMPLE_WINDOW)
+
+
+def _run_worker(worker_index: int):
+    # Workers are spawned as new processes, so they need to load the config again
+    if not load_config():
+        quit(1)
+
+    log_listener = _start_logging()
+
+    try:
+        asyncio.run(worker_main(worker_index))
+    finally:
+        log_listener.stop()
+
+
+async def coordinator_main():
+    coordinator = Coordinator()
+    await coordinator.start()
+
+    # The coordinator polls reservations for all workers
+    dispatcher = CoordinatorDispatcher(coordinator, interval=RESERVATION_POLL_INTERVAL)
+    dispatcher_task = asyncio.create_task(dispatcher.run())
+
+    # Start removing delivered events in background
+    retention_task = asyncio.create_task(event_retention.run())
+
+    # Serve the reservation API, reservations are handed to workers through the coordinator
+    if API_ENABLED:
+        api = ReservationApi(coordinator.wake, None, API_RESPONSE_TIMEOUT)
+        await api.start(API_HOST, API_PORT)
+
+    # Spawn workers, all sharing the same port
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=_run_worker, args=(i,), name=f'worker-{i}') for i in range(WORKERS)]
+
+    for worker in workers:
+        worker.start()
+
+    logging.info("Started %s workers on port %s", WORKERS, SERVER_PORT)
+
+    # Workers are stopped along with the coordinator, each of them shuts down gracefully on SIGTERM
+    def stop_workers():
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    loop = asyncio.get_running_loop()
+
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, stop_workers)
+
+    # Wait for all workers to stop
+    while any(worker.is_alive() for worker in workers):
+        await asyncio.sleep(1)
+
+    dispatcher_task.cancel()
+    retention_task.cancel()
+    coordinator.close()
+
+
+async def main():
+    # Purge DB
+    purge_events()
+
+    # With more workers, this process only coordinates them
+    if WORKERS > 1:
+        return await coordinator_main()
+
+    # Start the shared reservation poller
+    reservation_dispatcher.interval = RESERVATION_POLL_INTERVAL
+    dispatcher_task = asyncio.create_task(reservation_dispatcher.run())
+
+    # Start removing delivered events in background
+    retention_task = asyncio.create_task(event_retention.run())
+
+    # Serve the reservation API, reservations are handed to clients right away
+    if API_ENABLED:
+        api = ReservationApi(reservation_dispatcher.wake, reservation_dispatcher, API_RESPONSE_TIMEOUT)
+        await api.start(API_HOST, API_PORT)
+
+    await serve()
+
+    dispatcher_task.cancel()
+    retention_task.cancel()
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Load config file
+    if not load_config():
+        quit(1)
+
+    main_log_listener = _start_logging()
+
+    try:
+        asyncio.run(main())
+    finally:
+        main_log_listener.stop()
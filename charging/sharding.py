@@ -0,0 +1,163 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+from typing import Callable, Dict, Optional
+
+from dispatcher import ReservationDispatcher
+
+
+SOCKET_PATH = 'charging/shards.sock'
+
+
+def _write_message(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json.dumps(message).encode() + b'\n')
+
+
+# Runs in the parent process: keeps track of the sessions of every worker, enforces unique serial numbers across
+# workers and routes reservations to the workers holding the target
+class Coordinator:
+
+    def __init__(self, path: str = SOCKET_PATH):
+        self.path = path
+
+        # Number of sessions with a given id, by worker
+        self._owners: Dict[str, Dict[asyncio.StreamWriter, int]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+        self.connections = 0
+
+    async def start(self):
+        # Remove socket left by a previous run
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self._server = await asyncio.start_unix_server(self._handle_worker, self.path)
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    def _claim(self, worker: asyncio.StreamWriter, charge_point_id: str, unique: bool) -> bool:
+        owners = self._owners.setdefault(charge_point_id, {})
+
+        # If the id must be unique, it can't be claimed by anyone else
+        if unique and owners:
+            return False
+
+        owners[worker] = owners.get(worker, 0) + 1
+        self.connections += 1
+
+        return True
+
+    def _release(self, worker: asyncio.StreamWriter, charge_point_id: str):
+        owners = self._owners.get(charge_point_id)
+
+        if owners is None or worker not in owners:
+            return
+
+        owners[worker] -= 1
+        self.connections -= 1
+
+        if owners[worker] == 0:
+            del owners[worker]
+
+        if not owners:
+            del self._owners[charge_point_id]
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        logging.info("Worker connected to coordinator")
+
+        try:
+            async for line in reader:
+                message = json.loads(line)
+
+                if message['op'] == 'claim':
+                    claimed = self._claim(writer, message['id'], message['unique'])
+                    _write_message(writer, {'op': 'claimed', 'request': message['request'], 'ok': claimed})
+
+                elif message['op'] == 'release':
+                    self._release(writer, message['id'])
+
+        finally:
+            logging.error("Worker disconnected from coordinator")
+
+            # Drop all sessions of the worker
+            for charge_point_id in list(self._owners):
+                while writer in self._owners.get(charge_point_id, {}):
+                    self._release(writer, charge_point_id)
+
+            writer.close()
+
+    # Wakes all sessions with the given id, in whatever worker they are
+    def wake(self, charge_point_id: str):
+        for writer in self._owners.get(charge_point_id, ()):
+            _write_message(writer, {'op': 'wake', 'id': charge_point_id})
+
+
+# Reservation poller of the coordinator: wakes targets through their workers
+class CoordinatorDispatcher(ReservationDispatcher):
+
+    def __init__(self, coordinator: Coordinator, *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
+        self.coordinator = coordinator
+
+    def wake(self, target_id: str):
+        self.coordinator.wake(target_id)
+
+
+# Runs in every worker: claims and releases ids on the coordinator and wakes local sessions when asked to
+class ShardClient:
+
+    def __init__(self, wake: Callable[[str], None], path: str = SOCKET_PATH):
+        self.wake = wake
+        self.path = path
+
+        self._requests = itertools.count()
+        self._pending: Dict[int, asyncio.Future] = {}
+
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._listen_task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        reader, self._writer = await asyncio.open_unix_connection(self.path)
+        self._listen_task = asyncio.create_task(self._listen(reader))
+
+    async def _listen(self, reader: asyncio.StreamReader):
+        async for line in reader:
+            message = json.loads(line)
+
+            if message['op'] == 'claimed':
+                future = self._pending.pop(message['request'], None)
+
+                if future is not None and not future.done():
+                    future.set_result(message['ok'])
+
+            elif message['op'] == 'wake':
+                self.wake(message['id'])
+
+        logging.error("Lost connection to coordinator")
+
+        # Without the coordinator, no claim can be answered
+        for future in self._pending.values():
+            if not future.done():
+                future.set_result(False)
+
+        self._pending.clear()
+
+    # Returns whether the id could be claimed (if unique, no other worker must hold it)
+    async def claim(self, charge_point_id: str, unique: bool) -> bool:
+        if self._listen_task is None or self._listen_task.done():
+            return False
+
+        request = next(self._requests)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request] = future
+
+        _write_message(self._writer, {'op': 'claim', 'request': request, 'id': charge_point_id, 'unique': unique})
+
+        return await future
+
+    def release(self, charge_point_id: str):
+        _write_message(self._writer, {'op': 'release', 'id': charge_point_id})
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Callable, Awaitable
+
+import websockets
+from websockets import Subprotocol
+
+from codec import loads, dumps
+from histogram import LatencyRecorder
+from scheduler import default_wheel
+
+
+# Websocket settings of simulated chargers: no compression context, no ping task and small buffers for every one
+CONNECT_SETTINGS = {
+    'compression': None,
+    'ping_interval': None,
+    'max_queue': 4,
+    'read_limit': 4096,
+    'write_limit': 4096,
+}
+
+# Frames sent by simulated chargers, serialized once: only the message id (and the serial number) is filled in
+HEARTBEAT_FRAME = '[2,"{}","Heartbeat",{{}}]'
+RESERVE_NOW_RESPONSE_FRAME = '[3,{},{{"status":"Accepted"}}]'
+NOT_IMPLEMENTED_FRAME = '[4,{},"NotImplemented","",{{}}]'
+
+# Round-trip time of the calls of all simulated chargers in this process, by action
+latencies = LatencyRecorder()
+
+
+def _get_boot_frame(serial_number: str, model: str, vendor_name: str) -> str:
+    charging_station = {'model': model, 'vendorName': vendor_name, 'serialNumber': serial_number}
+    return dumps([2, '0', 'BootNotification', {'chargingStation': charging_station, 'reason': 'PowerUp'}])
+
+
+# A charger speaking OCPP 2.0.1 over its own websocket, with as little as possible per charger: no ocpp ChargePoint,
+# a single task reading the websocket, and heartbeats sent by the shared timer wheel
+class SimulatedCharger:
+    __slots__ = (
+        'serial_number', 'websocket', 'boot_status', 'connect_latency', 'reservations', '_next_id', '_pending', '_boot'
+    )
+
+    def __init__(self, serial_number: str, websocket):
+        self.serial_number = serial_number
+        self.websocket = websocket
+
+        self.boot_status: Optional[str] = None
+        self.connect_latency: Optional[float] = None
+        self.reservations = 0
+
+        # Id of the next call, and action and start time of calls waiting for a response, by id
+        self._next_id = 1
+        self._pending: dict[str, tuple[str, float]] = {}
+
+        # Resolved with the payload of the BootNotification response
+        self._boot = asyncio.get_running_loop().create_future()
+
+    async def send_heartbeat(self):
+        unique_id = str(self._next_id)
+        self._next_id += 1
+
+        self._pending[unique_id] = ('Heartbeat', time.perf_counter())
+
+        try:
+            await self.websocket.send(HEARTBEAT_FRAME.format(unique_id))
+        except websockets.exceptions.ConnectionClosed:
+            self._pending.pop(unique_id, None)
+
+    def _handle_response(self, unique_id: str, payload, failed: bool = False):
+        # The only call with id 0 is the BootNotification
+        if unique_id == '0':
+            if not self._boot.done():
+                self._boot.set_result(None if failed else payload)
+            return
+
+        pending = self._pending.pop(unique_id, None)
+
+        if pending is None:
+            return
+
+        action, start = pending
+
+        if failed:
+            latencies.record_error(action)
+        else:
+            latencies.record(action, time.perf_counter() - start)
+
+    async def _handle_call(self, unique_id: str, action: str):
+        if action == 'ReserveNow':
+            self.reservations += 1
+            await self.websocket.send(RESERVE_NOW_RESPONSE_FRAME.format(dumps(unique_id)))
+        else:
+            await self.websocket.send(NOT_IMPLEMENTED_FRAME.format(dumps(unique_id)))
+
+    # Reads the websocket until it's closed
+    async def run(self):
+        try:
+            async for raw_msg in self.websocket:
+                try:
+                    message = loads(raw_msg)
+                    message_type, unique_id = message[0], message[1]
+                except (ValueError, IndexError, TypeError):
+                    logging.error("Charger %s got an invalid message", self.serial_number)
+                    continue
+
+                if message_type == 3:
+                    self._handle_response(unique_id, message[2])
+                elif message_type == 4:
+                    self._handle_response(unique_id, None, failed=True)
+                elif message_type == 2:
+                    await self._handle_call(unique_id, message[2])
+
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+        finally:
+            if not self._boot.done():
+                self._boot.set_result(None)
+
+    async def boot(self, model: str, vendor_name: str) -> Optional[dict]:
+        start = time.perf_counter()
+        await self.websocket.send(_get_boot_frame(self.serial_number, model, vendor_name))
+
+        response = await self._boot
+
+        if response is None:
+            latencies.record_error('BootNotification')
+        else:
+            latencies.record('BootNotification', time.perf_counter() - start)
+            self.boot_status = response.get('status')
+
+        return response
+
+
+# Connects a simulated charger and boots it, then keeps it connected until the server closes the connection. Works
+# like launch_client, the runnable is called once the charger is booted
+async def launch_simulated_charger(
+    serial_number: str,
+    model: str = 'Model',
+    vendor_name: str = 'Vendor',
+    server: str = "[::1]",
+    port: int = 9000,
+    async_runnable: Optional[Callable[[SimulatedCharger], Awaitable[None]]] = None,
+    **connect_kwargs
+) -> SimulatedCharger:
+    start = time.perf_counter()
+
+    async with websockets.connect(
+        f"ws://{server}:{port}/{serial_number}",
+        subprotocols=[Subprotocol("ocpp2.0.1")],
+        **{**CONNECT_SETTINGS, **connect_kwargs}
+    ) as ws:
+
+        charger = SimulatedCharger(serial_number, ws)
+        charger.connect_latency = time.perf_counter() - start
+
+        reader = asyncio.create_task(charger.run())
+
+        try:
+            response = await charger.boot(model, vendor_name)
+
+            if response is None or charger.boot_status != 'Accepted':
+                return charger
+
+            # Heartbeats of all chargers are sent by the shared timer wheel
+            heartbeat = default_wheel.schedule_periodic(response.get('interval') or 60, charger.send_heartbeat)
+
+            try:
+                if async_runnable is not None:
+                    await async_runnable(charger)
+
+                await reader
+            finally:
+                heartbeat.cancel()
+
+        finally:
+            reader.cancel()
+
+    return charger
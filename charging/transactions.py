@@ -0,0 +1,466 @@
+import logging
+import sqlite3
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from clock import default_clock
+from db import BatchWriter
+
+
+# Measurand of sampled values that don't give one (as in OCPP 2.0.1)
+DEFAULT_MEASURAND = 'Energy.Active.Import.Register'
+
+# Meter samples are written to a table per day (UTC) of the sample, so that old samples are dropped a table at a time
+PARTITION_PREFIX = 'MeterValues_'
+
+
+# Transaction ids are only unique per charger, transactions are keyed by (charger id, transaction id)
+TransactionKey = tuple[str, str]
+
+
+# State of a transaction, as told by the TransactionEvents of its charger
+class Transaction:
+    __slots__ = (
+        'transaction_id', 'charger_id', 'evse_id', 'id_token', 'started_at', 'updated_at', 'ended_at', 'seq_no',
+        'trigger_reason', 'charging_state', 'stopped_reason', 'meter_start', 'meter_stop', 'samples', 'last_seen'
+    )
+
+    def __init__(self, transaction_id: str, charger_id: str, started_at: str):
+        self.transaction_id = transaction_id
+        self.charger_id = charger_id
+        self.evse_id: Optional[int] = None
+        self.id_token: Optional[str] = None
+
+        self.started_at = started_at
+        self.updated_at = started_at
+        self.ended_at: Optional[str] = None
+
+        self.seq_no = -1
+        self.trigger_reason: Optional[str] = None
+        self.charging_state: Optional[str] = None
+        self.stopped_reason: Optional[str] = None
+
+        # First and last energy register values, and samples received since the last flush
+        self.meter_start: Optional[float] = None
+        self.meter_stop: Optional[float] = None
+        self.samples = 0
+
+        self.last_seen = default_clock.monotonic()
+
+    def to_row(self) -> tuple:
+        return (
+            self.transaction_id, self.charger_id, self.evse_id, self.id_token, self.started_at, self.updated_at,
+            self.ended_at, self.seq_no, self.trigger_reason, self.charging_state, self.stopped_reason,
+            self.meter_start, self.meter_stop, self.samples
+        )
+
+
+def _parse_timestamp(timestamp: str) -> datetime:
+    # OCPP timestamps end in Z, which fromisoformat only takes from Python 3.11
+    if timestamp.endswith('Z'):
+        timestamp = timestamp[:-1] + '+00:00'
+
+    value = datetime.fromisoformat(timestamp)
+
+    # Timestamps without offset are taken as UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+
+    return value.astimezone(timezone.utc)
+
+
+# Keeps the state of open transactions in memory and writes it, along with meter samples, to its own SQLite file. The
+# event loop only updates memory: writes are buffered and handed every flush_interval seconds (or once max_buffered
+# samples are waiting) to a writer thread, which commits them in a single transaction. Transactions are dropped from
+# memory once ended and committed, or once silent for max_idle seconds. Partitions of samples older than keep_days days
+# are dropped (0 keeps them all). If the file can't be opened, it's tried again after retry_interval seconds, doubled on
+# each failure up to max_retry_interval. Meanwhile at most max_unwritten samples are kept, the oldest are dropped
+class TransactionStore:
+
+    def __init__(
+        self,
+        path: str = 'charging/transactions.sqlite3',
+        flush_interval: float = 1,
+        max_buffered: int = 10_000,
+        keep_days: int = 30,
+        max_idle: float = 24 * 60 * 60,
+        max_unwritten: int = 1_000_000,
+        retry_interval: float = 1,
+        max_retry_interval: float = 60
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.keep_days = keep_days
+        self.max_idle = max_idle
+        self.max_unwritten = max_unwritten
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+
+        self.transactions: dict[TransactionKey, Transaction] = {}
+
+        self.samples_total = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped_samples = 0
+
+        # Transactions changed and samples received since the last flush, samples by partition
+        self._dirty: set[TransactionKey] = set()
+        self._samples: dict[str, list[tuple]] = {}
+        self._buffered = 0
+
+        # Writes handed to the writer and not settled yet, in order: the future of the write, the samples counted by
+        # each transaction written, the samples written and their number. Only the event loop settles them, as it owns
+        # the buffers
+        self._pending: list[tuple[Future, dict[TransactionKey, int], dict[str, list[tuple]], int]] = []
+
+        # The writer thread is only started on first flush
+        self._writer: Optional[BatchWriter] = None
+
+        # Day partitions were last pruned, only set once the prune is committed
+        self._pruned_day: Optional[str] = None
+
+        # Failed attempts in a row to open the file, and when (monotonic) it may be tried again
+        self._open_failures = 0
+        self._retry_at = 0.0
+
+    # Takes the payload of a TransactionEvent as sent by the charger (in camelCase)
+    def record(self, charger_id: str, payload: dict[str, Any]):
+        transaction_info = payload['transactionInfo']
+        key = (charger_id, transaction_info['transactionId'])
+
+        transaction = self.transactions.get(key)
+
+        if transaction is None:
+            transaction = Transaction(key[1], charger_id, payload['timestamp'])
+            self.transactions[key] = transaction
+
+        # Events sent again after being offline may arrive out of order, the state only follows newer ones
+        if payload['seqNo'] >= transaction.seq_no:
+            transaction.seq_no = payload['seqNo']
+            transaction.trigger_reason = payload['triggerReason']
+            transaction.updated_at = payload['timestamp']
+
+            if 'chargingState' in transaction_info:
+                transaction.charging_state = transaction_info['chargingState']
+
+            if 'stoppedReason' in transaction_info:
+                transaction.stopped_reason = transaction_info['stoppedReason']
+
+            if payload['eventType'] == 'Ended':
+                transaction.ended_at = payload['timestamp']
+
+        if 'evse' in payload:
+            transaction.evse_id = payload['evse']['id']
+
+        if 'idToken' in payload:
+            transaction.id_token = payload['idToken'].get('idToken')
+
+        for meter_value in payload.get('meterValue', ()):
+            self._add_samples(transaction, meter_value)
+
+        transaction.last_seen = default_clock.monotonic()
+        self._dirty.add(key)
+
+        if self._buffered >= self.max_buffered:
+            self.flush()
+
+        if self._buffered > self.max_unwritten:
+            self._drop_samples()
+
+    def _add_samples(self, transaction: Transaction, meter_value: dict[str, Any]):
+        try:
+            timestamp = _parse_timestamp(meter_value['timestamp'])
+        except ValueError:
+            logging.warning(
+                "Dropped meter value with invalid timestamp %s", meter_value['timestamp'],
+                extra={'charger': transaction.charger_id, 'kind': 'transaction'}
+            )
+            return
+
+        rows = self._samples.setdefault(timestamp.strftime('%Y%m%d'), [])
+        seconds = timestamp.timestamp()
+
+        for sampled_value in meter_value['sampledValue']:
+            measurand = sampled_value.get('measurand', DEFAULT_MEASURAND)
+            value = sampled_value['value']
+
+            rows.append((
+                transaction.charger_id, transaction.transaction_id, seconds, measurand, sampled_value.get('phase'),
+                sampled_value.get('context'), value, sampled_value.get('unitOfMeasure', {}).get('unit')
+            ))
+
+            # The energy register only goes up, whatever the order samples arrive in
+            if measurand == DEFAULT_MEASURAND:
+                if transaction.meter_start is None or value < transaction.meter_start:
+                    transaction.meter_start = value
+
+                if transaction.meter_stop is None or value > transaction.meter_stop:
+                    transaction.meter_stop = value
+
+        added = len(meter_value['sampledValue'])
+        transaction.samples += added
+        self.samples_total += added
+        self._buffered += added
+
+    # Drops the oldest samples over max_unwritten, the samples counted by their transactions still include them
+    def _drop_samples(self):
+        excess = self._buffered - self.max_unwritten
+
+        for partition in sorted(self._samples):
+            if excess <= 0:
+                break
+
+            rows = self._samples[partition]
+            dropped = min(excess, len(rows))
+            del rows[:dropped]
+
+            if not rows:
+                del self._samples[partition]
+
+            excess -= dropped
+            self._buffered -= dropped
+            self.dropped_samples += dropped
+
+    def _get_writer(self) -> BatchWriter:
+        if self._writer is None:
+            self._create_schema()
+            self._writer = BatchWriter(self.path)
+
+        return self._writer
+
+    def _create_schema(self):
+        connection = sqlite3.connect(self.path, isolation_level=None)
+
+        # WAL journaling lets readers work while the writer is committing
+        connection.execute('PRAGMA journal_mode=WAL;')
+
+        connection.execute("""
+        CREATE TABLE IF NOT EXISTS Transactions (
+            charger_id VARCHAR(255) NOT NULL,
+            transaction_id VARCHAR(36) NOT NULL,
+            evse_id INTEGER,
+            id_token VARCHAR(255),
+            started_at DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL,
+            ended_at DATETIME,
+            seq_no INTEGER NOT NULL,
+            trigger_reason VARCHAR(32),
+            charging_state VARCHAR(16),
+            stopped_reason VARCHAR(32),
+            meter_start REAL,
+            meter_stop REAL,
+            samples INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (charger_id, transaction_id)
+        );
+        """)
+
+        connection.execute('CREATE INDEX IF NOT EXISTS TransactionsByCharger ON Transactions (charger_id, started_at);')
+        connection.close()
+
+    # Partitions are created by the job writing to them, without caching which ones exist: a cache filled in a job that
+    # is then rolled back would claim tables that don't exist
+    @staticmethod
+    def _create_partition(connection: sqlite3.Connection, partition: str):
+        # Samples are read by transaction, in order of time
+        connection.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PARTITION_PREFIX}{partition} (
+            charger_id VARCHAR(255) NOT NULL,
+            transaction_id VARCHAR(36) NOT NULL,
+            timestamp REAL NOT NULL,
+            measurand VARCHAR(64) NOT NULL,
+            phase VARCHAR(8),
+            context VARCHAR(32),
+            value REAL NOT NULL,
+            unit VARCHAR(16)
+        );
+        """)
+
+        connection.execute(
+            f'CREATE INDEX IF NOT EXISTS {PARTITION_PREFIX}{partition}ByTransaction '
+            f'ON {PARTITION_PREFIX}{partition} (charger_id, transaction_id, timestamp);'
+        )
+
+    # Drops partitions older than keep_days days, at most once a day. Returns the day if partitions were pruned
+    def _prune_partitions(self, connection: sqlite3.Connection) -> Optional[str]:
+        today = default_clock.now()
+
+        if self.keep_days <= 0 or self._pruned_day == today.strftime('%Y%m%d'):
+            return None
+
+        oldest = (today - timedelta(days=self.keep_days)).strftime('%Y%m%d')
+
+        tables = [row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' and name LIKE ?;", (f'{PARTITION_PREFIX}%',)
+        )]
+
+        for table in tables:
+            if table.removeprefix(PARTITION_PREFIX) < oldest:
+                connection.execute(f'DROP TABLE {table};')
+
+        return today.strftime('%Y%m%d')
+
+    # Hands everything buffered to the writer thread without waiting for it to be committed, returns the future of the
+    # write (None if there was nothing to write)
+    def flush(self) -> Optional[Future]:
+        self._settle_flushes()
+
+        if not self._dirty and not self._samples:
+            return None
+
+        # Nothing is taken from the buffers unless the writer is there to take it, they are kept for the next flush
+        if self._writer is None and default_clock.monotonic() < self._retry_at:
+            return None
+
+        try:
+            writer = self._get_writer()
+        except (sqlite3.Error, OSError) as e:
+            self.failed_flushes += 1
+            self._open_failures += 1
+
+            delay = min(self.retry_interval * 2 ** (self._open_failures - 1), self.max_retry_interval)
+            self._retry_at = default_clock.monotonic() + delay
+
+            logging.error(
+                "Failed to open transaction store %s, trying again in %g seconds (%d meter samples dropped so far): %s",
+                self.path, delay, self.dropped_samples, e, extra={'kind': 'transaction'}
+            )
+            return None
+
+        self._open_failures = 0
+
+        rows = []
+        written: dict[TransactionKey, int] = {}
+
+        for key in self._dirty:
+            transaction = self.transactions.get(key)
+
+            if transaction is None:
+                continue
+
+            rows.append(transaction.to_row())
+            written[key] = transaction.samples
+            transaction.samples = 0
+
+        samples = self._samples
+        buffered = self._buffered
+
+        self._dirty = set()
+        self._samples = {}
+        self._buffered = 0
+
+        def job(connection: sqlite3.Connection) -> Optional[str]:
+            pruned_day = self._prune_partitions(connection)
+
+            for partition, partition_rows in samples.items():
+                self._create_partition(connection, partition)
+                connection.executemany(
+                    f'INSERT INTO {PARTITION_PREFIX}{partition} '
+                    '(charger_id, transaction_id, timestamp, measurand, phase, context, value, unit) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?);',
+                    partition_rows
+                )
+
+            # Transactions dropped from memory and seen again start over, what was written before is kept
+            connection.executemany("""
+            INSERT INTO Transactions (
+                transaction_id, charger_id, evse_id, id_token, started_at, updated_at, ended_at, seq_no,
+                trigger_reason, charging_state, stopped_reason, meter_start, meter_stop, samples
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (charger_id, transaction_id) DO UPDATE SET
+                evse_id=COALESCE(excluded.evse_id, evse_id),
+                id_token=COALESCE(excluded.id_token, id_token),
+                updated_at=excluded.updated_at,
+                ended_at=COALESCE(excluded.ended_at, ended_at),
+                seq_no=MAX(excluded.seq_no, seq_no),
+                trigger_reason=excluded.trigger_reason,
+                charging_state=COALESCE(excluded.charging_state, charging_state),
+                stopped_reason=COALESCE(excluded.stopped_reason, stopped_reason),
+                meter_start=MIN(
+                    COALESCE(excluded.meter_start, meter_start), COALESCE(meter_start, excluded.meter_start)
+                ),
+                meter_stop=MAX(
+                    COALESCE(excluded.meter_stop, meter_stop), COALESCE(meter_stop, excluded.meter_stop)
+                ),
+                samples=samples + excluded.samples;
+            """, rows)
+
+            return pruned_day
+
+        self.flushes += 1
+
+        future = writer.submit(job)
+        future.add_done_callback(self._on_flushed)
+        self._pending.append((future, written, samples, buffered))
+
+        return future
+
+    def _on_flushed(self, future: Future):
+        # Called from the writer thread
+        if future.exception() is not None:
+            self.failed_flushes += 1
+            logging.error("Failed to write transactions: %s", future.exception(), extra={'kind': 'transaction'})
+
+        elif future.result() is not None:
+            self._pruned_day = future.result()
+
+    # Applies the outcome of the writes committed (or failed) since the last call, in the order they were handed over
+    def _settle_flushes(self):
+        while self._pending and self._pending[0][0].done():
+            future, written, samples, buffered = self._pending.pop(0)
+
+            if future.exception() is None:
+                # Ended transactions are not needed in memory anymore once written, unless they changed meanwhile
+                for key in written:
+                    transaction = self.transactions.get(key)
+
+                    if transaction is not None and transaction.ended_at is not None and key not in self._dirty:
+                        del self.transactions[key]
+
+                continue
+
+            # Nothing of a failed write is lost, it's handed over again by the next flush
+            for key, count in written.items():
+                transaction = self.transactions.get(key)
+
+                if transaction is not None:
+                    transaction.samples += count
+                    self._dirty.add(key)
+
+            for partition, rows in samples.items():
+                self._samples[partition] = rows + self._samples.get(partition, [])
+
+            self._buffered += buffered
+
+        if self._buffered > self.max_unwritten:
+            self._drop_samples()
+
+    # Drops transactions silent for more than max_idle seconds from memory, once their state is written
+    def evict_idle(self):
+        self._settle_flushes()
+
+        deadline = default_clock.monotonic() - self.max_idle
+        writing = {key for _, written, _, _ in self._pending for key in written}
+
+        idle = [
+            key for key, transaction in self.transactions.items()
+            if transaction.last_seen < deadline and key not in self._dirty and key not in writing
+        ]
+
+        for key in idle:
+            del self.transactions[key]
+
+    # Writes everything buffered and waits for it to be committed, trying to open the file again if it failed before
+    def close(self):
+        self._retry_at = 0.0
+        future = self.flush()
+
+        if future is not None:
+            try:
+                future.result()
+            except Exception:
+                # Already logged by _on_flushed, whatever was raised
+                pass
+
+        self._settle_flushes()
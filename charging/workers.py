@@ -0,0 +1,24 @@
+import resource
+
+
+# Helpers of the tools running chargers over several worker processes (loadgen and replay)
+
+
+def raise_file_limit():
+    # Every connection needs a file descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+# Counts an error of a worker by the name of its type
+def count_error(errors: dict[str, int], error: BaseException):
+    name = type(error).__name__
+    errors[name] = errors.get(name, 0) + 1
+
+
+# Adds the error counts reported by a worker to the totals, returns how many errors were added
+def merge_errors(total: dict[str, int], errors: dict[str, int]) -> int:
+    for name, count in errors.items():
+        total[name] = total.get(name, 0) + count
+
+    return sum(errors.values())
@@ -1,3 +1,4 @@
 #!/bin/sh
 
-"$(dirname "$0")/venv/bin/python" "$(dirname "$0")/charging/client.py" "$@"
+# Modules of charging/ import each other by name, as the server does
+PYTHONPATH="$(dirname "$0")/charging" "$(dirname "$0")/venv/bin/python" "$(dirname "$0")/charging/client.py" "$@"
@@ -0,0 +1,4 @@
+#!/bin/sh
+
+# Modules of charging/ import each other by name, as the server does
+PYTHONPATH="$(dirname "$0")/charging" "$(dirname "$0")/venv/bin/python" "$(dirname "$0")/charging/loadgen.py" "$@"
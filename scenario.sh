@@ -0,0 +1,7 @@
+#!/bin/sh
+
+# Runs a module of charging/scenarios, e.g. ./scenario.sh engine charging/scenarios/specs/mixed_fleet.yaml
+scenario="$1"
+shift
+
+PYTHONPATH="$(dirname "$0")/charging" "$(dirname "$0")/venv/bin/python" -m "scenarios.$scenario" "$@"
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# Modules of the server import each other by name, as when run from charging/
+CHARGING_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'charging')
+sys.path.insert(0, CHARGING_DIR)
+
+# db.py opens charging/db.sqlite3 relative to the working directory on import, tests run from a temporary one so that
+# they never touch the DB of the repo
+_workdir = tempfile.mkdtemp(prefix='ocpp-tests-')
+os.makedirs(os.path.join(_workdir, 'charging'))
+os.chdir(_workdir)
@@ -0,0 +1,148 @@
+import pytest
+
+from authorization import ChargerMatcher, TokenFile, TokenIndex, get_token_format_error, write_token_file
+
+
+def test_token_format_errors():
+    assert get_token_format_error('ISO14443', '11223344') is None
+    assert get_token_format_error('ISO14443', '11223344556677') is None
+    assert get_token_format_error('ISO15693', '1122334455667788') is None
+    assert get_token_format_error('Central', 'abc') is None
+
+    assert get_token_format_error('ISO14443', '112233') == 'Invalid'
+    assert get_token_format_error('eMAID', 'abcdef') == 'Invalid'
+    assert get_token_format_error('ISO14443', 'not hex!') == 'Unknown'
+    assert get_token_format_error('KeyCode', '1234') == 'Unknown'
+
+
+def test_index_accepts_only_added_tokens():
+    index = TokenIndex()
+    index.add_all([{'type': 'ISO14443', 'id_token': '11223344'}, {'type': 'ISO15693', 'id_token': '1122334455667788'}])
+
+    # Tokens that could never be accepted are not stored
+    index.add('ISO14443', '112233')
+
+    assert len(index) == 2
+    assert index.check({'type': 'ISO14443', 'id_token': '11223344'}) == 'Accepted'
+    assert index.check({'type': 'ISO15693', 'id_token': '1122334455667788'}) == 'Accepted'
+
+    # The same token under another type is another token
+    assert index.check({'type': 'Central', 'id_token': '11223344'}) == 'Invalid'
+    assert index.check({'type': 'ISO14443', 'id_token': '55667788'}) == 'Invalid'
+    assert index.check({'type': 'ISO14443', 'id_token': '112233'}) == 'Invalid'
+    assert index.check({'type': 'KeyCode', 'id_token': '11223344'}) == 'Unknown'
+
+
+def test_token_file_finds_every_token_written(tmp_path):
+    path = str(tmp_path / 'tokens.bin')
+    tokens = [('ISO14443', f'{i:08x}') for i in range(1000)] + [('ISO15693', f'{i:016x}') for i in range(1000)]
+
+    # Duplicates are written once
+    write_token_file(path, tokens + tokens[:10])
+    token_file = TokenFile(path)
+
+    try:
+        assert len(token_file) == 2000
+        assert all(token in token_file for token in tokens)
+
+        assert ('ISO14443', f'{1000:08x}') not in token_file
+        assert ('ISO15693', f'{0:08x}') not in token_file
+        assert ('KeyCode', '00000000') not in token_file
+    finally:
+        token_file.close()
+
+
+def test_empty_token_file(tmp_path):
+    path = str(tmp_path / 'tokens.bin')
+    write_token_file(path, [])
+    token_file = TokenFile(path)
+
+    try:
+        assert len(token_file) == 0
+        assert ('ISO14443', '11223344') not in token_file
+    finally:
+        token_file.close()
+
+
+def test_invalid_tokens_are_not_written(tmp_path):
+    with pytest.raises(ValueError):
+        write_token_file(str(tmp_path / 'tokens.bin'), [('ISO14443', '112233')])
+
+
+def test_files_that_are_not_token_files_are_rejected(tmp_path):
+    path = tmp_path / 'tokens.bin'
+    path.write_bytes(b'\0' * 64)
+
+    with pytest.raises(ValueError):
+        TokenFile(str(path))
+
+
+def test_index_loads_csv_and_token_files(tmp_path):
+    csv_path = tmp_path / 'tokens.csv'
+    csv_path.write_text('type,id_token\nISO14443, 11223344\n\nISO15693,1122334455667788\n')
+
+    bin_path = str(tmp_path / 'tokens.bin')
+    write_token_file(bin_path, [('ISO14443', 'aabbccdd')])
+
+    index = TokenIndex()
+    index.load_file(str(csv_path))
+    index.load_file(bin_path)
+
+    assert len(index) == 3
+    assert index.check({'type': 'ISO14443', 'id_token': '11223344'}) == 'Accepted'
+    assert index.check({'type': 'ISO15693', 'id_token': '1122334455667788'}) == 'Accepted'
+    assert index.check({'type': 'ISO14443', 'id_token': 'aabbccdd'}) == 'Accepted'
+
+    for token_file in index._files:
+        token_file.close()
+
+
+def test_matcher_checks_serial_numbers_of_the_vendor_and_model():
+    matcher = ChargerMatcher()
+    matcher.add_all([
+        {'vendor_name': 'EurecomCharge', 'model': 'E2507', 'serial_number_regex': r'E2507-\d{4}-\d{4}$'},
+        {'vendor_name': 'EurecomCharge', 'model': 'E2507', 'serial_number_regex': r'TEST-\d+$'},
+        {'vendor_name': 'Other', 'model': 'X1', 'serial_number_regex': r'X1-'},
+    ])
+
+    assert len(matcher) == 3
+    assert matcher.check('EurecomCharge', 'E2507', 'E2507-8420-1274')
+    assert matcher.check('EurecomCharge', 'E2507', 'TEST-1')
+    assert matcher.check('Other', 'X1', 'X1-anything')
+
+    assert not matcher.check('EurecomCharge', 'E2507', 'E2507-abcd-efgh')
+    assert not matcher.check('EurecomCharge', 'E2507', 'X1-anything')
+    assert not matcher.check('Other', 'E2507', 'E2507-8420-1274')
+
+
+@pytest.mark.parametrize('cache_size', [0, 2])
+def test_matcher_cache_gives_the_same_results(cache_size):
+    matcher = ChargerMatcher(cache_size)
+    matcher.add('EurecomCharge', 'E2507', r'E2507-\d{4}-\d{4}$')
+
+    serial_numbers = ['E2507-0000-0001', 'E2507-abcd-efgh', 'E2507-0000-0002', 'E2507-0000-0001'] * 2
+
+    assert [matcher.check('EurecomCharge', 'E2507', i) for i in serial_numbers] == [True, False, True, True] * 2
+    assert len(matcher._cache) == min(cache_size, 3)
+
+
+def test_matcher_cache_evicts_least_recently_used_results():
+    matcher = ChargerMatcher(cache_size=2)
+    matcher.add('EurecomCharge', 'E2507', r'E2507-')
+
+    matcher.check('EurecomCharge', 'E2507', 'E2507-1')
+    matcher.check('EurecomCharge', 'E2507', 'E2507-2')
+    matcher.check('EurecomCharge', 'E2507', 'E2507-1')
+    matcher.check('EurecomCharge', 'E2507', 'E2507-3')
+
+    assert list(matcher._cache) == [('EurecomCharge', 'E2507', 'E2507-1'), ('EurecomCharge', 'E2507', 'E2507-3')]
+
+
+def test_adding_rules_clears_cached_results():
+    matcher = ChargerMatcher(cache_size=10)
+
+    assert not matcher.check('EurecomCharge', 'E2507', 'E2507-8420-1274')
+
+    matcher.add('EurecomCharge', 'E2507', r'E2507-')
+
+    assert matcher.check('EurecomCharge', 'E2507', 'E2507-8420-1274')
@@ -0,0 +1,53 @@
+from capture import CaptureWriter, SIDE_SERVER, SIDE_CLIENT, INBOUND, OUTBOUND, load_sessions
+
+
+def test_sessions_are_loaded_back(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    writer = CaptureWriter(path, SIDE_SERVER)
+
+    first = writer.open_session('E2507-0000-0001')
+    second = writer.open_session('E2507-0000-0002')
+    writer.record(first, INBOUND, '[2,"1","Heartbeat",{}]')
+    writer.record(first, OUTBOUND, '[3,"1",{"currentTime":"2026-10-16T10:00:00Z"}]')
+    writer.record(second, INBOUND, '[2,"2","Heartbeat",{}]')
+    writer.close_session(first)
+    writer.close()
+
+    sessions, start = load_sessions(path)
+
+    assert [i.charger_id for i in sessions] == ['E2507-0000-0001', 'E2507-0000-0002']
+    assert [frame for _, frame in sessions[0].frames] == ['[2,"1","Heartbeat",{}]']
+    assert sessions[0].closed is not None and sessions[1].closed is None
+    assert start == sessions[0].opened
+
+    # Sessions can be split between workers
+    assert [i.charger_id for i in load_sessions(path, 1, 2)[0]] == ['E2507-0000-0002']
+
+
+def test_closed_sessions_are_on_disk_right_away(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    writer = CaptureWriter(path, SIDE_SERVER)
+
+    session = writer.open_session('E2507-0000-0001')
+    writer.record(session, INBOUND, '[2,"1","Heartbeat",{}]')
+    writer.close_session(session)
+
+    # Nothing else flushed the writer, as when the process is killed right after
+    sessions, _ = load_sessions(path)
+    assert len(sessions) == 1 and len(sessions[0].frames) == 1
+
+    writer.close()
+
+
+def test_concatenated_captures_keep_sessions_apart(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+
+    for side, charger_id in ((SIDE_SERVER, 'E2507-0000-0001'), (SIDE_CLIENT, 'E2507-0000-0002')):
+        writer = CaptureWriter(path, side)
+        session = writer.open_session(charger_id)
+        writer.record(session, INBOUND, '[2,"1","Heartbeat",{}]')
+        writer.close()
+
+    sessions, _ = load_sessions(path)
+
+    assert [i.charger_id for i in sessions] == ['E2507-0000-0001', 'E2507-0000-0002']
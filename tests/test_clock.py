@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import pytest
+
+from clock import STEP_CLOCK_START, ScaledClock, StepClock, WallClock, get_clock
+
+
+def test_clocks_are_chosen_by_spec():
+    assert type(get_clock('wall')) is WallClock
+
+    scaled = get_clock('scaled:100')
+    assert type(scaled) is ScaledClock and scaled.speed == 100
+
+    step = get_clock('step:60:0.5')
+    assert type(step) is StepClock and (step.step, step.interval) == (60, 0.5)
+
+    with pytest.raises(ValueError):
+        get_clock('fast')
+
+
+def test_wall_clock_follows_real_time():
+    clock = WallClock()
+
+    assert abs(clock.time() - time.time()) < 1
+    assert clock.timestamp().endswith('Z') and len(clock.timestamp()) == len('2026-10-16T10:00:00Z')
+
+
+def test_scaled_clock_speeds_up_time_and_sleeps():
+    clock = ScaledClock(1000, start=0)
+
+    async def run() -> float:
+        start = time.monotonic()
+        virtual_start = clock.monotonic()
+
+        await clock.sleep(50)
+
+        assert clock.monotonic() - virtual_start >= 50
+        return time.monotonic() - start
+
+    # 50 virtual seconds take 0.05 real seconds
+    assert asyncio.run(run()) < 1
+    assert clock.time() >= 50
+
+
+def test_step_clock_only_moves_when_advanced():
+    clock = StepClock(auto=False)
+    woken = []
+
+    async def sleeper(name: str, seconds: float):
+        await clock.sleep(seconds)
+        woken.append((name, clock.monotonic()))
+
+    async def run():
+        tasks = [asyncio.create_task(sleeper(name, seconds)) for name, seconds in (('b', 20), ('a', 10), ('c', 20))]
+        await asyncio.sleep(0)
+
+        clock.advance(5)
+        await asyncio.sleep(0)
+        assert woken == [] and clock.monotonic() == 5
+
+        clock.advance(100)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    # Sleepers wake in order of deadline, then of arrival, and time ends where it was advanced to
+    assert [name for name, _ in woken] == ['a', 'b', 'c']
+    assert clock.monotonic() == 105
+    assert clock.time() == STEP_CLOCK_START + 105
+    assert clock.timestamp() == '2024-01-01T00:01:45Z'
+
+
+def test_step_clock_wakes_sleepers_at_their_deadline():
+    clock = StepClock(step=60)
+    seen = []
+
+    async def sleeper(seconds: float):
+        await clock.sleep(seconds)
+        seen.append(clock.monotonic())
+
+    async def run():
+        await asyncio.gather(sleeper(90), sleeper(30), sleeper(3600))
+
+    asyncio.run(run())
+
+    assert seen == [30, 90, 3600]
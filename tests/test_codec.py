@@ -0,0 +1,114 @@
+import json
+
+import pytest
+from ocpp.exceptions import OCPPError
+from ocpp.messages import Call, CallResult, unpack, validate_payload
+
+from codec import FastCodec, HEARTBEAT, STATUS_NOTIFICATION, TRANSACTION_EVENT, compile_schema, current_time_body
+
+
+SCHEMAS = {'Heartbeat': HEARTBEAT, 'StatusNotification': STATUS_NOTIFICATION, 'TransactionEvent': TRANSACTION_EVENT}
+
+TRANSACTION_EVENT_PAYLOAD = {
+    'eventType': 'Updated',
+    'timestamp': '2026-10-16T10:00:00Z',
+    'triggerReason': 'MeterValuePeriodic',
+    'seqNo': 3,
+    'transactionInfo': {'transactionId': 'tx-1', 'chargingState': 'Charging'},
+    'meterValue': [{
+        'timestamp': '2026-10-16T10:00:00Z',
+        'sampledValue': [{'value': 1234.5, 'measurand': 'Energy.Active.Import.Register'}, {'value': 16}],
+    }],
+    'evse': {'id': 1, 'connectorId': 1},
+    'idToken': {'idToken': '11223344', 'type': 'ISO14443'},
+}
+
+STATUS_NOTIFICATION_PAYLOAD = {
+    'timestamp': '2026-10-16T10:00:00Z', 'connectorStatus': 'Available', 'evseId': 1, 'connectorId': 1
+}
+
+
+def _without(payload: dict, key: str) -> dict:
+    return {k: v for k, v in payload.items() if k != key}
+
+
+# Payloads and whether they are valid, the fast path must agree with the library on every one
+PAYLOADS = [
+    ('Heartbeat', {}, True),
+    ('Heartbeat', {'customData': {'vendorId': 'EurecomCharge'}}, True),
+    ('Heartbeat', {'unknown': 1}, False),
+    ('StatusNotification', STATUS_NOTIFICATION_PAYLOAD, True),
+    ('StatusNotification', {**STATUS_NOTIFICATION_PAYLOAD, 'connectorStatus': 'Broken'}, False),
+    ('StatusNotification', {**STATUS_NOTIFICATION_PAYLOAD, 'evseId': '1'}, False),
+    ('StatusNotification', _without(STATUS_NOTIFICATION_PAYLOAD, 'connectorId'), False),
+    ('TransactionEvent', TRANSACTION_EVENT_PAYLOAD, True),
+    ('TransactionEvent', _without(TRANSACTION_EVENT_PAYLOAD, 'meterValue'), True),
+    ('TransactionEvent', {**TRANSACTION_EVENT_PAYLOAD, 'triggerReason': 'Whatever'}, False),
+    ('TransactionEvent', {**TRANSACTION_EVENT_PAYLOAD, 'seqNo': 'three'}, False),
+    ('TransactionEvent', {**TRANSACTION_EVENT_PAYLOAD, 'transactionInfo': {'chargingState': 'Charging'}}, False),
+    ('TransactionEvent', {**TRANSACTION_EVENT_PAYLOAD, 'meterValue': []}, False),
+    ('TransactionEvent', {**TRANSACTION_EVENT_PAYLOAD, 'meterValue': [{'timestamp': 'now', 'sampledValue': [{}]}]},
+     False),
+]
+
+
+def _library_accepts(action: str, payload: dict) -> bool:
+    try:
+        validate_payload(Call('1', action, payload), '2.0.1')
+    except OCPPError:
+        return False
+
+    return True
+
+
+@pytest.mark.parametrize('action, payload, valid', PAYLOADS)
+def test_schemas_agree_with_the_library(action, payload, valid):
+    assert _library_accepts(action, payload) == valid
+    assert compile_schema(SCHEMAS[action])(payload) == valid
+
+
+def _codec() -> FastCodec:
+    codec = FastCodec()
+    codec.register('Heartbeat', HEARTBEAT)(lambda session, payload: current_time_body())
+    codec.register('StatusNotification', STATUS_NOTIFICATION)(lambda session, payload: '{}')
+    codec.register('TransactionEvent', TRANSACTION_EVENT)(lambda session, payload: '{"totalCost":0}')
+
+    return codec
+
+
+@pytest.mark.parametrize('action, payload, valid', PAYLOADS)
+def test_responses_are_valid_for_the_library(action, payload, valid):
+    handled = _codec().handle(None, json.dumps([2, 'abc-1', action, payload]))
+
+    # Invalid payloads are left to the library, which reports the error
+    if not valid:
+        assert handled is None
+        return
+
+    handled_action, raw_response = handled
+    response = unpack(raw_response)
+
+    assert handled_action == action
+    assert isinstance(response, CallResult) and response.unique_id == 'abc-1'
+
+    response.action = action
+    validate_payload(response, '2.0.1')
+
+
+@pytest.mark.parametrize('raw_msg', [
+    'not json',
+    '{"a": 1}',
+    '[2, "abc-1", "Heartbeat"]',
+    '[3, "abc-1", "Heartbeat", {}]',
+    '[2, 1, "Heartbeat", {}]',
+    '[2, "abc-1", "Authorize", {"idToken": {"idToken": "1", "type": "Central"}}]',
+])
+def test_unexpected_messages_go_through_the_library(raw_msg):
+    assert _codec().handle(None, raw_msg) is None
+
+
+def test_handlers_may_decline():
+    codec = FastCodec()
+    codec.register('Heartbeat', HEARTBEAT)(lambda session, payload: None)
+
+    assert codec.handle(None, '[2, "abc-1", "Heartbeat", {}]') is None
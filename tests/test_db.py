@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+import db
+from db import BatchWriter
+
+
+def _create_table(connection: sqlite3.Connection):
+    connection.execute('CREATE TABLE IF NOT EXISTS Items (value INTEGER NOT NULL);')
+
+
+def _count(connection: sqlite3.Connection) -> int:
+    return connection.execute('SELECT COUNT(*) FROM Items;').fetchone()[0]
+
+
+@pytest.fixture
+def writer(tmp_path) -> BatchWriter:
+    writer = BatchWriter(str(tmp_path / 'test.sqlite3'))
+    writer.execute(_create_table)
+    return writer
+
+
+def test_jobs_are_committed(writer):
+    futures = [
+        writer.submit(lambda c, i=i: c.execute('INSERT INTO Items VALUES (?);', (i,)).lastrowid) for i in range(10)
+    ]
+
+    assert [future.result(timeout=5) for future in futures] == list(range(1, 11))
+    assert writer.execute(_count) == 10
+
+
+def test_failing_sqlite_job_only_rolls_back_itself(writer):
+    ok = writer.submit(lambda c: c.execute('INSERT INTO Items VALUES (1);'))
+    failing = writer.submit(lambda c: c.execute('INSERT INTO Items VALUES (NULL);'))
+
+    ok.result(timeout=5)
+    with pytest.raises(sqlite3.IntegrityError):
+        failing.result(timeout=5)
+
+    assert writer.execute(_count) == 1
+
+
+def test_job_raising_any_exception_does_not_kill_the_writer(writer):
+    def failing_job(connection: sqlite3.Connection):
+        connection.execute('INSERT INTO Items VALUES (1);')
+        return 1 / 0
+
+    with pytest.raises(ZeroDivisionError):
+        writer.submit(failing_job).result(timeout=5)
+
+    # The write of the failing job was rolled back and later jobs still run
+    assert writer.execute(_count) == 0
+    writer.submit(lambda c: c.execute('INSERT INTO Items VALUES (2);')).result(timeout=5)
+    assert writer.execute(_count) == 1
+
+
+def test_archived_events_and_outcomes_survive_restarts():
+    # Every run of the server purges events on start, then delivers and archives its own
+    for run in range(2):
+        db.purge_events()
+        event_id = db.add_event('reserve_now', 'E2507-0000-0001', {'run': run})
+        db.mark_event_delivered(event_id, 'E2507-0000-0001', [(1, 'Accepted')]).result(timeout=5)
+
+        assert db.compact_events(archive=True) == 1
+
+    archived = db._writer.execute(lambda c: c.execute(
+        'SELECT data FROM EventsArchive WHERE target=? ORDER BY id;', ('E2507-0000-0001',)
+    ).fetchall())
+    outcomes = db._writer.execute(lambda c: c.execute(
+        'SELECT COUNT(*) FROM Deliveries WHERE event_id IN (SELECT id FROM EventsArchive WHERE target=?);',
+        ('E2507-0000-0001',)
+    ).fetchone()[0])
+
+    assert archived == [('{"run": 0}',), ('{"run": 1}',)]
+    assert outcomes == 2
+
+
+def test_negative_min_age_compacts_delivered_events():
+    db.purge_events()
+    event_id = db.add_event('reserve_now', 'E2507-0000-0002', {})
+    db.mark_event_delivered(event_id, 'E2507-0000-0002').result(timeout=5)
+
+    assert db.compact_events(min_age=-1) == 1
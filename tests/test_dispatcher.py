@@ -0,0 +1,132 @@
+import asyncio
+import threading
+
+import db
+from dispatcher import ReservationDispatcher
+from registry import ConnectionRegistry
+
+
+class FakeSession:
+
+    def __init__(self, status: str = 'Accepted'):
+        self.status = status
+        self.received: list[int] = []
+
+    async def deliver_reservation(self, event_id: int, data: dict, created_at) -> str:
+        self.received.append(event_id)
+
+        if self.status != 'Accepted':
+            raise ConnectionError(self.status)
+
+        return self.status
+
+
+def _wait_for_writes():
+    # Delivery outcomes are written in background, a job queued after them runs once they are committed
+    db._writer.execute(lambda connection: None)
+
+
+async def _deliver(dispatcher: ReservationDispatcher, target_id: str):
+    dispatcher.wake(target_id)
+    await dispatcher._tasks[target_id]
+    _wait_for_writes()
+
+
+# Connects a session with the given id, lets the dispatcher deliver to it, then disconnects it
+async def _connect_once(registry, dispatcher, target_id: str, session: FakeSession):
+    with registry.session(target_id, session):
+        await _deliver(dispatcher, target_id)
+
+    dispatcher.forget(target_id)
+
+
+def test_delivered_events_are_not_sent_again_on_reconnect():
+    db.purge_events()
+    registry = ConnectionRegistry()
+    dispatcher = ReservationDispatcher(registry)
+
+    event_id = db.add_event('reserve_now', 'E2507-0000-0001', {'type': 'ISO14443', 'id_token': '11223344'})
+
+    async def run():
+        first, second = FakeSession(), FakeSession()
+
+        await _connect_once(registry, dispatcher, 'E2507-0000-0001', first)
+        await _connect_once(registry, dispatcher, 'E2507-0000-0001', second)
+
+        return first.received, second.received
+
+    assert asyncio.run(run()) == ([event_id], [])
+    assert db.get_event_stats()['delivered'] == 1
+
+
+def test_failed_events_are_not_sent_again_on_reconnect():
+    db.purge_events()
+    registry = ConnectionRegistry()
+    dispatcher = ReservationDispatcher(registry)
+
+    db.add_event('reserve_now', 'E2507-0000-0002', {'type': 'ISO14443', 'id_token': '11223344'})
+
+    async def run():
+        failing, second = FakeSession('Unreachable'), FakeSession()
+
+        # The session stays connected while failing, so the event is kept as a dead letter
+        await _connect_once(registry, dispatcher, 'E2507-0000-0002', failing)
+        await _connect_once(registry, dispatcher, 'E2507-0000-0002', second)
+
+        return len(failing.received), second.received
+
+    assert asyncio.run(run()) == (1, [])
+    assert db.get_event_stats()['failed'] == 1
+
+
+def test_pending_events_are_sent_once_connected():
+    db.purge_events()
+    registry = ConnectionRegistry()
+    dispatcher = ReservationDispatcher(registry)
+
+    ids = list(db.add_events('reserve_now', [('E2507-0000-0003', {}), ('E2507-0000-0003', {})]))
+
+    async def run():
+        session = FakeSession()
+        await _connect_once(registry, dispatcher, 'E2507-0000-0003', session)
+        return session.received
+
+    assert asyncio.run(run()) == ids
+
+
+def test_events_are_not_sent_again_on_reconnect_before_being_marked():
+    db.purge_events()
+    registry = ConnectionRegistry()
+    dispatcher = ReservationDispatcher(registry)
+
+    event_id = db.add_event('reserve_now', 'E2507-0000-0004', {'type': 'ISO14443', 'id_token': '11223344'})
+
+    async def connect(session: FakeSession):
+        with registry.session('E2507-0000-0004', session):
+            dispatcher.wake('E2507-0000-0004')
+            await dispatcher._tasks['E2507-0000-0004']
+
+        dispatcher.forget('E2507-0000-0004')
+
+    async def run():
+        first, second = FakeSession(), FakeSession()
+
+        # The writer is held up, so the event is still pending in the DB when the charger comes back
+        release = threading.Event()
+        db._writer.submit(lambda connection: release.wait())
+
+        try:
+            await connect(first)
+            await connect(second)
+        finally:
+            release.set()
+
+        _wait_for_writes()
+        await asyncio.sleep(0)
+
+        # Once the mark is committed, the id of the last delivered event is no longer needed
+        assert 'E2507-0000-0004' not in dispatcher._last_delivered
+
+        return first.received, second.received
+
+    assert asyncio.run(run()) == ([event_id], [])
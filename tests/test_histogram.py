@@ -0,0 +1,84 @@
+import json
+import math
+import random
+
+from histogram import LatencyHistogram, LatencyRecorder
+
+
+# Value below which the given percentage of values fall, as the histogram defines it
+def _exact_percentile(values: list[float], percentile: float) -> float:
+    values = sorted(values)
+    return values[max(math.ceil(len(values) * percentile / 100) - 1, 0)]
+
+
+def test_percentiles_are_within_the_relative_error():
+    generator = random.Random(42)
+    values = [generator.lognormvariate(-6, 2) for _ in range(10_000)]
+
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+
+    for percentile in (1, 50, 90, 99, 99.9, 100):
+        exact = int(_exact_percentile(values, percentile) * 1_000_000) / 1_000_000
+
+        # Values are kept in microseconds, with a relative error of at most 2^-7
+        assert math.isclose(histogram.percentile(percentile), exact, rel_tol=2 ** -7, abs_tol=1e-6)
+
+    assert histogram.count == len(values)
+
+
+def test_small_values_are_exact():
+    histogram = LatencyHistogram()
+
+    for microseconds in range(1, 101):
+        histogram.record(microseconds / 1_000_000)
+
+    assert histogram.percentile(50) == 50 / 1_000_000
+    assert histogram.summary()['min'] == 1 / 1_000_000
+    assert histogram.summary()['max'] == 100 / 1_000_000
+
+
+def test_empty_histogram():
+    assert LatencyHistogram().percentile(99) == 0.0
+    assert LatencyHistogram().summary() == {
+        'count': 0, 'min': 0.0, 'max': 0.0, 'mean': 0.0, 'p50': 0.0, 'p90': 0.0, 'p99': 0.0, 'p999': 0.0
+    }
+
+
+def test_merged_histograms_equal_one_histogram_of_all_values():
+    generator = random.Random(7)
+    values = [generator.expovariate(100) for _ in range(5_000)]
+
+    whole, first, second = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+
+    for index, value in enumerate(values):
+        whole.record(value)
+        (first if index % 3 else second).record(value)
+
+    first.merge(second)
+    first.merge(LatencyHistogram())
+
+    assert first.to_dict() == whole.to_dict()
+    assert first.summary() == whole.summary()
+
+
+def test_recorders_survive_a_round_trip_and_merge():
+    first, second = LatencyRecorder(), LatencyRecorder()
+
+    first.record('Heartbeat', 0.001)
+    first.record('Heartbeat', 0.003)
+    first.record_error('Authorize')
+    second.record('Heartbeat', 0.002)
+    second.record('BootNotification', 0.010)
+    second.record_error('Authorize')
+
+    # Workers send their recorders as JSON
+    first.merge(LatencyRecorder.from_dict(json.loads(json.dumps(second.to_dict()))))
+    summary = first.summary(elapsed=2)
+
+    assert summary['Heartbeat']['count'] == 3
+    assert math.isclose(summary['Heartbeat']['p50'], 0.002, rel_tol=2 ** -7)
+    assert summary['Heartbeat']['requests_per_second'] == 1.5
+    assert summary['BootNotification']['max'] == 0.010
+    assert summary['Authorize']['count'] == 0 and summary['Authorize']['errors'] == 2
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from httpserver import HttpServer, Request, Response
+
+
+# Sends raw requests on one connection and returns everything the server answered until it closed the connection
+async def _exchange(raw: bytes, **limits) -> bytes:
+    server = HttpServer(**limits)
+
+    @server.route('/echo', methods=('POST',))
+    async def echo(request: Request) -> Response:
+        return Response(request.body)
+
+    await server.start('127.0.0.1', 0)
+    port = server._server.sockets[0].getsockname()[1]
+
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw + b'POST /echo HTTP/1.1\r\nContent-Length: 3\r\nConnection: close\r\n\r\nend')
+        await writer.drain()
+
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+
+        return response
+    finally:
+        server.close()
+
+
+def test_chunked_bodies_are_decoded():
+    response = asyncio.run(_exchange(
+        b'POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+        b'5;name=value\r\nhello\r\n6\r\n world\r\n0\r\nTrailer: 1\r\n\r\n'
+    ))
+
+    # The next request on the connection is read from where the chunked body ends
+    assert response.count(b'200 OK') == 2
+    assert b'\r\n\r\nhello world' in response
+    assert response.endswith(b'\r\n\r\nend')
+
+
+def test_unsupported_transfer_encodings_close_the_connection():
+    response = asyncio.run(_exchange(b'POST /echo HTTP/1.1\r\nTransfer-Encoding: gzip\r\n\r\nabc'))
+
+    assert response.startswith(b'HTTP/1.1 501 Not Implemented\r\n')
+    assert b'Connection: close' in response
+    assert b'200 OK' not in response
+
+
+@pytest.mark.parametrize('raw, status', [
+    (b'GET /' + b'a' * 200 + b' HTTP/1.1\r\n\r\n', b'414 Request-URI Too Long'),
+    (b'GET / HTTP/1.1\r\nX-Long: ' + b'a' * 200 + b'\r\n\r\n', b'431 Request Header Fields Too Large'),
+    (b'GET / HTTP/1.1\r\n' + b'X-Header: 1\r\n' * 11 + b'\r\n', b'431 Request Header Fields Too Large'),
+    (b'POST /echo HTTP/1.1\r\nContent-Length: 101\r\n\r\n' + b'a' * 101, b'413 Request Entity Too Large'),
+    (
+        b'POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n' + (b'40\r\n' + b'a' * 64 + b'\r\n') * 2,
+        b'413 Request Entity Too Large'
+    ),
+])
+def test_oversized_requests_are_rejected(raw, status):
+    response = asyncio.run(_exchange(raw, max_line_size=100, max_headers=10, max_body_size=100))
+
+    assert response.startswith(b'HTTP/1.1 ' + status + b'\r\n')
+    assert b'Connection: close' in response
+    assert b'200 OK' not in response
+
+
+@pytest.mark.parametrize('raw', [
+    b'GET /\r\n\r\n',
+    b'GET / HTTP/1.1\r\nNo separator\r\n\r\n',
+    b'POST /echo HTTP/1.1\r\nContent-Length: ten\r\n\r\n',
+    b'POST /echo HTTP/1.1\r\nContent-Length: -1\r\n\r\n',
+    b'POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n',
+    b'POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabcdef\r\n',
+])
+def test_malformed_requests_are_rejected(raw):
+    response = asyncio.run(_exchange(raw))
+
+    assert response.startswith(b'HTTP/1.1 400 Bad Request\r\n')
+    assert b'Connection: close' in response
+    assert b'200 OK' not in response
+
+
+def test_requests_within_the_limits_are_served():
+    response = asyncio.run(_exchange(
+        b'POST /echo HTTP/1.1\r\n' + b'X-Header: 1\r\n' * 9 + b'Content-Length: 100\r\n\r\n' + b'a' * 100,
+        max_line_size=100, max_headers=10, max_body_size=100
+    ))
+
+    assert response.count(b'200 OK') == 2
@@ -0,0 +1,92 @@
+from limits import AdmissionController, CallLimiter
+from registry import ConnectionRegistry
+
+
+# Rates are low enough for buckets not to refill during a test
+
+
+def test_local_token_is_kept_when_the_parent_rejects():
+    parent = CallLimiter(max_in_flight=1)
+    limiter = CallLimiter(rate=0.001, burst=1, parent=parent)
+    other = CallLimiter(parent=parent)
+
+    assert other.try_acquire()
+    assert not limiter.try_acquire()
+
+    other.release()
+
+    assert limiter.try_acquire()
+    assert (limiter.accepted, limiter.rejected) == (1, 1)
+
+
+def test_parent_is_given_back_the_call_when_the_local_limit_rejects():
+    parent = CallLimiter(rate=0.001, burst=2, max_in_flight=2)
+    limiter = CallLimiter(rate=0.001, burst=1, parent=parent)
+    other = CallLimiter(parent=parent)
+
+    assert limiter.try_acquire()
+    limiter.release()
+    assert not limiter.try_acquire()
+
+    assert (parent.in_flight, parent.accepted) == (0, 1)
+    assert other.try_acquire()
+    assert not other.try_acquire()
+
+
+def test_in_flight_calls_are_capped_until_released():
+    limiter = CallLimiter(max_in_flight=2)
+
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+
+    limiter.release()
+
+    assert limiter.try_acquire()
+    assert limiter.in_flight == 2
+
+
+def _connect(registry: ConnectionRegistry, count: int):
+    for _ in range(count):
+        registry.add('E2507-0000-0001', object())
+
+
+def test_connections_are_rejected_once_full():
+    registry = ConnectionRegistry()
+    controller = AdmissionController(registry, 2)
+
+    assert controller.admit() is None
+    _connect(registry, 2)
+
+    assert controller.is_full()
+    assert controller.admit() == 'full'
+    assert controller.rejected == {'full': 1, 'shedding': 0, 'rate': 0}
+
+
+def test_shedding_starts_at_the_high_watermark_and_stops_below_the_low_one():
+    registry = ConnectionRegistry()
+    controller = AdmissionController(registry, 10, high_watermark=0.8, low_watermark=0.5)
+    sessions = [object() for _ in range(8)]
+
+    for session in sessions[:7]:
+        registry.add('E2507-0000-0001', session)
+    assert controller.admit() is None
+
+    registry.add('E2507-0000-0001', sessions[7])
+    assert controller.admit() == 'shedding'
+
+    # Still shedding between the watermarks
+    for session in sessions[5:]:
+        registry.remove('E2507-0000-0001', session)
+    assert controller.admit() == 'shedding'
+
+    registry.remove('E2507-0000-0001', sessions[4])
+    assert controller.admit() is None
+    assert controller.rejected == {'full': 0, 'shedding': 2, 'rate': 0}
+
+
+def test_accepts_are_rate_limited():
+    controller = AdmissionController(ConnectionRegistry(), 100, accept_rate=0.001, accept_burst=2)
+
+    assert [controller.admit() for _ in range(3)] == [None, None, 'rate']
+    assert controller.rejected['rate'] == 1
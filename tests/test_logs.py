@@ -0,0 +1,44 @@
+import logging
+
+from logs import SamplingFilter
+
+
+def _record(name: str = 'server', **extra) -> logging.LogRecord:
+    return logging.makeLogRecord({'name': name, 'msg': 'message', **extra})
+
+
+def test_ocpp_records_are_sampled_without_a_kind():
+    sampling = SamplingFilter(limit=2, window=60)
+
+    allowed = [sampling.filter(_record('ocpp')) for _ in range(5)]
+
+    assert allowed == [True, True, False, False, False]
+    assert all(sampling.filter(_record()) for _ in range(5))
+
+
+def test_suppressed_counts_are_added_to_the_next_record():
+    sampling = SamplingFilter(limit=1, window=60)
+
+    for _ in range(3):
+        sampling.filter(_record(charger='CP1', kind='rate_limited'))
+
+    # A new window lets the key through again
+    sampling._window_start -= 60
+    record = _record(charger='CP1', kind='rate_limited')
+
+    assert sampling.filter(record)
+    assert record.suppressed == 2
+
+
+def test_suppressed_counts_of_idle_keys_are_dropped():
+    sampling = SamplingFilter(limit=1, window=60)
+
+    for _ in range(3):
+        sampling.filter(_record(charger='CP1', kind='rate_limited'))
+
+    # CP1 logs nothing for a whole window
+    for _ in range(2):
+        sampling._window_start -= 60
+        sampling.filter(_record(charger='CP2', kind='rate_limited'))
+
+    assert list(sampling._suppressed) == []
@@ -0,0 +1,12 @@
+from metrics import MetricsRegistry
+
+
+def test_label_values_are_escaped():
+    metrics = MetricsRegistry()
+    counter = metrics.counter('ocpp_test_total', 'Test counter', ('action',))
+    counter.inc('Foo"} 1\nevil_metric\\')
+
+    lines = counter.render().split('\n')
+
+    assert lines[-1] == 'ocpp_test_total{action="Foo\\"} 1\\nevil_metric\\\\"} 1'
+    assert not any(line.startswith('evil_metric') for line in lines)
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from ocpp.exceptions import NotSupportedError
+
+from outbound import OutboundCalls
+
+
+class FakeChargePoint:
+
+    def __init__(self, id: str, responses: list):
+        self.id = id
+        self.responses = responses
+        self.calls = 0
+
+    async def call(self, payload, suppress: bool = True):
+        self.calls += 1
+        response = self.responses.pop(0)
+
+        if isinstance(response, Exception):
+            raise response
+        if response is None:
+            await asyncio.sleep(3600)
+
+        return response
+
+
+def test_call_errors_are_not_retried():
+    calls = OutboundCalls(timeout=1, retries=2, backoff=0)
+    charge_point = FakeChargePoint('CP-1', [NotSupportedError(), 'Accepted'])
+
+    with pytest.raises(NotSupportedError):
+        asyncio.run(calls.call(charge_point, object()))
+
+    assert charge_point.calls == 1
+    assert calls.retried == 0 and calls.failed == 1
+
+
+def test_timeouts_are_retried():
+    calls = OutboundCalls(timeout=0.01, retries=2, backoff=0)
+    charge_point = FakeChargePoint('CP-1', [None, ConnectionResetError(), 'Accepted'])
+
+    assert asyncio.run(calls.call(charge_point, object())) == 'Accepted'
+    assert charge_point.calls == 3
+    assert calls.retried == 2 and calls.failed == 0
+
+
+def test_slow_charger_does_not_hold_every_slot():
+    async def run():
+        calls = OutboundCalls(timeout=1, retries=0, max_outstanding=2, max_per_charger=1)
+        slow = FakeChargePoint('CP-SLOW', [None, None, None])
+        fast = FakeChargePoint('CP-FAST', ['Accepted'])
+
+        pending = [asyncio.ensure_future(calls.call(slow, object())) for _ in range(3)]
+        await asyncio.sleep(0.01)
+
+        # Only one call of the slow charger is outstanding, the others wait for its own slot
+        assert slow.calls == 1
+        assert await asyncio.wait_for(calls.call(fast, object()), 0.5) == 'Accepted'
+
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        # Slots of a charger are dropped once nothing holds or waits for them
+        assert not calls._charger_slots
+
+    asyncio.run(run())
@@ -0,0 +1,65 @@
+import pytest
+
+from registry import ConnectionRegistry
+
+
+def test_sessions_are_kept_by_id_in_order_of_connection():
+    registry = ConnectionRegistry()
+    first, second, other = object(), object(), object()
+
+    assert registry.add('E2507-0000-0001', first) == 1
+    assert registry.add('E2507-0000-0002', other) == 2
+    assert registry.add('E2507-0000-0001', second) == 3
+
+    assert len(registry) == 3
+    assert 'E2507-0000-0001' in registry and 'E2507-0000-0003' not in registry
+    assert registry.get('E2507-0000-0001') == [first, second]
+    assert registry.get('E2507-0000-0003') == []
+    assert registry.get_session_number('E2507-0000-0001', second) == 3
+    assert registry.get_session_number('E2507-0000-0002', first) is None
+    assert list(registry.ids()) == ['E2507-0000-0001', 'E2507-0000-0002']
+
+
+def test_ids_are_dropped_with_their_last_session():
+    registry = ConnectionRegistry()
+    first, second = object(), object()
+
+    registry.add('E2507-0000-0001', first)
+    registry.add('E2507-0000-0001', second)
+
+    registry.remove('E2507-0000-0001', first)
+    assert registry.get('E2507-0000-0001') == [second]
+
+    registry.remove('E2507-0000-0001', second)
+    assert 'E2507-0000-0001' not in registry
+    assert len(registry) == 0
+
+    # Removing what is not there changes nothing
+    registry.remove('E2507-0000-0001', second)
+    assert (registry.current, registry.peak, registry.total) == (0, 2, 2)
+
+
+def test_counters_follow_connections():
+    registry = ConnectionRegistry()
+    sessions = [object() for _ in range(3)]
+
+    for session in sessions:
+        registry.add('E2507-0000-0001', session)
+
+    registry.remove('E2507-0000-0001', sessions[0])
+    registry.add('E2507-0000-0002', sessions[0])
+
+    assert (registry.current, registry.peak, registry.total) == (3, 3, 4)
+
+
+def test_sessions_are_removed_however_the_context_is_left():
+    registry = ConnectionRegistry()
+    session = object()
+
+    with pytest.raises(RuntimeError):
+        with registry.session('E2507-0000-0001', session):
+            assert registry.get('E2507-0000-0001') == [session]
+            raise RuntimeError()
+
+    assert 'E2507-0000-0001' not in registry
+    assert len(registry) == 0
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from scheduler import TimerWheel
+
+
+# Returns the ticks on which the callback of a timer of interval seconds fired, the wheel being ticked by hand
+def _fired_ticks(interval: float, ticks: int, slots: int = 1024, ticked: int = 0) -> list[int]:
+    wheel = TimerWheel(tick=1, slots=slots, jitter=0)
+    fired = []
+    tick = 0
+
+    # The wheel may have been running before the timer is scheduled
+    for _ in range(ticked):
+        wheel._advance()
+
+    async def schedule():
+        wheel.schedule_periodic(interval, lambda: fired.append(tick))
+        wheel._task.cancel()
+
+    asyncio.run(schedule())
+
+    for tick in range(1, ticks + 1):
+        wheel._advance()
+
+    return fired
+
+
+@pytest.mark.parametrize('ticked', [0, 1, 700])
+def test_timer_of_a_full_turn_fires_once_per_turn(ticked):
+    assert _fired_ticks(1024, 3 * 1024, ticked=ticked) == [1024, 2048, 3072]
+
+
+@pytest.mark.parametrize('interval', [1, 5, 1023, 1025, 2048])
+def test_timers_fire_every_interval(interval):
+    ticks = 3 * interval
+
+    assert _fired_ticks(interval, ticks) == list(range(interval, ticks + 1, interval))
+
+
+def test_cancelled_timer_does_not_fire():
+    wheel = TimerWheel(tick=1, slots=8, jitter=0)
+    fired = []
+
+    async def schedule():
+        handle = wheel.schedule_periodic(3, lambda: fired.append(True))
+        wheel._task.cancel()
+        return handle
+
+    asyncio.run(schedule()).cancel()
+
+    for _ in range(10):
+        wheel._advance()
+
+    assert fired == []
+
+
+def test_failed_coroutine_jobs_are_logged(caplog):
+    wheel = TimerWheel(tick=1, slots=8, jitter=0)
+
+    async def job():
+        raise RuntimeError('boom')
+
+    async def run():
+        wheel.schedule_periodic(1, job)
+        wheel._task.cancel()
+
+        wheel._advance()
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+    assert not wheel._running
+    assert 'Periodic job failed: boom' in caplog.text
+
+
+def test_timer_cancelled_by_a_sibling_callback_does_not_fire():
+    wheel = TimerWheel(tick=1, slots=8, jitter=0)
+    fired = []
+    handles = []
+
+    # Both timers are due on the same tick, whichever fires first cancels the other
+    def callback(index: int):
+        fired.append(index)
+        handles[1 - index].cancel()
+
+    async def schedule():
+        handles.extend(wheel.schedule_periodic(2, lambda index=index: callback(index)) for index in range(2))
+        wheel._task.cancel()
+
+    asyncio.run(schedule())
+
+    for _ in range(6):
+        wheel._advance()
+
+    assert len(fired) == 3 and len(set(fired)) == 1
+    assert len(wheel) == 1
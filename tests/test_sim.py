@@ -0,0 +1,93 @@
+import asyncio
+
+from ocpp.messages import Call, CallResult, unpack, validate_payload
+
+import sim
+from sim import SimulatedCharger
+
+
+# Websocket fed by the test: frames put in incoming are read by the charger, frames it sends are kept in sent
+class FakeWebSocket:
+
+    def __init__(self):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent: list[str] = []
+
+    async def send(self, frame: str):
+        self.sent.append(frame)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        frame = await self.incoming.get()
+
+        if frame is None:
+            raise StopAsyncIteration
+
+        return frame
+
+
+def test_frames_are_valid_ocpp_and_responses_are_matched():
+    async def run():
+        websocket = FakeWebSocket()
+        charger = SimulatedCharger('E2507-0000-0001', websocket)
+        reader = asyncio.create_task(charger.run())
+
+        boot = asyncio.create_task(charger.boot('E2507', 'EurecomCharge'))
+        await asyncio.sleep(0)
+        websocket.incoming.put_nowait(
+            '[3,"0",{"currentTime":"2026-10-16T10:00:00Z","interval":10,"status":"Accepted"}]'
+        )
+        assert (await boot)['interval'] == 10
+
+        await charger.send_heartbeat()
+        websocket.incoming.put_nowait('[3,"1",{"currentTime":"2026-10-16T10:00:10Z"}]')
+
+        websocket.incoming.put_nowait(
+            '[2,"r-1","ReserveNow",{"id":1,"expiryDateTime":"2026-10-16T11:00:00Z",'
+            '"idToken":{"idToken":"11223344","type":"ISO14443"}}]'
+        )
+        websocket.incoming.put_nowait('[2,"r-2","Reset",{"type":"Immediate"}]')
+        websocket.incoming.put_nowait(None)
+        await reader
+
+        return charger, websocket.sent
+
+    heartbeats = sim.latencies.histograms.get('Heartbeat')
+    heartbeats_before = heartbeats.count if heartbeats else 0
+
+    charger, sent = asyncio.run(run())
+
+    assert charger.boot_status == 'Accepted'
+    assert charger.reservations == 1
+    assert sim.latencies.histograms['Heartbeat'].count == heartbeats_before + 1
+
+    boot, heartbeat, reserve_now, reset = (unpack(frame) for frame in sent)
+
+    for call in (boot, heartbeat):
+        assert isinstance(call, Call)
+        validate_payload(call, '2.0.1')
+
+    assert boot.payload['chargingStation']['serialNumber'] == 'E2507-0000-0001'
+
+    assert isinstance(reserve_now, CallResult) and reserve_now.unique_id == 'r-1'
+    reserve_now.action = 'ReserveNow'
+    validate_payload(reserve_now, '2.0.1')
+
+    assert (reset.unique_id, reset.error_code) == ('r-2', 'NotImplemented')
+
+
+def test_boot_resolves_when_the_connection_closes():
+    async def run():
+        websocket = FakeWebSocket()
+        charger = SimulatedCharger('E2507-0000-0001', websocket)
+        reader = asyncio.create_task(charger.run())
+
+        boot = asyncio.create_task(charger.boot('E2507', 'EurecomCharge'))
+        websocket.incoming.put_nowait(None)
+
+        await reader
+        return await boot, charger.boot_status
+
+    assert asyncio.run(run()) == (None, None)
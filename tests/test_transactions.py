@@ -0,0 +1,174 @@
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+from transactions import TransactionStore, _parse_timestamp
+
+
+def _event(
+    event_type: str,
+    seq_no: int,
+    trigger_reason: str,
+    transaction_id: str = 'tx-1',
+    meter_values: tuple[tuple[str, float], ...] = (),
+    **transaction_info
+) -> dict:
+    payload = {
+        'eventType': event_type,
+        'timestamp': f'2026-10-16T10:00:{seq_no:02}Z',
+        'triggerReason': trigger_reason,
+        'seqNo': seq_no,
+        'transactionInfo': {'transactionId': transaction_id, **transaction_info},
+    }
+
+    if meter_values:
+        payload['meterValue'] = [
+            {'timestamp': timestamp, 'sampledValue': [{'value': value}]} for timestamp, value in meter_values
+        ]
+
+    return payload
+
+
+@pytest.fixture
+def store(tmp_path) -> TransactionStore:
+    return TransactionStore(str(tmp_path / 'transactions.sqlite3'), keep_days=0)
+
+
+def _query(store: TransactionStore, query: str) -> list[tuple]:
+    connection = sqlite3.connect(store.path)
+
+    try:
+        return connection.execute(query).fetchall()
+    finally:
+        connection.close()
+
+
+def test_transactions_are_written_once_flushed(store):
+    store.record('E2507-0000-0001', _event('Started', 0, 'Authorized'))
+    store.record('E2507-0000-0001', _event('Updated', 1, 'ChargingStateChanged', chargingState='Charging'))
+    store.record('E2507-0000-0001', _event('Updated', 2, 'MeterValuePeriodic', meter_values=(
+        ('2026-10-16T10:00:02Z', 100.0), ('2026-10-16T10:00:03Z', 250.0)
+    )))
+    store.close()
+
+    rows = _query(
+        store, 'SELECT charger_id, transaction_id, seq_no, charging_state, meter_start, meter_stop, samples '
+               'FROM Transactions;'
+    )
+    assert rows == [('E2507-0000-0001', 'tx-1', 2, 'Charging', 100.0, 250.0, 2)]
+    assert _query(store, 'SELECT charger_id, transaction_id, value FROM MeterValues_20261016 ORDER BY timestamp;') == [
+        ('E2507-0000-0001', 'tx-1', 100.0), ('E2507-0000-0001', 'tx-1', 250.0)
+    ]
+
+
+def test_same_transaction_id_on_two_chargers_is_kept_apart(store):
+    store.record('E2507-0000-0001', _event('Started', 0, 'Authorized', meter_values=(('2026-10-16T10:00:00Z', 10),)))
+    store.record('E2507-0000-0002', _event('Started', 0, 'Authorized', meter_values=(('2026-10-16T10:00:00Z', 20),)))
+    store.close()
+
+    assert len(store.transactions) == 2
+    assert _query(store, 'SELECT charger_id, meter_start FROM Transactions ORDER BY charger_id;') == [
+        ('E2507-0000-0001', 10.0), ('E2507-0000-0002', 20.0)
+    ]
+
+
+def test_state_only_follows_newer_events(store):
+    store.record('E2507-0000-0001', _event('Updated', 5, 'ChargingStateChanged', chargingState='SuspendedEV'))
+    store.record('E2507-0000-0001', _event('Updated', 3, 'ChargingStateChanged', chargingState='Charging'))
+
+    transaction = store.transactions[('E2507-0000-0001', 'tx-1')]
+    assert (transaction.seq_no, transaction.charging_state) == (5, 'SuspendedEV')
+
+
+def test_ended_transactions_leave_memory_once_flushed(store):
+    store.record('E2507-0000-0001', _event('Started', 0, 'Authorized'))
+    store.record('E2507-0000-0001', _event('Ended', 1, 'EVDeparted', stoppedReason='Local'))
+    store.close()
+
+    assert store.transactions == {}
+    assert _query(store, 'SELECT ended_at, stopped_reason FROM Transactions;') == [('2026-10-16T10:00:01Z', 'Local')]
+
+
+def test_buffers_are_kept_when_the_store_cannot_be_opened(tmp_path):
+    store = TransactionStore(str(tmp_path / 'missing' / 'transactions.sqlite3'))
+    store.record('E2507-0000-0001', _event('Started', 0, 'Authorized', meter_values=(('2026-10-16T10:00:00Z', 1),)))
+
+    assert store.flush() is None
+    assert store.failed_flushes == 1
+
+    # Once the path works again, nothing was lost
+    (tmp_path / 'missing').mkdir()
+    store.close()
+
+    assert _query(store, 'SELECT COUNT(*) FROM MeterValues_20261016;') == [(1,)]
+    assert _query(store, 'SELECT COUNT(*) FROM Transactions;') == [(1,)]
+
+
+def test_missing_partitions_are_created_again(store):
+    store.record('E2507-0000-0001', _event('Started', 0, 'Authorized', meter_values=(('2026-10-16T10:00:00Z', 1),)))
+    store.close()
+
+    # A partition dropped behind the back of the store is created again by the next flush
+    connection = sqlite3.connect(store.path)
+    connection.execute('DROP TABLE MeterValues_20261016;')
+    connection.close()
+
+    store.record('E2507-0000-0001', _event('Updated', 1, 'MeterValuePeriodic', meter_values=(
+        ('2026-10-16T10:00:01Z', 2),
+    )))
+    store.close()
+
+    assert store.failed_flushes == 0
+    assert _query(store, 'SELECT value FROM MeterValues_20261016;') == [(2.0,)]
+
+
+def test_ended_transactions_are_kept_until_written(store):
+    store.record('E2507-0000-0001', _event('Started', 0, 'Authorized'))
+    store.close()
+
+    # The next write fails, until the table is created again
+    connection = sqlite3.connect(store.path)
+    connection.execute('ALTER TABLE Transactions RENAME TO TransactionsBackup;')
+    connection.close()
+
+    store.record('E2507-0000-0001', _event('Ended', 1, 'EVDeparted', meter_values=(('2026-10-16T10:00:01Z', 5),)))
+    store.close()
+
+    assert ('E2507-0000-0001', 'tx-1') in store.transactions
+
+    connection = sqlite3.connect(store.path)
+    connection.execute('ALTER TABLE TransactionsBackup RENAME TO Transactions;')
+    connection.close()
+
+    store.close()
+
+    assert store.transactions == {}
+    assert _query(store, 'SELECT seq_no, ended_at, samples FROM Transactions;') == [(1, '2026-10-16T10:00:01Z', 1)]
+    assert _query(store, 'SELECT value FROM MeterValues_20261016;') == [(5.0,)]
+
+
+def test_timestamps_ending_in_z_are_utc():
+    assert _parse_timestamp('2026-10-16T10:00:00Z') == datetime(2026, 10, 16, 10, tzinfo=timezone.utc)
+    assert _parse_timestamp('2026-10-16T12:00:00+02:00') == datetime(2026, 10, 16, 10, tzinfo=timezone.utc)
+
+
+def test_opening_the_store_backs_off_and_unwritten_samples_are_capped(tmp_path, monkeypatch):
+    store = TransactionStore(str(tmp_path / 'missing' / 'transactions.sqlite3'), max_buffered=1, max_unwritten=3)
+    opened = []
+    monkeypatch.setattr(store, '_create_schema', lambda: opened.append(1) or TransactionStore._create_schema(store))
+
+    for seq_no in range(5):
+        store.record('E2507-0000-0001', _event('Updated', seq_no, 'MeterValuePeriodic', meter_values=(
+            (f'2026-10-16T10:00:{seq_no:02}Z', seq_no),
+        )))
+
+    # Every record was over max_buffered, but the file was only tried once until retry_interval has passed
+    assert len(opened) == 1 and store.failed_flushes == 1
+    assert store.dropped_samples == 2
+
+    # Once the path works again, the newest samples are written
+    (tmp_path / 'missing').mkdir()
+    store.close()
+
+    assert _query(store, 'SELECT value FROM MeterValues_20261016 ORDER BY timestamp;') == [(2.0,), (3.0,), (4.0,)]